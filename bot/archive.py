@@ -0,0 +1,286 @@
+import logging
+import os
+import sqlite3
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import file_manager, ingest, manifest, parser
+from .config import load_int_setting
+
+# Архив прошлых недель: zip-файлы с документами и отдельная БД занятий
+ARCHIVE_DIR = Path(__file__).parent / "archive"
+ARCHIVE_DB_PATH = ARCHIVE_DIR / "archive.db"
+
+# Сколько недель, считая текущую, остаются в горячей БД при архивации на запуске;
+# 0 — не архивировать при запуске (по умолчанию), только кнопкой администратора
+ARCHIVE_KEEP_WEEKS = load_int_setting("ARCHIVE_KEEP_WEEKS", 0)
+
+LESSON_COLUMNS = "pair_number, time_slot, subject, teacher, room, teacher_norm, room_norm"
+
+
+def connect_archive() -> sqlite3.Connection:
+    ARCHIVE_DIR.mkdir(exist_ok=True)
+    return sqlite3.connect(ARCHIVE_DB_PATH, timeout=parser.DB_TIMEOUT)
+
+
+def init_archive_db() -> None:
+    conn = connect_archive()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            weekday TEXT,
+            schedule_date TEXT NOT NULL,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS groups (
+            id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL,
+            schedule_id INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS lessons (
+            id INTEGER PRIMARY KEY,
+            group_id INTEGER,
+            pair_number TEXT,
+            time_slot TEXT,
+            subject TEXT,
+            teacher TEXT,
+            room TEXT,
+            teacher_norm TEXT,
+            room_norm TEXT
+        );
+        CREATE TABLE IF NOT EXISTS archived_files (
+            name TEXT PRIMARY KEY,
+            date_label TEXT,
+            schedule_date TEXT NOT NULL,
+            size INTEGER,
+            content_hash TEXT,
+            archive TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_archive_schedules_date ON schedules(schedule_date);
+        CREATE INDEX IF NOT EXISTS idx_archive_groups_code ON groups(code, schedule_id);
+        CREATE INDEX IF NOT EXISTS idx_archive_lessons_group ON lessons(group_id);
+    """)
+    conn.commit()
+    conn.close()
+
+
+def week_archive_name(day: date) -> str:
+    week_start = day - timedelta(days=day.weekday())
+    return f"week_{week_start.isoformat()}.zip"
+
+
+def _append_to_zip(archive_path: Path, files: Dict[str, Path]) -> None:
+    """Добавить файлы в архив недели; одноимённые члены заменяются.
+
+    Архив собирается во временном файле и подменяется целиком, чтобы
+    прерванная запись не испортила уже заархивированные недели.
+    """
+    tmp = archive_path.with_suffix(".tmp")
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as target:
+        if archive_path.exists():
+            with zipfile.ZipFile(archive_path) as source:
+                for info in source.infolist():
+                    if info.filename not in files:
+                        target.writestr(info, source.read(info))
+        for member, path in files.items():
+            target.write(path, member)
+    os.replace(tmp, archive_path)
+
+
+def archive_files(before: date) -> int:
+    """Перенести файлы с датой расписания раньше before в zip-архивы по неделям"""
+    rows = manifest.list_before(before)
+    if not rows:
+        return 0
+
+    ARCHIVE_DIR.mkdir(exist_ok=True)
+    by_week: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        if (file_manager.SCHEDULE_FILES_DIR / row["path"]).exists():
+            by_week[week_archive_name(date.fromisoformat(row["schedule_date"]))].append(row)
+        else:
+            logging.warning(f"Архив: файл {row['name']} отсутствует, в архив попадёт только запись")
+
+    for archive_name, week_rows in by_week.items():
+        _append_to_zip(ARCHIVE_DIR / archive_name,
+                       {row["name"]: file_manager.SCHEDULE_FILES_DIR / row["path"] for row in week_rows})
+
+    archive_conn = connect_archive()
+    archive_conn.executemany(
+        """INSERT OR REPLACE INTO archived_files (name, date_label, schedule_date, size, content_hash, archive)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [(row["name"], row["date_label"], row["schedule_date"], row["size"], row["content_hash"],
+          week_archive_name(date.fromisoformat(row["schedule_date"]))) for row in rows],
+    )
+    archive_conn.commit()
+    archive_conn.close()
+
+    # Из горячей папки — только после того, как архив записан
+    for row in manifest.delete_before(before):
+        file_manager.remove_unreferenced(row["path"], row["content_hash"])
+    logging.info(f"Архив: перенесено файлов расписания {len(rows)}")
+    return len(rows)
+
+
+def _schedule_date(label: str, created_at: Optional[str]) -> Optional[date]:
+    reference = datetime.fromisoformat(created_at) if created_at else datetime.now()
+    return manifest.parse_schedule_date(label, reference)
+
+
+def _old_schedules(conn, before: date) -> List[Tuple[int, str, Optional[str], str, Optional[str]]]:
+    old = []
+    for schedule_id, label, weekday, created_at in conn.execute("SELECT id, date, weekday, created_at FROM schedules"):
+        day = _schedule_date(label, created_at)
+        if day is not None and day < before:
+            old.append((schedule_id, label, weekday, day.isoformat(), created_at))
+    return old
+
+
+def _copy_to_archive(conn: sqlite3.Connection, old) -> int:
+    """Скопировать даты old с группами и занятиями в присоединённую БД arc.
+
+    У архива свои ключи: id горячей БД после пересборки или в другом
+    поколении могут совпасть с id уже заархивированных недель. Ранее
+    заархивированная та же дата заменяется. Возвращает число занятий.
+    """
+    moved = 0
+    for schedule_id, label, weekday, schedule_date, created_at in old:
+        conn.execute("DELETE FROM arc.lessons WHERE group_id IN (SELECT g.id FROM arc.groups g "
+                     "JOIN arc.schedules s ON s.id = g.schedule_id WHERE s.schedule_date = ?)", (schedule_date,))
+        conn.execute("DELETE FROM arc.groups WHERE schedule_id IN "
+                     "(SELECT id FROM arc.schedules WHERE schedule_date = ?)", (schedule_date,))
+        conn.execute("DELETE FROM arc.schedules WHERE schedule_date = ?", (schedule_date,))
+        archived_schedule = conn.execute(
+            "INSERT INTO arc.schedules (date, weekday, schedule_date, created_at) VALUES (?, ?, ?, ?)",
+            (label, weekday, schedule_date, created_at),
+        ).lastrowid
+        for group_id, code in conn.execute("SELECT id, code FROM groups WHERE schedule_id = ?",
+                                           (schedule_id,)).fetchall():
+            archived_group = conn.execute("INSERT INTO arc.groups (code, schedule_id) VALUES (?, ?)",
+                                          (code, archived_schedule)).lastrowid
+            moved += conn.execute(f"INSERT INTO arc.lessons (group_id, {LESSON_COLUMNS}) "
+                                  f"SELECT ?, {LESSON_COLUMNS} FROM lessons WHERE group_id = ?",
+                                  (archived_group, group_id)).rowcount
+    return moved
+
+
+def archive_lessons(before: date, vacuum: bool = False) -> Tuple[int, int]:
+    """Перенести даты раньше before со всеми группами и занятиями в БД архива.
+
+    Перенос пишется в новое поколение расписания (vacuum — сжать его перед
+    публикацией), читатели до публикации видят прежние данные.
+    Возвращает (число дат, число занятий).
+    """
+    conn = parser.connect_schedule()
+    try:
+        if not _old_schedules(conn, before):
+            return 0, 0
+    finally:
+        conn.close()
+
+    with parser.publish_schedule() as conn:
+        # Под блокировкой публикации — даты могли измениться после проверки
+        old = _old_schedules(conn, before)
+        if not old:
+            return 0, 0
+        ids = [row[0] for row in old]
+        marks = ", ".join("?" * len(ids))
+        groups_of = f"SELECT id FROM groups WHERE schedule_id IN ({marks})"
+        conn.execute("ATTACH DATABASE ? AS arc", (str(ARCHIVE_DB_PATH),))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            moved = _copy_to_archive(conn, old)
+            conn.execute(f"DELETE FROM lessons WHERE group_id IN ({groups_of})", ids)
+            conn.execute(f"DELETE FROM groups WHERE schedule_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM schedules WHERE id IN ({marks})", ids)
+            parser.bump_data_version(conn.cursor())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE arc")
+        if vacuum:
+            # Освободить страницы удалённых строк — сжимается ещё не опубликованная копия
+            conn.execute("VACUUM")
+    # Иначе повторная загрузка документа архивной недели молча считалась бы дубликатом
+    forgotten = ingest.forget_ingested([row[1] for row in old])
+    logging.info(f"Архив: перенесено дат {len(old)}, занятий {moved}, забыто документов {forgotten}")
+    return len(old), moved
+
+
+def archive_old_weeks(today: Optional[datetime] = None, keep_weeks: int = 1, vacuum: bool = True) -> Dict[str, int]:
+    """Перенести в архив всё, что относится к неделям до последних keep_weeks.
+
+    Синхронная и долгая (VACUUM) — вызывается в executor. Версию расписания
+    после переноса дат поднимает вызывающий: слушатели версии живут в event loop.
+    """
+    init_archive_db()
+    week_start = file_manager.get_week_start(today or datetime.now()).date()
+    before = week_start - timedelta(weeks=max(1, keep_weeks) - 1)
+    files = archive_files(before)
+    schedules, lessons = archive_lessons(before, vacuum)
+    return {"files": files, "schedules": schedules, "lessons": lessons}
+
+
+def list_archived_dates(group_code: str) -> List[Tuple[str, str]]:
+    """Архивные даты группы: пары (ISO-дата, подпись даты), от новых к старым"""
+    if not ARCHIVE_DB_PATH.exists():
+        return []
+    conn = connect_archive()
+    rows = conn.execute("""
+        SELECT DISTINCT s.schedule_date, s.date
+        FROM groups g
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE g.code = ?
+        ORDER BY s.schedule_date DESC
+    """, (group_code,)).fetchall()
+    conn.close()
+    return [(row[0], row[1]) for row in rows]
+
+
+def get_archived_lessons(group_code: str, label: str) -> List[Dict[str, Any]]:
+    """Занятия группы на архивную дату (в формате get_lessons_for_group_on_date).
+
+    Подпись без года относится к самой поздней архивной дате с такой подписью.
+    """
+    if not ARCHIVE_DB_PATH.exists():
+        return []
+    conn = connect_archive()
+    rows = conn.execute("""
+        SELECT s.date, s.weekday, l.pair_number, l.time_slot, l.subject, l.teacher, l.room
+        FROM lessons l
+        JOIN groups g ON g.id = l.group_id
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE g.code = ? AND s.id = (
+            SELECT s2.id FROM schedules s2 JOIN groups g2 ON g2.schedule_id = s2.id
+            WHERE g2.code = ? AND (s2.date = ? OR s2.schedule_date = ?)
+            ORDER BY s2.schedule_date DESC LIMIT 1
+        )
+        ORDER BY l.time_slot
+    """, (group_code, group_code, label, label)).fetchall()
+    conn.close()
+    return [
+        {"date": row[0], "weekday": row[1], "pair": row[2], "time": row[3],
+         "subject": row[4], "teacher": row[5], "room": row[6]}
+        for row in rows
+    ]
+
+
+def read_archived_file(name: str) -> Optional[bytes]:
+    """Содержимое заархивированного документа по имени файла"""
+    if not ARCHIVE_DB_PATH.exists():
+        return None
+    conn = connect_archive()
+    row = conn.execute("SELECT archive FROM archived_files WHERE name = ?", (name,)).fetchone()
+    conn.close()
+    if row is None or not (ARCHIVE_DIR / row[0]).exists():
+        return None
+    with zipfile.ZipFile(ARCHIVE_DIR / row[0]) as archive:
+        return archive.read(name) if name in archive.namelist() else None
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Нагрузочный прогон хендлеров бота через настоящий Dispatcher
+
+Обновления (просмотр расписания, листание страниц, выбор даты и группы)
+подаются в dp.feed_update с подставной сессией Bot API на временной
+засеянной schedule.db. Печатает p50/p95/p99 времени обработки,
+пропускную способность и задержку event loop.
+
+Запуск: python -m bot.bench_handlers [--updates 5000] [--concurrency 100]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import SendMessage, EditMessageText
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from . import callbacks, parser, storage
+from .sample_tables import BENCH_SUBJECTS, make_table
+from .keyboards import join_keyboards, materialize_keyboards
+from .render import join_rendered, materialize_rendered
+from .subscriptions import init_subscriptions_db
+from .throttle import THROTTLED
+
+WEEKDAYS = ["ПОНЕДЕЛЬНИК", "ВТОРНИК", "СРЕДА", "ЧЕТВЕРГ", "ПЯТНИЦА", "СУББОТА"]
+
+# Доля каждого вида обновлений в утреннем трафике
+WORKLOAD = [
+    ("show_dates", 20),
+    ("date", 25),
+    ("group_on_date", 30),
+    ("dates_page", 5),
+    ("groups_page", 8),
+    ("group", 7),
+    ("back_to_dates", 5),
+]
+
+BOT_USER = User(id=42, is_bot=True, first_name="Расписание")
+
+
+class StubSession(BaseSession):
+    """Сессия Bot API без сети с необязательной задержкой ответа"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(message_id=1, date=datetime.now(), chat=Chat(id=method.chat_id or 0, type="private"),
+                           text=method.text)
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+def seed_database(db_path: Path, dates: int, groups: int) -> None:
+    """Засеять временную БД: dates дней по groups групп"""
+    parser.DB_PATH = db_path
+    codes = [f"К{100 + i}" for i in range(groups)]
+    tables = [
+        make_table(f"{day + 1} сентября {WEEKDAYS[day % len(WEEKDAYS)]}", codes, shift=day,
+                   pairs=4, subjects=BENCH_SUBJECTS)
+        for day in range(dates)
+    ]
+    # Парсер печатает каждую группу — в отчёте это лишнее
+    with contextlib.redirect_stdout(io.StringIO()):
+        storage.init_storage()
+        init_subscriptions_db()
+        storage.save_tables(tables)
+
+
+class UpdateFactory:
+    """Синтетические обновления по ID из засеянной БД"""
+
+    def __init__(self, seed: int = 1, users: int = 2000):
+        self.random = random.Random(seed)
+        self.users = users
+        self.update_id = 0
+        self.schedules = [schedule_id for schedule_id, _ in storage.list_schedules()]
+        self.group_ids = [group_id for group_id, _ in storage.list_group_ids()]
+        self.group_rows = [
+            group_id
+            for schedule_id in self.schedules
+            for group_id, _ in storage.list_groups_for_schedule(schedule_id)
+        ]
+        self.kinds = [kind for kind, _ in WORKLOAD]
+        self.weights = [weight for _, weight in WORKLOAD]
+
+    def _user(self) -> User:
+        user_id = 10_000 + self.random.randrange(self.users)
+        return User(id=user_id, is_bot=False, first_name="Студент")
+
+    def _message(self, user: User, text: str) -> Message:
+        return Message(message_id=self.update_id, date=datetime.now(),
+                       chat=Chat(id=user.id, type="private"), from_user=user, text=text)
+
+    def _callback(self, user: User, data: str) -> CallbackQuery:
+        message = Message(message_id=self.update_id, date=datetime.now(),
+                          chat=Chat(id=user.id, type="private"), from_user=BOT_USER, text="Выберите дату:")
+        return CallbackQuery(id=str(self.update_id), from_user=user, chat_instance="bench",
+                             message=message, data=data)
+
+    def make(self) -> Tuple[str, Update]:
+        self.update_id += 1
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        user = self._user()
+        if kind == "show_dates":
+            return kind, Update(update_id=self.update_id, message=self._message(user, "📅 Показать расписание"))
+        if kind == "date":
+            data = callbacks.pack(callbacks.DATE, self.random.choice(self.schedules))
+        elif kind == "group_on_date":
+            data = callbacks.pack(callbacks.GROUP_ON_DATE, self.random.choice(self.group_rows))
+        elif kind == "dates_page":
+            data = callbacks.pack(callbacks.DATES_PAGE, self.random.randrange(max(1, len(self.schedules) // 5)))
+        elif kind == "groups_page":
+            data = callbacks.pack(callbacks.GROUPS_PAGE, self.random.randrange(max(1, len(self.group_ids) // 8)))
+        elif kind == "group":
+            data = callbacks.pack(callbacks.GROUP, self.random.choice(self.group_ids))
+        else:
+            data = callbacks.pack(callbacks.BACK_TO_DATES)
+        return kind, Update(update_id=self.update_id, callback_query=self._callback(user, data))
+
+
+class LoopLagMonitor:
+    """Замеряет, насколько позже положенного просыпается event loop"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_load(updates: int = 5000, concurrency: int = 100, api_latency: float = 0.0,
+                   seed: int = 1, materialize: bool = True) -> Dict[str, float]:
+    """Прогнать updates обновлений не более чем по concurrency одновременно"""
+    from .main import build_dispatcher
+
+    if materialize:
+        storage.add_version_listener(materialize_rendered)
+        storage.add_version_listener(materialize_keyboards)
+        storage.bump_schedule_version()
+        await join_rendered()
+        await join_keyboards()
+
+    dp = build_dispatcher(MemoryStorage())
+    session = StubSession(api_latency)
+    bot = Bot(token="42:BENCH", session=session)
+    factory = UpdateFactory(seed)
+
+    latencies: List[float] = []
+    by_kind: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def feed(kind: str, update: Update) -> None:
+        try:
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            elapsed = time.perf_counter() - started
+            latencies.append(elapsed)
+            by_kind[kind].append(elapsed)
+        except Exception as e:
+            errors[f"{kind}: {type(e).__name__}"] += 1
+        finally:
+            slots.release()
+
+    throttled = THROTTLED.value("message") + THROTTLED.value("callback")
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    tasks = []
+    try:
+        for _ in range(updates):
+            await slots.acquire()
+            tasks.append(asyncio.create_task(feed(*factory.make())))
+        await asyncio.gather(*tasks)
+    finally:
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+        if materialize:
+            storage.remove_version_listener(materialize_rendered)
+            storage.remove_version_listener(materialize_keyboards)
+
+    report = {
+        "updates": updates,
+        "errors": sum(errors.values()),
+        "elapsed": elapsed,
+        "throughput": updates / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "loop_lag_p50_ms": percentile(monitor.samples, 50) * 1000,
+        "loop_lag_p99_ms": percentile(monitor.samples, 99) * 1000,
+        "loop_lag_max_ms": max(monitor.samples, default=0.0) * 1000,
+        "api_calls": sum(session.calls.values()),
+        "throttled": int(THROTTLED.value("message") + THROTTLED.value("callback") - throttled),
+    }
+    for kind, values in by_kind.items():
+        report[f"{kind}_p95_ms"] = percentile(values, 95) * 1000
+    for error, count in errors.items():
+        report[f"error {error}"] = count
+    return report
+
+
+def print_report(report: Dict[str, float]) -> None:
+    print(f"Обновлений: {report['updates']}, ошибок: {report['errors']}, вызовов API: {report['api_calls']}, "
+          f"ограничено частотой: {report['throttled']}")
+    print(f"Время: {report['elapsed']:.2f} с, пропускная способность: {report['throughput']:.0f} обновлений/с")
+    print(f"Обработка: p50 {report['p50_ms']:.2f} мс, p95 {report['p95_ms']:.2f} мс, p99 {report['p99_ms']:.2f} мс")
+    print(f"Задержка event loop: p50 {report['loop_lag_p50_ms']:.2f} мс, p99 {report['loop_lag_p99_ms']:.2f} мс, "
+          f"макс {report['loop_lag_max_ms']:.2f} мс")
+    for kind, _ in WORKLOAD:
+        key = f"{kind}_p95_ms"
+        if key in report:
+            print(f"  {kind:<15} p95 {report[key]:.2f} мс")
+    for key, value in report.items():
+        if key.startswith("error "):
+            print(f"  ⚠️ {key[6:]}: {value}")
+
+
+def main() -> None:
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--updates", type=int, default=5000)
+    args.add_argument("--concurrency", type=int, default=100)
+    args.add_argument("--dates", type=int, default=10)
+    args.add_argument("--groups", type=int, default=60)
+    args.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    args.add_argument("--cold", action="store_true", help="без готовых сообщений и клавиатур")
+    options = args.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_database(Path(tmp) / "schedule.db", options.dates, options.groups)
+        report = asyncio.run(run_load(options.updates, options.concurrency, options.api_latency,
+                                      materialize=not options.cold))
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
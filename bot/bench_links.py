@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Сравнение поиска ссылки на расписание: BeautifulSoup и однопроходный extract_links
+
+Запуск: python -m bot.bench_links [путь_к_странице.html]
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from .parser_site import extract_links
+
+FIXTURE = Path(__file__).parent / "fixtures" / "schedule_page.html"
+DAYS = [str(day) for day in range(1, 8)]
+
+
+def soup_find(html: str, text: str):
+    """Прежний способ: полное дерево html.parser на каждый поиск"""
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.find_all("a", href=True):
+        if a.get_text(strip=True) == text:
+            return a["href"]
+    return None
+
+
+def soup_week(html: str):
+    return [soup_find(html, day) for day in DAYS]
+
+
+def links_week(html: str):
+    """Новый способ: один разбор на версию страницы, дальше поиск по словарю"""
+    links = extract_links(html)
+    return [links.get(day) for day in DAYS]
+
+
+def bench(html: str, number: int = 50) -> None:
+    assert links_week(html) == soup_week(html)
+
+    soup_one = timeit.timeit(lambda: soup_find(html, "15"), number=number) / number
+    links_one = timeit.timeit(lambda: extract_links(html), number=number) / number
+    # Предзагрузка недели: прежде страница разбиралась заново на каждую дату
+    week_number = max(1, number // 5)
+    soup_all = timeit.timeit(lambda: soup_week(html), number=week_number) / week_number
+    links_all = timeit.timeit(lambda: links_week(html), number=number) / number
+
+    print(f"Страница: {len(html)} символов, ссылок: {len(extract_links(html))}")
+    print(f"Одна дата:   BeautifulSoup {soup_one * 1000:.2f} мс, extract_links {links_one * 1000:.2f} мс "
+          f"(x{soup_one / links_one:.1f})")
+    print(f"Неделя ({len(DAYS)}): BeautifulSoup {soup_all * 1000:.2f} мс, extract_links {links_all * 1000:.2f} мс "
+          f"(x{soup_all / links_all:.1f})")
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else FIXTURE
+    bench(path.read_text(encoding="utf-8"))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Сравнение записи повторной публикации расписания: удалить-и-вставить против диффа
+
+На засеянной временной БД (WAL) каждая дата публикуется заново с долей
+изменённых ячеек --change. Запись идёт прямо в текущее поколение
+расписания, без копии — сравнивается только сама запись. Для обоих способов печатает время на таблицу,
+число записанных строк занятий и прирост WAL.
+
+Запуск: python -m bot.bench_upsert [--dates 10] [--groups 60] [--change 0.05]
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from . import generations, parser
+from .bench_handlers import WEEKDAYS
+from .sample_tables import BENCH_SUBJECTS, make_table
+
+
+def legacy_save_table(table: List[List[str]]) -> int:
+    """Прежняя запись: занятия каждой группы удаляются и вставляются заново.
+
+    Возвращает число изменённых строк lessons.
+    """
+    date, weekday = parser.parse_date_from_row(table[0])
+    pairs = parser.parse_pairs_from_row(table[1])
+    times = parser.parse_times_from_row(table[2])
+    conn = parser.connect_schedule()
+    cur = conn.cursor()
+    written = 0
+    cur.execute("SELECT id FROM schedules WHERE date = ?", (date,))
+    schedule_id = cur.fetchone()[0]
+    for row in table[3:]:
+        group_data = parser.parse_group_row(row, pairs, times)
+        if not group_data:
+            continue
+        cur.execute("SELECT id FROM groups WHERE code = ? AND schedule_id = ?", (group_data['code'], schedule_id))
+        group_id = cur.fetchone()[0]
+        written += cur.execute("DELETE FROM lessons WHERE group_id = ?", (group_id,)).rowcount
+        for lesson in group_data['lessons']:
+            cur.execute("""
+                INSERT INTO lessons (group_id, pair_number, time_slot, subject, teacher, room, teacher_norm, room_norm)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (group_id, lesson['pair'], lesson['time'], lesson['subject'], lesson['teacher'], lesson['room'],
+                  parser.normalize_teacher(lesson['teacher']), parser.normalize_room(lesson['room'])))
+            written += 1
+    parser.bump_data_version(cur)
+    conn.commit()
+    conn.close()
+    return written
+
+
+def mutate(table: List[List[str]], share: float, rng: random.Random) -> List[List[str]]:
+    """Копия таблицы, в которой примерно share ячеек занятий заменены"""
+    result = [list(row) for row in table]
+    for row in result[3:]:
+        for i in range(1, len(row)):
+            if rng.random() < share:
+                subject, teacher, room = rng.choice(BENCH_SUBJECTS)
+                row[i] = f"{subject}\nпреп. {teacher}\nауд. {int(room) + rng.randrange(1, 50)}"
+    return result
+
+
+def seed(db_path: Path, dates: int, groups: int) -> List[List[List[str]]]:
+    parser.DB_PATH = db_path
+    codes = [f"К{100 + i}" for i in range(groups)]
+    tables = [
+        make_table(f"{day + 1} сентября {WEEKDAYS[day % len(WEEKDAYS)]}", codes, shift=day,
+                   pairs=4, subjects=BENCH_SUBJECTS)
+        for day in range(dates)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.init_db()
+        with parser.publish_schedule() as conn:
+            for table in tables:
+                parser.upsert_table(table, conn)
+    conn = parser.connect_schedule()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    return tables
+
+
+def _wal_size(db_path: Path) -> int:
+    wal = db_path.with_name(db_path.name + "-wal")
+    return wal.stat().st_size if wal.exists() else 0
+
+
+def run_bench(db_path: Path, tables: List[List[List[str]]], share: float = 0.05, seed_value: int = 1) -> Dict[str, Dict[str, float]]:
+    """Опубликовать все даты заново обоими способами; одинаковые правки для обоих"""
+    rng = random.Random(seed_value)
+    republished = [mutate(table, share, rng) for table in tables]
+    cells = sum(len(row) - 1 for table in tables for row in table[3:])
+    target = generations.ensure_generation(db_path)
+    # Открытое соединение не даёт SQLite удалить WAL при закрытии остальных
+    holder = sqlite3.connect(target)
+    report: Dict[str, Dict[str, float]] = {}
+    try:
+        for name in ("legacy", "diff"):
+            # Обе серии начинают с исходного содержимого
+            with contextlib.redirect_stdout(io.StringIO()):
+                for table in tables:
+                    parser.upsert_table(table, holder)
+            holder.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+            written = 0
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for table in republished:
+                    if name == "legacy":
+                        written += legacy_save_table(table)
+                    else:
+                        counts = parser.upsert_table(table, holder).counts()
+                        written += counts["inserted"] + counts["updated"] + counts["deleted"]
+            elapsed = time.perf_counter() - started
+            report[name] = {
+                "ms_per_table": elapsed / len(tables) * 1000,
+                "rows_written": written,
+                "wal_kb": _wal_size(target) / 1024,
+            }
+    finally:
+        holder.close()
+    report["cells"] = {"total": cells}
+    return report
+
+
+def print_report(report: Dict[str, Dict[str, float]]) -> None:
+    print(f"Ячеек занятий в публикации: {report['cells']['total']}")
+    for name, title in (("legacy", "Удалить и вставить"), ("diff", "Дифф по (группа, пара)")):
+        row = report[name]
+        print(f"  {title:<24} {row['ms_per_table']:7.2f} мс/таблица, "
+              f"строк записано {row['rows_written']:6d}, WAL {row['wal_kb']:8.1f} КБ")
+
+
+def main() -> None:
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("--dates", type=int, default=10)
+    args.add_argument("--groups", type=int, default=60)
+    args.add_argument("--change", type=float, default=0.05, help="доля изменённых ячеек")
+    options = args.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "schedule.db"
+        tables = seed(db_path, options.dates, options.groups)
+        report = run_bench(db_path, tables, options.change)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError
+
+from .config import load_int_setting
+from .render import RenderedSchedule
+from .subscriptions import claim_notification, get_subscribers, unsubscribe_chat
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду на чат
+BROADCAST_RATE = load_int_setting("BROADCAST_RATE", 25)
+BROADCAST_CONCURRENCY = load_int_setting("BROADCAST_CONCURRENCY", 20)
+PER_CHAT_INTERVAL = 1.0
+MAX_RETRIES = 3
+
+
+class RateLimiter:
+    """Общий для всех отправок token bucket с паузой по retry_after"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        self.rate = rate
+        # Небольшой запас на всплеск, чтобы в любом окне в 1 с не превысить лимит
+        self.capacity = burst or max(1.0, rate / 10)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = self.clock()
+                if now < self.paused_until:
+                    await self.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Допуск на погрешность float: иначе ожидание «ровно до жетона» может
+                # оставить 0.999… и свестись к бесконечно малым паузам
+                if self.tokens >= 1 - 1e-9:
+                    self.tokens = max(0.0, self.tokens - 1)
+                    return
+                await self.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Остановить все отправки: Telegram попросил подождать"""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0
+
+
+class Broadcaster:
+    """Рассылка сообщений множеству чатов с ограничением скорости и повторами"""
+
+    def __init__(self, bot: Bot, rate: float = BROADCAST_RATE, concurrency: int = BROADCAST_CONCURRENCY,
+                 per_chat_interval: float = PER_CHAT_INTERVAL, max_retries: int = MAX_RETRIES,
+                 limiter: Optional[RateLimiter] = None):
+        self.bot = bot
+        self.limiter = limiter or RateLimiter(rate)
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.metrics: Dict[str, float] = defaultdict(float)
+
+    async def _send(self, chat_id: int, text: str, stats: Dict[str, float]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+                stats["sent"] += 1
+                return True
+            except TelegramRetryAfter as e:
+                stats["retry_after"] += 1
+                self.limiter.pause(e.retry_after)
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота — подписки больше не нужны
+                stats["blocked"] += 1
+                unsubscribe_chat(chat_id)
+                return False
+            except TelegramBadRequest as e:
+                logging.warning(f"Рассылка: сообщение в {chat_id} отклонено: {e}")
+                break
+            except TelegramNetworkError as e:
+                logging.warning(f"Рассылка: сетевая ошибка для {chat_id}: {e}")
+                await asyncio.sleep(min(2 ** attempt, 10))
+            if attempt < self.max_retries:
+                stats["retries"] += 1
+        stats["failed"] += 1
+        return False
+
+    async def _worker(self, queue: "asyncio.Queue[Tuple[int, List[str]]]", stats: Dict[str, float]) -> None:
+        while True:
+            chat_id, texts = await queue.get()
+            try:
+                for i, text in enumerate(texts):
+                    if i:
+                        await asyncio.sleep(self.per_chat_interval)
+                    await self._send(chat_id, text, stats)
+            except Exception as e:
+                stats["failed"] += 1
+                logging.error(f"Рассылка: ошибка для {chat_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def send_many(self, messages: Iterable[Tuple[int, str]]) -> Dict[str, float]:
+        """Разослать пары (chat_id, текст). Возвращает статистику рассылки."""
+        by_chat: Dict[int, List[str]] = defaultdict(list)
+        for chat_id, text in messages:
+            by_chat[chat_id].append(text)
+
+        stats: Dict[str, float] = defaultdict(float)
+        stats["chats"] = len(by_chat)
+        if not by_chat:
+            return dict(stats)
+
+        started = time.monotonic()
+        queue: "asyncio.Queue[Tuple[int, List[str]]]" = asyncio.Queue()
+        for item in by_chat.items():
+            queue.put_nowait(item)
+
+        workers = [asyncio.create_task(self._worker(queue, stats)) for _ in range(min(self.concurrency, len(by_chat)))]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        stats["elapsed"] = time.monotonic() - started
+        for key, value in stats.items():
+            if key != "elapsed":
+                self.metrics[key] += value
+        self.metrics["broadcasts"] += 1
+        logging.info(
+            f"Рассылка: {int(stats['sent'])} отправлено, {int(stats['failed'])} ошибок, "
+            f"{int(stats['retry_after'])} ответов 429 за {stats['elapsed']:.1f} с"
+        )
+        return dict(stats)
+
+
+class ScheduleNotifier:
+    """Рассылает подписчикам изменившиеся после загрузки расписания"""
+
+    def __init__(self, broadcaster: Broadcaster):
+        self.broadcaster = broadcaster
+        self._last: Optional[Dict[Tuple[str, str], str]] = None
+        self._tasks: set = set()
+
+    def on_rendered(self, rendered: RenderedSchedule) -> None:
+        previous, self._last = self._last, rendered.by_group_date
+        # Первая версия после запуска — сравнивать не с чем
+        if previous is None:
+            return
+
+        changed = [key for key, text in rendered.by_group_date.items() if previous.get(key) != text]
+        if not changed:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # То же изменение видят все процессы бота — рассылает тот, кто занял его первым
+        if rendered.data_version is not None and not claim_notification(rendered.data_version):
+            return
+        task = loop.create_task(self.notify(changed, rendered.by_group_date))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def notify(self, changed: List[Tuple[str, str]], texts: Dict[Tuple[str, str], str]) -> Dict[str, float]:
+        by_group: Dict[str, List[str]] = defaultdict(list)
+        for group, date in changed:
+            by_group[group].append(f"🔔 <b>Расписание обновлено</b>\n\n{texts[(group, date)]}")
+
+        messages = [
+            (chat_id, text)
+            for chat_id, group in get_subscribers(list(by_group))
+            for text in by_group[group]
+        ]
+        return await self.broadcaster.send_many(messages)
+
+    async def join(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,72 @@
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from aiogram.types import CallbackQuery
+
+# Ограничение Telegram на длину callback_data в байтах
+MAX_CALLBACK_BYTES = 64
+
+SEPARATOR = ":"
+
+# Префиксы типов кнопок
+GROUPS_PAGE = "gp"
+GROUP = "g"
+DATES_PAGE = "dp"
+DATE = "d"
+GROUP_ON_DATE = "gd"
+BACK_TO_DATES = "bd"
+TEACHER = "t"
+SUBSCRIBE = "s"
+UNSUBSCRIBE = "u"
+ADMIN = "a"
+NOOP = "n"
+
+STALE_BUTTON = "⚠️ Кнопка устарела, откройте меню заново"
+
+CallbackHandler = Callable[..., Awaitable[None]]
+
+
+def pack(prefix: str, *args) -> str:
+    """Собрать callback_data из префикса и аргументов"""
+    data = SEPARATOR.join([prefix, *(str(arg) for arg in args)])
+    if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data!r}")
+    return data
+
+
+def unpack(data: str) -> Tuple[str, List[str]]:
+    """Разобрать callback_data на префикс и аргументы"""
+    prefix, *args = (data or "").split(SEPARATOR)
+    return prefix, args
+
+
+class CallbackRouter:
+    """Таблица диспетчеризации callback-запросов по префиксу.
+
+    Обработчик вызывается как handler(callback, *args), где args уже
+    приведены типами, указанными при регистрации.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, Tuple[CallbackHandler, Tuple[type, ...]]] = {}
+
+    def register(self, prefix: str, handler: CallbackHandler, *arg_types: type) -> None:
+        self._routes[prefix] = (handler, arg_types)
+
+    async def dispatch(self, callback: CallbackQuery) -> None:
+        prefix, raw_args = unpack(callback.data)
+        route = self._routes.get(prefix)
+        if route is None:
+            # noop и кнопки старого формата
+            await callback.answer()
+            return
+        handler, arg_types = route
+        try:
+            if len(raw_args) != len(arg_types):
+                raise ValueError(f"ожидалось аргументов: {len(arg_types)}")
+            args = [arg_type(raw) for arg_type, raw in zip(arg_types, raw_args)]
+        except ValueError as e:
+            logging.warning(f"Некорректный callback_data {callback.data!r}: {e}")
+            await callback.answer(STALE_BUTTON)
+            return
+        await handler(callback, *args)
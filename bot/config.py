@@ -15,3 +15,26 @@ def load_token() -> str:
     raise RuntimeError(
         "Не найден BOT_TOKEN. Добавьте .env (BOT_TOKEN=...)"
     )
+
+
+def load_setting(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Настройка из переменной окружения или из .env"""
+    value = os.getenv(name)
+    if value:
+        return value
+
+    env_path = Path(__file__).with_name(".env")
+    if env_path.exists():
+        for line in env_path.read_text(encoding="utf-8").splitlines():
+            if line.strip().startswith(f"{name}="):
+                return line.split("=", 1)[1].strip().strip('"\'')
+
+    return default
+
+
+def load_int_setting(name: str, default: int) -> int:
+    value = load_setting(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        return default
@@ -0,0 +1,27 @@
+"""Общие фикстуры для тестов бота"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "wordparsers"))
+
+from bot.sample_tables import make_table
+
+
+@pytest.fixture
+def schedule_db(tmp_path, monkeypatch):
+    """Временная БД расписания с двумя датами и тремя группами"""
+    from bot import parser, storage
+
+    db_path = tmp_path / "schedule.db"
+    monkeypatch.setattr(parser, "DB_PATH", db_path)
+
+    storage.init_storage()
+    storage.save_tables([
+        make_table("22 сентября ПОНЕДЕЛЬНИК", ["К101", "К102", "К103"]),
+        make_table("23 сентября ВТОРНИК", ["К101", "К102"], shift=1),
+    ])
+    return db_path
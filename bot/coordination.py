@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from .metrics import REGISTRY
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows: блокировка первого байта файла через msvcrt
+    fcntl = None
+    import msvcrt
+
+# Файлы межпроцессных блокировок (проверка сайта, разбор документов)
+LOCKS_DIR = Path(__file__).parent / "locks"
+
+# Как часто асинхронное ожидание пробует взять занятую блокировку, секунды
+LOCK_POLL_INTERVAL = 0.2
+
+# Проверка сайта и автозагрузка пишут в одни и те же файлы downloads/
+CHECK_LOCK = "schedule-check"
+
+OPERATIONS = REGISTRY.counter(
+    "bot_operations_total", "Операции проверки и загрузки расписания", ["operation", "event"])
+
+T = TypeVar("T")
+
+
+class FileLock:
+    """Межпроцессная блокировка на flock(2), в Windows — msvcrt.locking.
+
+    Исключает и другие процессы, и другие экземпляры FileLock в этом же
+    процессе. Синхронно — with (для процессов-воркеров), асинхронно —
+    async with (ожидание не блокирует event loop). Освобождается и при
+    падении процесса.
+    """
+
+    def __init__(self, name: str, directory: Optional[Path] = None, poll_interval: float = LOCK_POLL_INTERVAL):
+        self.path = (directory or LOCKS_DIR) / f"{name}.lock"
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._fd is not None:
+            raise RuntimeError(f"Блокировка {self.path.name} уже взята")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not self._lock(fd, blocking):
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def _lock(self, fd: int, blocking: bool) -> bool:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return False
+            return True
+        # LK_LOCK сдаётся через 10 секунд, поэтому ждём сами
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(self.poll_interval)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться блокировки; False, если не удалось за timeout секунд"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.acquire(blocking=False):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+        return True
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    async def __aenter__(self) -> "FileLock":
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class SingleFlight:
+    """Совмещение одинаковых операций.
+
+    Пока операция с ключом выполняется, новые вызовы с тем же ключом не
+    запускают свою, а ждут результат уже идущей. Отмена одного из ждущих
+    не отменяет общую операцию.
+    """
+
+    def __init__(self, name: str = "operation"):
+        self.name = name
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]], lock: Optional[str] = None) -> T:
+        """Выполнить factory() или дождаться такой же идущей операции.
+
+        lock — имя межпроцессной блокировки, под которой выполняется операция.
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            OPERATIONS.inc(1, self.name, "coalesced")
+            return await asyncio.shield(task)
+
+        task = asyncio.create_task(self._execute(factory, lock))
+        self._tasks[key] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if self._tasks.get(key) is done:
+                del self._tasks[key]
+
+        task.add_done_callback(forget)
+        OPERATIONS.inc(1, self.name, "started")
+        return await asyncio.shield(task)
+
+    async def _execute(self, factory: Callable[[], Awaitable[T]], lock: Optional[str]) -> T:
+        if lock is None:
+            return await factory()
+        file_lock = FileLock(lock)
+        if not file_lock.acquire(blocking=False):
+            OPERATIONS.inc(1, self.name, "lock_wait")
+            logging.info(f"{self.name}: блокировка {lock} занята другим процессом, ждём")
+            await file_lock.acquire_async()
+        try:
+            return await factory()
+        finally:
+            file_lock.release()
+
+    async def shutdown(self) -> None:
+        """Отменить идущие операции (бот останавливается)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
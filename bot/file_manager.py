@@ -3,13 +3,17 @@ import shutil
 import asyncio
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
-from .parser_site import download_schedule_by_link_text, admin_notify, bot_instance
+from . import manifest
+from .ingest import file_sha256
 
 # Путь к папке с файлами расписания
 SCHEDULE_FILES_DIR = Path(__file__).parent / "schedule_files"
 
+# Подпапка с содержимым файлов: одно содержимое хранится один раз, имя — его SHA-256
+BLOBS_DIR_NAME = "blobs"
+
 
 def init_schedule_files_dir() -> None:
     SCHEDULE_FILES_DIR.mkdir(exist_ok=True)
@@ -25,107 +29,104 @@ def get_week_end(date: datetime) -> datetime:
     return week_start + timedelta(days=6)
 
 
+def schedule_file_name(date_str: str) -> str:
+    safe_date = date_str.replace(" ", "_").lower()
+    return f"schedule_{safe_date}.docx"
+
+
+def _store_blob(file_path: Path, content_hash: str) -> Tuple[str, int]:
+    """Положить содержимое в хранилище блобов, если его там ещё нет"""
+    relative = f"{BLOBS_DIR_NAME}/{content_hash}.docx"
+    target = SCHEDULE_FILES_DIR / relative
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(".tmp")
+        shutil.copy2(file_path, tmp)
+        os.replace(tmp, target)
+    return relative, target.stat().st_size
+
+
+def remove_unreferenced(relative: str, content_hash: str) -> None:
+    """Удалить файл, на который больше не ссылается ни одна запись манифеста"""
+    if manifest.is_referenced(content_hash):
+        return
+    (SCHEDULE_FILES_DIR / relative).unlink(missing_ok=True)
+
+
 async def save_schedule_file(file_path: Path, date_str: str) -> Tuple[bool, str]:
     try:
         init_schedule_files_dir()
 
-        safe_date = date_str.replace(" ", "_").lower()
-        filename = f"schedule_{safe_date}.docx"
-        target_path = SCHEDULE_FILES_DIR / filename
-
+        filename = schedule_file_name(date_str)
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, shutil.copy2, file_path, target_path)
+        content_hash = await loop.run_in_executor(None, file_sha256, file_path)
+        relative, size = await loop.run_in_executor(None, _store_blob, file_path, content_hash)
 
-        logging.info(f"Файл расписания сохранен: {target_path}")
+        now = datetime.now()
+        schedule_date = manifest.parse_schedule_date(date_str, now) or now.date()
+        previous = manifest.record_file(filename, date_str, schedule_date, size, content_hash, relative, now)
+        if previous and previous != content_hash:
+            remove_unreferenced(f"{BLOBS_DIR_NAME}/{previous}.docx", previous)
+
+        logging.info(f"Файл расписания сохранен: {filename} ({content_hash[:12]})")
         return True, f"✅ Файл расписания сохранен как: {filename}"
 
     except Exception as e:
         logging.error(f"Ошибка при сохранении файла: {e}")
         return False, f"❌ Ошибка при сохранении файла: {e}"
 
-def get_schedule_files() -> List[Tuple[str, datetime]]:
 
-    try:
-        init_schedule_files_dir()
-        
-        files = []
-        for file_path in SCHEDULE_FILES_DIR.glob("schedule_*.docx"):
+def init_file_manifest() -> int:
+    """Создать манифест и перенести в хранилище блобов файлы, сохранённые до его появления.
+
+    Возвращает число файлов, добавленных в манифест.
+    """
+    init_schedule_files_dir()
+    manifest.init_manifest_db()
+    known = manifest.known_paths()
+    added = moved = 0
+    for file_path in SCHEDULE_FILES_DIR.glob("schedule_*.docx"):
+        path = known.get(file_path.name)
+        if path is not None and path != file_path.name:
+            # Файл с тем же именем загружен заново и лежит в блобах — старый только заслонял бы его
+            file_path.unlink(missing_ok=True)
+            continue
+        content_hash = file_sha256(file_path)
+        relative, size = _store_blob(file_path, content_hash)
+        if path is None:
             stat = file_path.stat()
-            create_time = datetime.fromtimestamp(stat.st_ctime)
-            files.append((file_path.name, create_time))
-        
-        files.sort(key=lambda x: x[1], reverse=True)
-        return files
-        
-    except Exception as e:
-        logging.error(f"Ошибка при получении списка файлов: {e}")
-        return []
-
-
-def cleanup_old_schedules() -> Tuple[int, str]:
-
-    try:
-        init_schedule_files_dir()
-        
-        current_week_start = get_week_start(datetime.now())
-        deleted_count = 0
-        
-        for file_path in SCHEDULE_FILES_DIR.glob("schedule_*.docx"):
-            stat = file_path.stat()
-            file_time = datetime.fromtimestamp(stat.st_ctime)
-            
-            if file_time < current_week_start:
-                file_path.unlink()
-                deleted_count += 1
-                logging.info(f"Удален старый файл: {file_path.name}")
-        
-        if deleted_count > 0:
-            message = f"🗑️ Удалено {deleted_count} старых файлов расписания"
+            stored_at = datetime.fromtimestamp(stat.st_mtime)
+            date_label = file_path.stem[len("schedule_"):].replace("_", " ")
+            schedule_date = manifest.parse_schedule_date(date_label, stored_at) or stored_at.date()
+            manifest.record_file(file_path.name, date_label, schedule_date, size, content_hash, relative, stored_at)
+            added += 1
         else:
-            message = "✅ Старых файлов не найдено"
-            
-        return deleted_count, message
-        
-    except Exception as e:
-        logging.error(f"Ошибка при очистке старых файлов: {e}")
-        return 0, f"❌ Ошибка при очистке: {e}"
+            manifest.move_file(file_path.name, relative)
+            moved += 1
+        file_path.unlink()
+    if added or moved:
+        logging.info(f"Файлы прежних версий перенесены в хранилище: {added} новых, {moved} из манифеста")
+    return added
 
 
-def get_schedule_file_for_date(date_str: str) -> Optional[Path]:
+def _stored_at(row: Dict) -> datetime:
+    return datetime.fromisoformat(row["stored_at"])
 
+
+def list_schedule_files(limit: Optional[int] = None) -> List[Dict]:
     try:
-        init_schedule_files_dir()
-        
-        safe_date = date_str.replace(" ", "_").lower()
-        filename = f"schedule_{safe_date}.docx"
-        file_path = SCHEDULE_FILES_DIR / filename
-        
-        if file_path.exists():
-            return file_path
-        else:
-            return None
-            
+        return manifest.list_files(limit)
     except Exception as e:
-        logging.error(f"Ошибка при поиске файла для даты {date_str}: {e}")
-        return None
+        logging.error(f"Ошибка при получении списка файлов: {e}")
+        return []
 
 
 def get_schedule_stats() -> dict:
 
     try:
-        files = get_schedule_files()
-        current_week_start = get_week_start(datetime.now())
-        
-        total_files = len(files)
-        current_week_files = sum(1 for _, create_time in files if create_time >= current_week_start)
-        old_files = total_files - current_week_files
-        
-        return {
-            "total_files": total_files,
-            "current_week_files": current_week_files,
-            "old_files": old_files,
-            "files": files[:5]
-        }
+        stats = manifest.get_stats(get_week_start(datetime.now()).date())
+        stats["files"] = [(row["name"], _stored_at(row)) for row in list_schedule_files(5)]
+        return stats
         
     except Exception as e:
         logging.error(f"Ошибка при получении статистики: {e}")
@@ -133,5 +134,8 @@ def get_schedule_stats() -> dict:
             "total_files": 0,
             "current_week_files": 0,
             "old_files": 0,
+            "total_size": 0,
+            "unique_files": 0,
+            "statuses": {},
             "files": []
         }
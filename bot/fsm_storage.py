@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from .config import load_int_setting
+
+# Общий для всех процессов-воркеров файл состояний диалогов
+FSM_DB_PATH = Path(__file__).with_name("fsm.db")
+
+# Сколько секунд хранится состояние после последнего изменения (чтения срок не продлевают)
+FSM_TTL_SECONDS = load_int_setting("FSM_TTL_SECONDS", 24 * 60 * 60)
+
+# Как часто накопленные изменения пишутся в БД, секунды
+FSM_FLUSH_INTERVAL = 0.05
+
+# Сколько изменений накапливать до внеочередной записи
+FSM_FLUSH_BATCH = 256
+
+# Как часто удалять просроченные записи, секунды
+FSM_CLEANUP_INTERVAL = 600
+
+_MISSING = object()
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM aiogram в SQLite (WAL) для нескольких процессов на одном хосте.
+
+    Изменения копятся в памяти и пишутся одной транзакцией раз в
+    flush_interval; чтения своего процесса сразу видят несохранённые
+    изменения, остальные процессы — после записи пачки. Чтения из БД идут
+    в executor через отдельное соединение: в WAL они не ждут пишущих.
+    """
+
+    def __init__(self, path: Path = FSM_DB_PATH, ttl: float = FSM_TTL_SECONDS,
+                 flush_interval: float = FSM_FLUSH_INTERVAL, flush_batch: int = FSM_FLUSH_BATCH,
+                 cleanup_interval: float = FSM_CLEANUP_INTERVAL, key_builder: Optional[KeyBuilder] = None):
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.cleanup_interval = cleanup_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.metrics: Dict[str, int] = defaultdict(int)
+        # key → [state, data]; _MISSING — поле не менялось
+        self._pending: Dict[str, list] = {}
+        # Пачка, которая сейчас пишется в БД
+        self._writing: Dict[str, list] = {}
+        self._flushing = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_fsm_expires ON fsm(expires_at);
+        """)
+        self._reader = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+
+    def _read(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT state, data FROM fsm WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    async def _load(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        self.metrics["reads"] += 1
+        return await asyncio.get_running_loop().run_in_executor(None, self._read, key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self._put(self.key_builder.build(key), state=value)
+
+    def _unsaved(self, key: str, field: int) -> Any:
+        for batch in (self._pending, self._writing):
+            entry = batch.get(key)
+            if entry is not None and entry[field] is not _MISSING:
+                return entry[field]
+        return _MISSING
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        name = self.key_builder.build(key)
+        state = self._unsaved(name, 0)
+        if state is not _MISSING:
+            return state
+        return (await self._load(name))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._put(self.key_builder.build(key), data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        name = self.key_builder.build(key)
+        data = self._unsaved(name, 1)
+        if data is not _MISSING:
+            return dict(data)
+        return dict((await self._load(name))[1])
+
+    def _put(self, key: str, state: Any = _MISSING, data: Any = _MISSING) -> None:
+        entry = self._pending.setdefault(key, [_MISSING, _MISSING])
+        if state is not _MISSING:
+            entry[0] = state
+        if data is not _MISSING:
+            entry[1] = data
+        self.metrics["writes"] += 1
+        if len(self._pending) >= self.flush_batch:
+            self._schedule_flush(0)
+        else:
+            self._schedule_flush(self.flush_interval)
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            # Идущая запись сама подхватит новые изменения
+            if delay or self._flushing:
+                return
+            self._flush_task.cancel()
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        self._flushing = True
+        try:
+            while self._pending:
+                await self.flush()
+        except Exception as e:
+            logging.error(f"FSM: ошибка записи состояний: {e}")
+        finally:
+            self._flushing = False
+
+    async def flush(self) -> int:
+        """Записать накопленные изменения одной транзакцией"""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        self._writing = batch
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, batch)
+        except Exception:
+            # Вернуть несохранённое, не затирая более новые изменения
+            for key, entry in batch.items():
+                newer = self._pending.setdefault(key, [_MISSING, _MISSING])
+                for i in range(2):
+                    if newer[i] is _MISSING:
+                        newer[i] = entry[i]
+            raise
+        finally:
+            self._writing = {}
+        return len(batch)
+
+    def _write(self, batch: Dict[str, list]) -> None:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE: чтение недостающих полей и запись — без гонки с другими процессами
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, (state, data) in batch.items():
+                    if state is _MISSING or data is _MISSING:
+                        # Поменялась только часть записи — вторую берём из БД
+                        row = self._conn.execute(
+                            "SELECT state, data FROM fsm WHERE key = ? AND expires_at > ?", (key, now)
+                        ).fetchone()
+                        if state is _MISSING:
+                            state = row[0] if row else None
+                        if data is _MISSING:
+                            data = json.loads(row[1]) if row and row[1] else {}
+                    if state is None and not data:
+                        self._conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+                        continue
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO fsm (key, state, data, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, state, json.dumps(data, ensure_ascii=False), now + self.ttl),
+                    )
+                if now - self._last_cleanup >= self.cleanup_interval:
+                    expired = self._conn.execute("DELETE FROM fsm WHERE expires_at <= ?", (now,)).rowcount
+                    self._last_cleanup = now
+                    self.metrics["expired"] += expired
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.metrics["flushes"] += 1
+        self.metrics["flushed"] += len(batch)
+
+    async def close(self) -> None:
+        task = self._flush_task
+        if task is not None and not task.done():
+            if not self._flushing:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"FSM: не удалось сохранить состояния при остановке: {e}")
+        with self._lock:
+            self._conn.close()
+        with self._read_lock:
+            self._reader.close()
@@ -0,0 +1,215 @@
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import load_int_setting
+from .coordination import FileLock
+
+# Данные расписания живут в поколениях — отдельных файлах БД рядом с schedule.db.
+# Запись идёт в копию текущего поколения, публикация — атомарная замена указателя.
+# В самой schedule.db остаются служебные таблицы (задания, манифест, подписки).
+
+# Сколько последних поколений хранить и сколько секунд после замены не трогать
+# предыдущее: читатели, открывшие его до публикации, дочитывают свой файл
+GENERATIONS_KEEP = load_int_setting("GENERATIONS_KEEP", 3)
+GENERATION_GRACE_SECONDS = load_int_setting("GENERATION_GRACE_SECONDS", 300)
+
+POINTER_NAME = "CURRENT"
+PUBLISH_LOCK = "publish"
+
+# Таблицы поколения; остальное в исходной schedule.db — служебные таблицы
+SCHEDULE_TABLES = {"schedules", "groups", "lessons", "schedule_meta"}
+
+# Указатель → путь поколения; перечитывается, только если файл указателя сменился
+_pointer_cache: Dict[Path, Tuple[Tuple[int, int], Path]] = {}
+
+
+def generations_dir(db_path: Path) -> Path:
+    return db_path.with_name(db_path.stem + ".generations")
+
+
+def generation_path(db_path: Path, number: int) -> Path:
+    return generations_dir(db_path) / f"gen-{number:06d}.db"
+
+
+def list_generations(db_path: Path) -> List[int]:
+    directory = generations_dir(db_path)
+    if not directory.exists():
+        return []
+    return sorted(int(path.stem[4:]) for path in directory.glob("gen-*.db") if path.stem[4:].isdigit())
+
+
+def current_number(db_path: Path) -> Optional[int]:
+    try:
+        return int((generations_dir(db_path) / POINTER_NAME).read_text(encoding="utf-8").strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def current_path(db_path: Path) -> Optional[Path]:
+    """Файл текущего поколения или None, если поколений ещё нет"""
+    pointer = generations_dir(db_path) / POINTER_NAME
+    try:
+        stat = pointer.stat()
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns)
+    cached = _pointer_cache.get(pointer)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    number = current_number(db_path)
+    if number is None:
+        return None
+    path = generation_path(db_path, number)
+    _pointer_cache[pointer] = (key, path)
+    return path
+
+
+def _set_current(db_path: Path, number: int) -> None:
+    pointer = generations_dir(db_path) / POINTER_NAME
+    tmp = pointer.with_name(POINTER_NAME + ".tmp")
+    tmp.write_text(str(number), encoding="utf-8")
+    os.replace(tmp, pointer)
+
+
+def _first_generation(db_path: Path) -> Path:
+    """Первое поколение — таблицы расписания из schedule.db (или пустая БД)"""
+    path = generation_path(db_path, 1)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp)
+    try:
+        if db_path.exists():
+            source = sqlite3.connect(db_path)
+            source.backup(conn)
+            source.close()
+            names = [name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+                " AND name NOT LIKE 'lessons_fts%'"
+            )]
+            for name in names:
+                if name not in SCHEDULE_TABLES:
+                    conn.execute(f'DROP TABLE "{name}"')
+            conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    _set_current(db_path, 1)
+    logging.info(f"Создано первое поколение расписания: {path.name}")
+    return path
+
+
+def ensure_generation(db_path: Path) -> Path:
+    """Текущее поколение; при первом запуске переносит в него расписание из schedule.db"""
+    path = current_path(db_path)
+    if path is not None:
+        return path
+    with FileLock(PUBLISH_LOCK):
+        return current_path(db_path) or _first_generation(db_path)
+
+
+def _data_version(conn: sqlite3.Connection) -> Optional[int]:
+    try:
+        row = conn.execute("SELECT value FROM schedule_meta WHERE key = 'data_version'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+@contextmanager
+def publish(db_path: Path, copy: bool = True) -> Iterator[sqlite3.Connection]:
+    """Новое поколение расписания.
+
+    Вызывающий пишет в соединение с копией текущего поколения (copy=False —
+    с пустым файлом). При выходе без исключения поколение публикуется, если
+    в нём изменился счётчик данных (или copy=False); иначе выбрасывается.
+    Публикации всех процессов идут по очереди.
+    """
+    with FileLock(PUBLISH_LOCK):
+        source = current_path(db_path) or _first_generation(db_path)
+        number = max(list_generations(db_path), default=0) + 1
+        target = generation_path(db_path, number)
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+
+        conn = sqlite3.connect(tmp)
+        try:
+            if copy:
+                reader = sqlite3.connect(source)
+                reader.backup(conn)
+                reader.close()
+            before = _data_version(conn) if copy else None
+            yield conn
+            conn.commit()
+            changed = not copy or _data_version(conn) != before
+        except BaseException:
+            conn.close()
+            tmp.unlink(missing_ok=True)
+            raise
+        conn.close()
+        if not changed:
+            tmp.unlink(missing_ok=True)
+            return
+
+        os.replace(tmp, target)
+        _set_current(db_path, number)
+        logging.info(f"Опубликовано поколение расписания {number}")
+        # Поколение уже опубликовано — сбой чистки не должен превращать публикацию в ошибку
+        try:
+            cleanup_generations(db_path)
+        except OSError as e:
+            logging.warning(f"Чистка поколений расписания не удалась: {e}")
+
+
+def _remove(path: Path) -> bool:
+    try:
+        path.unlink(missing_ok=True)
+    except OSError as e:
+        # В Windows открытый читателем файл не удалить — уберём при следующей чистке
+        logging.warning(f"Поколение {path.name} пока не удалить: {e}")
+        return False
+    return True
+
+
+def cleanup_generations(db_path: Path, keep: Optional[int] = None,
+                        grace: Optional[float] = None, now: Optional[float] = None) -> int:
+    """Удалить старые поколения: кроме последних keep и тех, что заменены меньше grace секунд назад"""
+    keep = GENERATIONS_KEEP if keep is None else keep
+    grace = GENERATION_GRACE_SECONDS if grace is None else grace
+    now = time.time() if now is None else now
+    current = current_number(db_path)
+    numbers = list_generations(db_path)
+    removed = 0
+    for number in numbers[:-max(1, keep)]:
+        if current is not None and number >= current:
+            continue
+        newer = [n for n in numbers if n > number]
+        replaced_at = generation_path(db_path, newer[0]).stat().st_mtime
+        if now - replaced_at < grace:
+            continue
+        if _remove(generation_path(db_path, number)):
+            removed += 1
+    # Недописанные копии от упавших публикаций (cleanup вызывается под блокировкой публикации)
+    for tmp in generations_dir(db_path).glob("gen-*.db.tmp"):
+        if now - tmp.stat().st_mtime >= grace:
+            _remove(tmp)
+    if removed:
+        logging.info(f"Удалено старых поколений расписания: {removed}")
+    return removed
+
+
+def get_generation_stats(db_path: Path) -> Dict[str, int]:
+    """Номер текущего поколения, число хранимых и их общий размер"""
+    numbers = list_generations(db_path)
+    size = 0
+    for number in numbers:
+        try:
+            size += generation_path(db_path, number).stat().st_size
+        except FileNotFoundError:  # удалено параллельной чисткой
+            pass
+    return {"current": current_number(db_path) or 0, "generations": len(numbers), "size": size}
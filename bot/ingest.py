@@ -0,0 +1,396 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from . import manifest, parser
+from .config import load_int_setting
+from .coordination import OPERATIONS, FileLock
+from .metrics import INGEST_SECONDS, PARSE_SECONDS, SAVE_TABLE_SECONDS
+from .storage import bump_schedule_version
+
+# Папка для временных файлов заданий (у каждого задания свой файл)
+INGEST_TMP_DIR = Path(__file__).parent / "ingest_tmp"
+
+# Сколько документов разбирается одновременно
+INGEST_CONCURRENCY = load_int_setting("INGEST_CONCURRENCY", 2)
+
+# Как часто главный процесс проверяет прогресс задания, секунды
+PROGRESS_INTERVAL = 1.0
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+
+def init_ingest_db() -> None:
+    conn = parser.connect()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL,
+            date_str TEXT,
+            chat_id INTEGER,
+            message_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress TEXT,
+            tables_count INTEGER,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status);
+        CREATE TABLE IF NOT EXISTS ingested_documents (
+            content_hash TEXT PRIMARY KEY,
+            date TEXT,
+            table_count INTEGER,
+            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    # Длительности этапов пишет воркер: его метрики живут в другом процессе
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+    if "timings" not in columns:
+        conn.execute("ALTER TABLE ingest_jobs ADD COLUMN timings TEXT")
+    # По хэшу содержимого статус разбора переносится в манифест файлов
+    if "content_hash" not in columns:
+        conn.execute("ALTER TABLE ingest_jobs ADD COLUMN content_hash TEXT")
+    # Сводка изменений (ChangeSet.counts по всем таблицам) в JSON
+    if "changes" not in columns:
+        conn.execute("ALTER TABLE ingest_jobs ADD COLUMN changes TEXT")
+    conn.commit()
+    conn.close()
+    manifest.init_manifest_db()
+
+
+def new_job_path() -> Path:
+    """Уникальный путь для файла нового задания"""
+    INGEST_TMP_DIR.mkdir(exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="job_", suffix=".docx", dir=INGEST_TMP_DIR)
+    os.close(fd)
+    return Path(path)
+
+
+def stage_file(file_path: Path) -> Path:
+    """Скопировать файл во временный файл нового задания"""
+    job_path = new_job_path()
+    shutil.copy2(file_path, job_path)
+    return job_path
+
+
+def file_sha256(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_ingested(content_hash: str) -> Optional[Dict]:
+    """Запись об уже загруженном документе с таким содержимым"""
+    conn = parser.connect()
+    conn.row_factory = parser.sqlite3.Row
+    row = conn.execute("SELECT * FROM ingested_documents WHERE content_hash = ?", (content_hash,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def record_ingested(content_hash: str, date: Optional[str], table_count: int) -> None:
+    conn = parser.connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO ingested_documents (content_hash, date, table_count) VALUES (?, ?, ?)",
+        (content_hash, date, table_count),
+    )
+    conn.commit()
+    conn.close()
+
+
+def forget_ingested(dates: List[str]) -> int:
+    """Забыть документы, в которых есть эти даты: после переноса дат в архив
+    повторная загрузка такого документа должна разобрать его заново"""
+    wanted = set(dates)
+    conn = parser.connect()
+    hashes = [
+        (content_hash,) for content_hash, labels in conn.execute("SELECT content_hash, date FROM ingested_documents")
+        if labels and wanted.intersection(labels.split(", "))
+    ]
+    conn.executemany("DELETE FROM ingested_documents WHERE content_hash = ?", hashes)
+    conn.commit()
+    conn.close()
+    return len(hashes)
+
+
+def duplicate_message(doc: Dict) -> str:
+    return (
+        f"♻️ Этот документ уже загружен {doc['ingested_at']} "
+        f"({doc['date'] or 'дата не указана'}, таблиц: {doc['table_count']}). Изменений нет."
+    )
+
+
+def _update_job(job_id: int, **fields) -> None:
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    conn = parser.connect()
+    conn.execute(
+        f"UPDATE ingest_jobs SET {columns}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (*fields.values(), job_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_job(job_id: int) -> Optional[Dict]:
+    conn = parser.connect()
+    conn.row_factory = parser.sqlite3.Row
+    row = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def run_ingest_job(job_id: int, db_path: str) -> int:
+    """Разбор документа и запись в БД. Выполняется в процессе-воркере."""
+    parser.DB_PATH = Path(db_path)
+
+    job = get_job(job_id)
+    if job is None:
+        raise RuntimeError(f"Задание {job_id} не найдено")
+
+    content_hash = file_sha256(Path(job["file_path"]))
+    # Один документ разбирает один процесс; остальные дождутся и увидят его в ingested_documents.
+    # Блокировки по первым двум символам хэша — не больше 256 файлов
+    with FileLock(f"ingest-{content_hash[:2]}"):
+        return _run_locked_job(job_id, job, content_hash)
+
+
+def _run_locked_job(job_id: int, job: Dict, content_hash: str) -> int:
+    # Повторная проверка: такой же документ мог загрузиться параллельно
+    existing = find_ingested(content_hash)
+    if existing is not None:
+        _update_job(job_id, status="duplicate", tables_count=0, progress=duplicate_message(existing))
+        manifest.set_ingest_status(content_hash, "done")
+        return 0
+
+    _update_job(job_id, status="running", progress="🔄 Парсирую расписание...")
+    manifest.set_ingest_status(content_hash, "running")
+    started = time.perf_counter()
+    with parser.WordParser(job["file_path"]) as doc:
+        tables = doc.get_tables()
+    timings = {"parse": time.perf_counter() - started, "save": []}
+
+    count = 0
+    dates = []
+    changes: Dict[str, int] = {}
+    # Все таблицы документа — одно поколение: читатели увидят документ целиком или не увидят вовсе
+    with parser.publish_schedule() as conn:
+        for i, table in enumerate(tables, 1):
+            _update_job(job_id, progress=f"🔄 Обрабатываю таблицу {i}/{len(tables)}...")
+            started = time.perf_counter()
+            change_set = parser.upsert_table(table, conn)
+            timings["save"].append(time.perf_counter() - started)
+            if change_set is not None:
+                count += 1
+                for name, value in change_set.counts().items():
+                    changes[name] = changes.get(name, 0) + value
+                if change_set.date not in dates:
+                    dates.append(change_set.date)
+
+    if count:
+        record_ingested(content_hash, ", ".join(dates), count)
+    _update_job(job_id, status="done", tables_count=count, timings=json.dumps(timings),
+                changes=json.dumps(changes), progress=f"✅ Загружено и обработано {count} таблиц!")
+    manifest.set_ingest_status(content_hash, "done")
+    return count
+
+
+def job_changed(job: Optional[Dict]) -> bool:
+    """Изменило ли задание расписание (без сводки — считаем, что да)"""
+    if not job or not job.get("tables_count"):
+        return False
+    if not job.get("changes"):
+        return True
+    return any(value for name, value in json.loads(job["changes"]).items() if name != "unchanged")
+
+
+def observe_job_timings(job: Optional[Dict]) -> None:
+    """Перенести длительности этапов задания из БД в метрики процесса"""
+    if not job or not job.get("timings"):
+        return
+    timings = json.loads(job["timings"])
+    PARSE_SECONDS.observe(timings["parse"])
+    for seconds in timings["save"]:
+        SAVE_TABLE_SECONDS.observe(seconds)
+
+
+class IngestQueue:
+    """Очередь заданий на разбор расписания с процессами-воркерами"""
+
+    def __init__(self, concurrency: int = INGEST_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # Идущие задания по хэшу содержимого и все, кто ждёт их прогресс
+        self._by_hash: Dict[str, int] = {}
+        self._listeners: Dict[int, List[ProgressCallback]] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.concurrency)
+        return self._executor
+
+    async def submit(self, file_path: Path, date_str: str, progress: ProgressCallback,
+                     chat_id: Optional[int] = None, message_id: Optional[int] = None) -> Optional[int]:
+        """Поставить документ в очередь. Файл переходит во владение задания.
+
+        Если документ с таким содержимым уже загружен, разбор не выполняется
+        и возвращается None. Если он сейчас разбирается, новое задание не
+        создаётся: progress подключается к идущему, возвращается его id.
+        """
+        loop = asyncio.get_running_loop()
+        content_hash = await loop.run_in_executor(None, file_sha256, file_path)
+        existing = find_ingested(content_hash)
+        if existing is not None:
+            logging.info(f"Документ {content_hash[:12]} уже загружен, пропускаем разбор")
+            manifest.set_ingest_status(content_hash, "done")
+            file_path.unlink(missing_ok=True)
+            await self._report(progress, duplicate_message(existing))
+            return None
+
+        running = self._by_hash.get(content_hash)
+        if running is not None:
+            logging.info(f"Документ {content_hash[:12]} уже в задании {running}, подключаемся к нему")
+            OPERATIONS.inc(1, "ingest", "coalesced")
+            file_path.unlink(missing_ok=True)
+            self._listeners[running].append(progress)
+            await self._report(progress, "⏳ Этот документ уже обрабатывается, показываю его прогресс...")
+            return running
+
+        conn = parser.connect()
+        cur = conn.execute(
+            "INSERT INTO ingest_jobs (file_path, date_str, chat_id, message_id, progress, content_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (str(file_path), date_str, chat_id, message_id, "🕐 В очереди на обработку...", content_hash),
+        )
+        job_id = cur.lastrowid
+        conn.commit()
+        conn.close()
+        manifest.set_ingest_status(content_hash, "queued")
+        OPERATIONS.inc(1, "ingest", "started")
+
+        self._start(job_id, progress, content_hash)
+        await self._report(progress, "🕐 В очереди на обработку...")
+        return job_id
+
+    def _start(self, job_id: int, progress: ProgressCallback, content_hash: Optional[str] = None) -> None:
+        self._listeners[job_id] = [progress]
+        if content_hash:
+            self._by_hash[content_hash] = job_id
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+
+        def finished(_) -> None:
+            self._tasks.pop(job_id, None)
+            self._listeners.pop(job_id, None)
+            if content_hash and self._by_hash.get(content_hash) == job_id:
+                del self._by_hash[content_hash]
+
+        task.add_done_callback(finished)
+
+    async def resume(self, make_progress: Callable[[Dict], ProgressCallback]) -> int:
+        """Перезапустить задания, не завершённые до остановки бота"""
+        conn = parser.connect()
+        conn.row_factory = parser.sqlite3.Row
+        rows = [dict(r) for r in conn.execute(
+            "SELECT * FROM ingest_jobs WHERE status IN ('queued', 'running') ORDER BY id"
+        )]
+        conn.close()
+
+        resumed = 0
+        for job in rows:
+            if not Path(job["file_path"]).exists():
+                _update_job(job["id"], status="failed", error="файл задания потерян")
+                continue
+            _update_job(job["id"], status="queued")
+            self._start(job["id"], make_progress(job), job.get("content_hash"))
+            resumed += 1
+        if resumed:
+            logging.info(f"Возобновлено заданий на разбор: {resumed}")
+        return resumed
+
+    async def _run(self, job_id: int) -> None:
+        async with self._semaphore:
+            job = get_job(job_id)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._get_executor(), run_ingest_job, job_id, str(parser.DB_PATH))
+            last_progress = None
+            finished = False
+            started = time.perf_counter()
+            try:
+                while True:
+                    done, _ = await asyncio.wait({future}, timeout=PROGRESS_INTERVAL)
+                    current = (get_job(job_id) or {}).get("progress")
+                    if current and current != last_progress:
+                        last_progress = current
+                        await self._report_all(job_id, current)
+                    if done:
+                        break
+                count = future.result()
+                finished_job = get_job(job_id) or {}
+                # Повторная публикация без правок не будит слушателей версии
+                if job_changed(finished_job):
+                    bump_schedule_version()
+                observe_job_timings(finished_job)
+                INGEST_SECONDS.observe(time.perf_counter() - started, finished_job.get("status") or "done")
+                logging.info(f"Задание {job_id}: обработано таблиц {count}")
+                finished = True
+            except asyncio.CancelledError:
+                # Бот останавливается: файл остаётся, задание возобновится при запуске
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка в задании {job_id}: {e}")
+                _update_job(job_id, status="failed", error=str(e))
+                if job and job.get("content_hash"):
+                    manifest.set_ingest_status(job["content_hash"], "failed")
+                INGEST_SECONDS.observe(time.perf_counter() - started, "failed")
+                await self._report_all(job_id, f"⚠️ Файл сохранен, но ошибка при парсинге: {e}")
+                finished = True
+            finally:
+                path = Path(job["file_path"]) if job else None
+                if finished and path is not None and path.exists():
+                    path.unlink()
+
+    async def _report_all(self, job_id: int, text: str) -> None:
+        for progress in list(self._listeners.get(job_id, ())):
+            await self._report(progress, text)
+
+    @staticmethod
+    async def _report(progress: ProgressCallback, text: str) -> None:
+        try:
+            await progress(text)
+        except Exception as e:
+            logging.warning(f"Не удалось обновить прогресс: {e}")
+
+    async def wait(self, job_id: int) -> bool:
+        """Дождаться задания; True, если документ загружен в БД (или уже был загружен)"""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.wait({task})
+        job = get_job(job_id)
+        return job is not None and job["status"] in ("done", "duplicate")
+
+    async def join(self) -> None:
+        """Дождаться завершения всех текущих заданий"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
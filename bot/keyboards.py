@@ -1,9 +1,13 @@
+import asyncio
+import logging
+from typing import Optional
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from .storage import list_groups
+from .callbacks import pack, GROUPS_PAGE, GROUP, DATES_PAGE, DATE, GROUP_ON_DATE, BACK_TO_DATES, TEACHER, SUBSCRIBE, UNSUBSCRIBE, ADMIN, NOOP
+from .storage import list_group_ids, list_schedules, list_groups_for_schedule, list_group_dates, get_schedule_version
 from .admin_auth import is_admin
-from .parser_site import download_schedule_by_link_text, admin_notify, bot_instance
 
 
 def get_main_menu(user_id: int = None) -> ReplyKeyboardMarkup:
@@ -42,16 +46,26 @@ ADMIN_MENU = ReplyKeyboardMarkup(
 )
 
 
-def groups_keyboard(page: int = 0, per_page: int = 8) -> InlineKeyboardMarkup:
+GROUPS_PER_PAGE = 8
+DATES_PER_PAGE = 5
+
+
+def groups_keyboard(page: int = 0, per_page: int = GROUPS_PER_PAGE) -> InlineKeyboardMarkup:
+    keyboards = current_keyboards()
+    if keyboards is not None and per_page == GROUPS_PER_PAGE and page in keyboards.groups_pages:
+        return keyboards.groups_pages[page]
+    return build_groups_keyboard(list_group_ids(), page, per_page)
+
+
+def build_groups_keyboard(all_groups: list[tuple[int, str]], page: int = 0, per_page: int = GROUPS_PER_PAGE) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
-    all_groups = list_groups()
     start = page * per_page
     names = all_groups[start:start + per_page]
 
-    for name in names:
+    for group_id, name in names:
         label = f"🧩 {name}"
-        builder.button(text=label, callback_data=f"group:{name}")
+        builder.button(text=label, callback_data=pack(GROUP, group_id))
     builder.adjust(2)
 
     total = len(all_groups)
@@ -60,9 +74,9 @@ def groups_keyboard(page: int = 0, per_page: int = 8) -> InlineKeyboardMarkup:
     next_page = (page + 1) % pages
 
     nav = [
-        InlineKeyboardButton(text="⬅️ Назад", callback_data=f"groups:page:{prev_page}"),
-        InlineKeyboardButton(text=f"Стр. {page+1}/{pages}", callback_data="noop"),
-        InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"groups:page:{next_page}"),
+        InlineKeyboardButton(text="⬅️ Назад", callback_data=pack(GROUPS_PAGE, prev_page)),
+        InlineKeyboardButton(text=f"Стр. {page+1}/{pages}", callback_data=pack(NOOP)),
+        InlineKeyboardButton(text="Вперёд ➡️", callback_data=pack(GROUPS_PAGE, next_page)),
     ]
 
     builder.row(*nav)
@@ -73,52 +87,200 @@ def schedule_management_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     builder.row(
-        InlineKeyboardButton(text="📅 Просмотр дат", callback_data="admin:view_dates"),
-        InlineKeyboardButton(text="🗑️ Очистить старые", callback_data="admin:cleanup_old")
+        InlineKeyboardButton(text="📅 Просмотр дат", callback_data=pack(ADMIN, "view_dates")),
+        InlineKeyboardButton(text="🗄 В архив старые недели", callback_data=pack(ADMIN, "archive_old"))
     )
     
     builder.row(
-        InlineKeyboardButton(text="📊 Статистика", callback_data="admin:stats"),
-        InlineKeyboardButton(text="🔄 Перезагрузить БД", callback_data="admin:reload_db")
+        InlineKeyboardButton(text="📊 Статистика", callback_data=pack(ADMIN, "stats")),
+        InlineKeyboardButton(text="🔄 Перезагрузить БД", callback_data=pack(ADMIN, "reload_db"))
     )
     
     builder.row(
-        InlineKeyboardButton(text="🔙 Назад", callback_data="admin:back")
+        InlineKeyboardButton(text="🔙 Назад", callback_data=pack(ADMIN, "back"))
     )   
     
     return builder.as_markup()
 
 
-def dates_keyboard(dates: list[str], selected: str = None, page: int = 0, per_page: int = 5) -> InlineKeyboardMarkup:
+def dates_keyboard(schedules: list[tuple[int, str]], selected: str = None, page: int = 0, per_page: int = DATES_PER_PAGE) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    total_pages = (len(dates) + per_page - 1) // per_page
+    total_pages = (len(schedules) + per_page - 1) // per_page
     start = page * per_page
-    end = min(start + per_page, len(dates))
+    end = min(start + per_page, len(schedules))
     for i in range(start, end, 2):
         row = []
         for j in range(2):
             idx = i + j
             if idx < end:
-                date = dates[idx]
+                schedule_id, date = schedules[idx]
                 text = f"📅 {date}"
                 if selected and date == selected:
                     text = f"✅ {date}"
-                row.append(InlineKeyboardButton(text=text, callback_data=f"date:{date}"))
+                row.append(InlineKeyboardButton(text=text, callback_data=pack(DATE, schedule_id)))
         builder.row(*row)
     nav = []
     if total_pages > 1:
         if page > 0:
-            nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"dates_page:{page-1}"))
-        nav.append(InlineKeyboardButton(text=f"Стр. {page+1}/{total_pages}", callback_data="noop"))
+            nav.append(InlineKeyboardButton(text="⬅️", callback_data=pack(DATES_PAGE, page - 1)))
+        nav.append(InlineKeyboardButton(text=f"Стр. {page+1}/{total_pages}", callback_data=pack(NOOP)))
         if page < total_pages - 1:
-            nav.append(InlineKeyboardButton(text="➡️", callback_data=f"dates_page:{page+1}"))
+            nav.append(InlineKeyboardButton(text="➡️", callback_data=pack(DATES_PAGE, page + 1)))
         builder.row(*nav)
     return builder.as_markup()
 
-def groups_for_date_keyboard(groups: list[str], date: str) -> InlineKeyboardMarkup:
+
+def groups_for_date_keyboard(groups: list[tuple[int, str]]) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
-    for group in groups:
-        builder.button(text=f"🧩 {group}", callback_data=f"group_on_date:{date}:{group}")
+    for group_id, group in groups:
+        builder.button(text=f"🧩 {group}", callback_data=pack(GROUP_ON_DATE, group_id))
     builder.adjust(2)
-    builder.row(InlineKeyboardButton(text="🔙 К датам", callback_data="back_to_dates"))
+    builder.row(InlineKeyboardButton(text="🔙 К датам", callback_data=pack(BACK_TO_DATES)))
+    return builder.as_markup()
+
+
+def subscription_keyboard(group_id: int, subscribed: bool) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    if subscribed:
+        builder.button(text="🔕 Отписаться от обновлений", callback_data=pack(UNSUBSCRIBE, group_id))
+    else:
+        builder.button(text="🔔 Подписаться на обновления", callback_data=pack(SUBSCRIBE, group_id))
+    return builder.as_markup()
+
+
+def teachers_keyboard(teachers: list[tuple[int, str]]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for lesson_id, teacher in teachers:
+        builder.button(text=f"👨‍🏫 {teacher}", callback_data=pack(TEACHER, lesson_id))
+    builder.adjust(1)
     return builder.as_markup()
+
+
+def group_on_date_nav_keyboard(group_dates: list[tuple[int, str]], group_id: int) -> InlineKeyboardMarkup:
+    """Навигация по соседним датам, на которые у группы есть занятия"""
+    ids = [gid for gid, _ in group_dates]
+    idx = ids.index(group_id) if group_id in ids else 0
+    prev_id = ids[idx-1] if idx > 0 else None
+    next_id = ids[idx+1] if idx < len(ids)-1 else None
+    nav = []
+    if prev_id:
+        nav.append(InlineKeyboardButton(text="⬅️ Пред. дата", callback_data=pack(GROUP_ON_DATE, prev_id)))
+    nav.append(InlineKeyboardButton(text="🔙 К датам", callback_data=pack(BACK_TO_DATES)))
+    if next_id:
+        nav.append(InlineKeyboardButton(text="След. дата ➡️", callback_data=pack(GROUP_ON_DATE, next_id)))
+    return InlineKeyboardMarkup(inline_keyboard=[nav])
+
+
+class KeyboardSet:
+    """Готовые inline-клавиатуры для одной версии расписания"""
+
+    def __init__(self, version: int, groups_pages: dict, dates_pages: dict, date_groups: dict, group_date_nav: dict):
+        self.version = version
+        self.groups_pages = groups_pages
+        self.dates_pages = dates_pages
+        self.date_groups = date_groups
+        self.group_date_nav = group_date_nav
+
+
+_keyboards = KeyboardSet(-1, {}, {}, {}, {})
+
+# Фоновая сборка клавиатур: последняя запрошенная версия и задача, которая её собирает
+_pending_version: Optional[int] = None
+_build_task: Optional[asyncio.Task] = None
+
+
+def build_keyboards(version: int) -> KeyboardSet:
+    """Построить все страницы клавиатур по текущему расписанию"""
+    groups = list_group_ids()
+    groups_pages = {
+        page: build_groups_keyboard(groups, page)
+        for page in range(max(1, (len(groups) + GROUPS_PER_PAGE - 1) // GROUPS_PER_PAGE))
+    }
+
+    schedules = list_schedules()
+    dates_pages = {
+        page: dates_keyboard(schedules, page=page)
+        for page in range(max(1, (len(schedules) + DATES_PER_PAGE - 1) // DATES_PER_PAGE))
+    }
+
+    date_groups = {}
+    for schedule_id, _ in schedules:
+        groups_on_date = list_groups_for_schedule(schedule_id)
+        if groups_on_date:
+            date_groups[schedule_id] = groups_for_date_keyboard(groups_on_date)
+
+    group_date_nav = {}
+    for _, code in groups:
+        group_dates = list_group_dates(code)
+        for group_id, _ in group_dates:
+            group_date_nav[group_id] = group_on_date_nav_keyboard(group_dates, group_id)
+
+    return KeyboardSet(version, groups_pages, dates_pages, date_groups, group_date_nav)
+
+
+def materialize_keyboards(version: int) -> None:
+    """Обработчик смены версии: пересобрать клавиатуры.
+
+    В работающем цикле событий сборка идёт в пуле потоков, а до её окончания
+    current_keyboards() отдаёт None и клавиатуры строятся по запросу.
+    """
+    global _keyboards, _pending_version, _build_task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _keyboards = build_keyboards(version)
+        return
+    _pending_version = version
+    if _build_task is None or _build_task.done():
+        _build_task = loop.create_task(_build_in_background())
+
+
+async def _build_in_background() -> None:
+    global _keyboards, _pending_version
+    loop = asyncio.get_running_loop()
+    while _pending_version is not None:
+        version, _pending_version = _pending_version, None
+        try:
+            keyboards = await loop.run_in_executor(None, build_keyboards, version)
+        except Exception as e:
+            logging.error(f"Ошибка сборки клавиатур расписания v{version}: {e}")
+            continue
+        # Пока шла сборка, версия могла смениться — устаревшие клавиатуры не подставляем
+        if version == get_schedule_version():
+            _keyboards = keyboards
+
+
+async def join_keyboards() -> None:
+    """Дождаться фоновой сборки клавиатур"""
+    if _build_task is not None:
+        await asyncio.gather(_build_task, return_exceptions=True)
+
+
+def current_keyboards() -> KeyboardSet | None:
+    keyboards = _keyboards
+    if keyboards.version == get_schedule_version():
+        return keyboards
+    return None
+
+
+def dates_page_keyboard(page: int = 0) -> InlineKeyboardMarkup:
+    keyboards = current_keyboards()
+    if keyboards is not None and page in keyboards.dates_pages:
+        return keyboards.dates_pages[page]
+    return dates_keyboard(list_schedules(), page=page)
+
+
+def date_groups_keyboard(schedule_id: int) -> InlineKeyboardMarkup | None:
+    """Клавиатура групп на дату или None, если на дату нет занятий"""
+    keyboards = current_keyboards()
+    if keyboards is not None:
+        return keyboards.date_groups.get(schedule_id)
+    groups = list_groups_for_schedule(schedule_id)
+    return groups_for_date_keyboard(groups) if groups else None
+
+
+def group_on_date_keyboard(group_id: int, code: str) -> InlineKeyboardMarkup:
+    keyboards = current_keyboards()
+    if keyboards is not None and group_id in keyboards.group_date_nav:
+        return keyboards.group_date_nav[group_id]
+    return group_on_date_nav_keyboard(list_group_dates(code), group_id)
@@ -1,22 +1,55 @@
 import asyncio
+import html
 import logging
-import re
 from datetime import datetime
 from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
-from aiogram.filters import CommandStart, Command
+from aiogram.types import Message, CallbackQuery
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiohttp import ClientTimeout, TCPConnector, ClientSession
 
-from .config import load_token
-from .keyboards import MAIN_MENU, ADMIN_MENU, groups_keyboard, schedule_management_keyboard, get_main_menu, dates_keyboard, groups_for_date_keyboard
-from .storage import init_storage, get_schedule_for_group
-from .parser import init_db, save_table_to_db, WordParser, get_all_dates, get_all_groups, get_schedule_for_group
-from .file_manager import save_schedule_file, get_schedule_files, cleanup_old_schedules, get_schedule_stats
+from . import callbacks
+from .callbacks import CallbackRouter, STALE_BUTTON
+from .config import load_token, load_setting
+from .keyboards import MAIN_MENU, ADMIN_MENU, groups_keyboard, schedule_management_keyboard, get_main_menu, dates_page_keyboard, date_groups_keyboard, group_on_date_keyboard, subscription_keyboard, teachers_keyboard, join_keyboards, materialize_keyboards
+from .storage import DATA_VERSION_POLL_SECONDS, check_data_version, read_schedule, list_dates, save_tables, bump_schedule_version, get_cache_stats, add_version_listener, search_lessons, find_teacher_ids, get_lesson_teacher, get_teacher_schedule, get_room_schedule, get_group_row, get_schedule_row
+from .render import add_rendered_listener, get_group_text, get_group_on_date_text, join_rendered, materialize_rendered, render_group_on_date, render_search_results, render_teacher_schedule, render_room_schedule, split_message
+from .parser import DB_PATH, WordParser, init_db, format_ru_date
+from .generations import get_generation_stats
+from .ingest import IngestQueue, init_ingest_db, new_job_path, stage_file
+from .file_manager import save_schedule_file, list_schedule_files, get_schedule_stats, init_file_manifest
+from .archive import archive_old_weeks, list_archived_dates, get_archived_lessons, ARCHIVE_KEEP_WEEKS
 from .admin_auth import is_admin
-from .parser_site import download_schedule_by_link_text, admin_notify, bot_instance 
+from .subscriptions import init_subscriptions_db, subscribe, unsubscribe, is_subscribed, get_chat_subscriptions
+from .broadcast import Broadcaster, ScheduleNotifier
+from .parser_site import download_schedule_by_link_text, admin_notify, close_downloader, SCHEDULE_PAGE_URL
+from .scheduler import SchedulePoller, prefetch_and_ingest, POLL_INTERVAL_MINUTES
+from .webhook import run_webhook, WEBHOOK_URL
+from .snapshot import SnapshotWriter, load_snapshot
+from .coordination import CHECK_LOCK, SingleFlight
+from .rebuild import format_report as format_rebuild_report, rebuild_database
+from .fsm_storage import SQLiteStorage
+from .metrics import REGISTRY, METRICS_PORT, install_middleware as install_metrics_middleware, start_metrics_server
+from .throttle import THROTTLED, install_middleware as install_throttling_middleware
+
+# memory — состояния в памяти процесса, sqlite — общие для всех воркеров
+FSM_STORAGE = load_setting("FSM_STORAGE", "sqlite")
+
+FILE_STATUS_LABELS = {
+    "pending": "⏸ не запускался",
+    "queued": "🕐 в очереди",
+    "running": "🔄 идёт",
+    "done": "✅ готово",
+    "failed": "⚠️ ошибка",
+}
+
+ingest_queue = IngestQueue()
+operations = SingleFlight("check")
+poller = SchedulePoller(lambda: operations.run(("prefetch",), lambda: prefetch_and_ingest(ingest_queue), lock=CHECK_LOCK))
 
 
 async def on_start(message: Message):
@@ -92,16 +125,34 @@ async def on_schedule_management(message: Message):
         reply_markup=schedule_management_keyboard()
     )
 
-async def on_check_schedule(message: Message):
+async def on_check_schedule(message: Message, bot: Bot):
     date_str = datetime.now().strftime("%d %B")
-    await message.answer("🔄 Проверяю расписание...")
-    await download_schedule_by_link_text(
-        "http://egorlyk-college.ru/%d1%80%d0%b0%d1%81%d0%bf%d0%b8%d1%81%d0%b0%d0%bd%d0%b8%d0%b5/",
-        save_schedule_file,
+    key = ("check", date_str)
+    if operations.in_flight(key):
+        status = await message.answer("⏳ Проверка уже идёт, дождитесь результата...")
+    else:
+        status = await message.answer("🔄 Проверяю расписание...")
+
+    async def progress(text: str) -> None:
+        await status.edit_text(text)
+
+    async def save_and_ingest(file_path: Path, date_str: str) -> Tuple[bool, str]:
+        success, msg = await save_schedule_file(file_path, date_str)
+        if success:
+            job_id = await ingest_queue.submit(stage_file(file_path), date_str, progress, chat_id=status.chat.id, message_id=status.message_id)
+            # Файл считается проверенным, только когда он загружен в БД
+            if job_id is not None and not await ingest_queue.wait(job_id):
+                return False, f"⚠️ {file_path.name} не удалось загрузить в БД, проверю его снова"
+        return success, msg
+
+    # Одновременные нажатия совмещаются в одну проверку, другие процессы бота ждут блокировку
+    await operations.run(key, lambda: download_schedule_by_link_text(
+        SCHEDULE_PAGE_URL,
+        save_and_ingest,
         admin_notify,
-        bot_instance,
+        bot,
         date_str
-    )
+    ), lock=CHECK_LOCK)
     await message.answer("✅ Расписание проверено")
 
 async def on_back_to_main(message: Message):
@@ -116,59 +167,27 @@ async def on_back_to_main(message: Message):
 
 
 async def on_show_schedule(message: Message):
-    dates = get_all_dates()
+    dates = await read_schedule(list_dates)
     if not dates:
         await message.answer("❌ Нет доступных дат в расписании.")
         return
-    await message.answer("Выберите дату:", reply_markup=dates_keyboard(dates))
+    await message.answer("Выберите дату:", reply_markup=await read_schedule(dates_page_keyboard))
 
 
-async def on_groups_pagination(callback: CallbackQuery):
-    try:
-        _, _, page_str = callback.data.split(":", 2)
-        page = int(page_str)
-    except Exception:
-        page = 0
-    await callback.message.edit_reply_markup(reply_markup=groups_keyboard(page=page))
+async def on_groups_pagination(callback: CallbackQuery, page: int):
+    await callback.message.edit_reply_markup(reply_markup=await read_schedule(groups_keyboard, page))
     await callback.answer()
 
 
-def extract_pair_number(pair: str) -> int:
-    if not pair:
-        return 999
-    match = re.match(r"(\d+)-(\d+)", pair)
-    if match:
-        start = int(match.group(1))
-        return (start + 1) // 2
-    return 999
-
-
-def format_time(time_str: str) -> str:
-    if not time_str:
-        return "—"
-    
-    match = re.match(r"(\d{4})\s*–\s*(\d{4})", time_str)
-    if match:
-        start, end = match.groups()
-        try:
-            start_h = int(start[:2])
-            start_m = int(start[2:])
-            end_h = int(end[:2])
-            end_m = int(end[2:])
-            
-            if 0 <= start_h <= 23 and 0 <= start_m <= 59 and 0 <= end_h <= 23 and 0 <= end_m <= 59:
-                return f"{start_h:02d}:{start_m:02d} - {end_h:02d}:{end_m:02d}"
-        except (ValueError, IndexError):
-            pass
-    
-    return time_str
-
-
-async def on_group_selected(callback: CallbackQuery):
-    group_name = callback.data.split(":", 1)[1]
+async def on_group_selected(callback: CallbackQuery, group_id: int):
+    group = await read_schedule(get_group_row, group_id)
+    if group is None:
+        await callback.answer(STALE_BUTTON)
+        return
+    group_name = group["code"]
     await callback.answer()
-    items = get_schedule_for_group(group_name)
-    if not items:
+    text = await read_schedule(get_group_text, group_name)
+    if text is None:
         await callback.message.answer(
             f"❌ Для группы <b>{group_name}</b> расписание не найдено.\n\n"
             f"Загрузите DOCX файл и перезапустите бота.",
@@ -176,145 +195,243 @@ async def on_group_selected(callback: CallbackQuery):
         )
         return
 
-    from collections import defaultdict
-    by_date = defaultdict(list)
-    for it in items:
-        by_date[(it.get("date"), it.get("weekday"))].append(it)
+    subscribed = is_subscribed(callback.message.chat.id, group_name)
+    await callback.message.answer(text, parse_mode="HTML", reply_markup=subscription_keyboard(group_id, subscribed))
 
-    lines = []
-    
-    lines.append(f"🎓 <b>РАСПИСАНИЕ ГРУППЫ {group_name}</b>")
-    lines.append("━" * 30)
-    
-    for (date, weekday), arr in by_date.items():
-        lines.append(f"\n📅 <b>{date or ''} {weekday or ''}</b>")
-        lines.append("─" * 25)
-        
-        arr_sorted = sorted(arr, key=lambda x: extract_pair_number(x.get("pair", "")))
-        
-        for it in arr_sorted:
-            pair = it.get("pair") or "—"
-            time = format_time(it.get("time", ""))
-            subj = it.get("subject") or ""
-            teacher = it.get("teacher") or ""
-            room = it.get("room") or ""
-            
-            pair_num = extract_pair_number(pair)
-            if pair_num != 999:
-                pair_display = f"🔢 {pair_num} пара"
-            else:
-                pair_display = f"🔢 {pair}"
-            
-            if room:
-                room_text = f"🏢 ауд. {room}"
-            else:
-                room_text = "🏢 ауд. не указана"
-            
-            if teacher:
-                teacher_text = f"👨‍🏫 {teacher}"
-            else:
-                teacher_text = "👨‍🏫 не указан"
-            
-            lines.append(f"{pair_display}")
-            lines.append(f"⏰ {time}")
-            lines.append(f"📚 <b>{subj}</b>")
-            lines.append(f"{teacher_text}")
-            lines.append(f"{room_text}")
-            lines.append("")
-
-    text = "\n".join(lines) if lines else "📝 Нет занятий"
-    await callback.message.answer(text, parse_mode="HTML")
-
-
-async def on_date_selected(callback: CallbackQuery):
-    date = callback.data.split(":", 1)[1]
-    all_groups = get_all_groups()
-    groups = []
-    for group in all_groups:
-        lessons = [l for l in get_schedule_for_group(group) if l['date'] == date]
-        if lessons:
-            groups.append(group)
+
+async def send_teacher_schedule(message: Message, teacher: str) -> None:
+    lessons = await read_schedule(get_teacher_schedule, teacher)
+    if not lessons:
+        await message.answer(f"❌ Занятий преподавателя <b>{html.escape(teacher)}</b> не найдено.", parse_mode="HTML")
+        return
+    for part in split_message(render_teacher_schedule(teacher, lessons)):
+        await message.answer(part, parse_mode="HTML")
+
+
+async def on_teacher(message: Message, command: CommandObject):
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer(
+            "👨‍🏫 Укажите фамилию преподавателя:\n<code>/teacher Иванов</code>",
+            parse_mode="HTML"
+        )
+        return
+    teachers = await read_schedule(find_teacher_ids, query)
+    if not teachers:
+        await message.answer(f"❌ Преподаватель «{html.escape(query)}» не найден.")
+        return
+    if len(teachers) == 1:
+        await send_teacher_schedule(message, teachers[0][1])
+        return
+    await message.answer("Выберите преподавателя:", reply_markup=teachers_keyboard(teachers))
+
+
+async def on_teacher_selected(callback: CallbackQuery, lesson_id: int):
+    teacher = await read_schedule(get_lesson_teacher, lesson_id)
+    if teacher is None:
+        await callback.answer(STALE_BUTTON)
+        return
+    await callback.answer()
+    await send_teacher_schedule(callback.message, teacher)
+
+
+async def on_room(message: Message, command: CommandObject):
+    room = (command.args or "").strip()
+    if not room:
+        await message.answer(
+            "🏢 Укажите номер аудитории:\n<code>/room 105</code>",
+            parse_mode="HTML"
+        )
+        return
+    lessons = await read_schedule(get_room_schedule, room)
+    if not lessons:
+        await message.answer(f"✅ Аудитория «{html.escape(room)}» свободна во всех датах расписания.")
+        return
+    for part in split_message(render_room_schedule(room, lessons)):
+        await message.answer(part, parse_mode="HTML")
+
+
+async def on_subscription_toggle(callback: CallbackQuery, group_id: int, subscribed: bool):
+    row = await read_schedule(get_group_row, group_id)
+    if row is None:
+        await callback.answer(STALE_BUTTON)
+        return
+    group = row["code"]
+    chat_id = callback.message.chat.id
+    if subscribed:
+        subscribe(chat_id, group)
+        await callback.answer(f"🔔 Вы подписаны на обновления {group}")
+    else:
+        unsubscribe(chat_id, group)
+        await callback.answer(f"🔕 Подписка на {group} отменена")
+    await callback.message.edit_reply_markup(reply_markup=subscription_keyboard(group_id, subscribed))
+
+
+async def on_subscribe(callback: CallbackQuery, group_id: int):
+    await on_subscription_toggle(callback, group_id, True)
+
+
+async def on_unsubscribe(callback: CallbackQuery, group_id: int):
+    await on_subscription_toggle(callback, group_id, False)
+
+
+async def on_subscriptions(message: Message):
+    groups = get_chat_subscriptions(message.chat.id)
     if not groups:
+        await message.answer(
+            "🔕 У вас нет подписок.\n\n"
+            "Откройте расписание группы и нажмите «🔔 Подписаться на обновления»."
+        )
+        return
+    text = "🔔 <b>Ваши подписки:</b>\n\n" + "\n".join(f"🧩 {group}" for group in groups)
+    await message.answer(text, parse_mode="HTML")
+
+
+async def on_search(message: Message, command: CommandObject):
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer(
+            "🔍 <b>Поиск по расписанию</b>\n\n"
+            "Укажите предмет, преподавателя или аудиторию:\n"
+            "<code>/search математика</code>\n"
+            "<code>/search Иванов</code>\n"
+            "<code>/search 105</code>",
+            parse_mode="HTML"
+        )
+        return
+    results = await read_schedule(search_lessons, query)
+    await message.answer(render_search_results(query, results), parse_mode="HTML")
+
+
+async def on_archive(message: Message, command: CommandObject):
+    parts = (command.args or "").split(maxsplit=1)
+    if not parts:
+        await message.answer(
+            "🗄 <b>Архив прошлых недель</b>\n\n"
+            "<code>/archive К101</code> — архивные даты группы\n"
+            "<code>/archive К101 15 сентября</code> — занятия на дату",
+            parse_mode="HTML"
+        )
+        return
+    group = parts[0]
+    if len(parts) == 1:
+        dates = list_archived_dates(group)
+        if not dates:
+            await message.answer(f"❌ В архиве нет расписания группы «{html.escape(group)}»")
+            return
+        text = f"🗄 <b>Архив {html.escape(group)}:</b>\n\n" + "\n".join(
+            f"📅 {label} ({day[:4]})" for day, label in dates[:30])
+        await message.answer(text, parse_mode="HTML")
+        return
+    lessons = get_archived_lessons(group, parts[1].strip())
+    if not lessons:
+        await message.answer(f"❌ В архиве нет занятий {html.escape(group)} на {html.escape(parts[1])}")
+        return
+    for part in split_message(render_group_on_date(group, lessons[0]["date"], lessons)):
+        await message.answer(part, parse_mode="HTML")
+
+
+async def run_rebuild() -> Dict[str, float]:
+    """Пересобрать БД из файлов; начатые разборы сначала публикуют свои поколения"""
+    await ingest_queue.join()
+    init_db()
+    loop = asyncio.get_running_loop()
+    report = await loop.run_in_executor(None, rebuild_database)
+    bump_schedule_version()
+    return report
+
+
+async def run_archive(keep_weeks: int) -> str:
+    """Перенести прошлые недели в архив, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(None, lambda: archive_old_weeks(keep_weeks=keep_weeks))
+    except Exception as e:
+        logging.error(f"Ошибка архивации: {e}")
+        return f"❌ Ошибка при архивации: {e}"
+    if result["schedules"]:
+        bump_schedule_version()
+    if not result["files"] and not result["schedules"]:
+        return "✅ Старых недель для архивации не найдено"
+    return (f"🗄 В архив перенесено: файлов {result['files']}, "
+            f"дат {result['schedules']}, занятий {result['lessons']}")
+
+
+async def on_date_selected(callback: CallbackQuery, schedule_id: int):
+    schedule = await read_schedule(get_schedule_row, schedule_id)
+    if schedule is None:
+        await callback.answer(STALE_BUTTON)
+        return
+    date = schedule["date"]
+    keyboard = await read_schedule(date_groups_keyboard, schedule_id)
+    if keyboard is None:
         await callback.message.answer(f"❌ Нет расписания на {date}")
         return
-    await callback.message.edit_text(f"Выберите группу на <b>{date}</b>:", parse_mode="HTML", reply_markup=groups_for_date_keyboard(groups, date))
+    await callback.message.edit_text(f"Выберите группу на <b>{date}</b>:", parse_mode="HTML", reply_markup=keyboard)
     await callback.answer()
 
 
-async def on_group_on_date(callback: CallbackQuery):
-    _, date, group = callback.data.split(":", 2)
-    lessons = [l for l in get_schedule_for_group(group) if l['date'] == date]
-    if not lessons:
+async def on_group_on_date(callback: CallbackQuery, group_id: int):
+    row = await read_schedule(get_group_row, group_id)
+    if row is None:
+        await callback.answer(STALE_BUTTON)
+        return
+    group, date = row["code"], row["date"]
+    text = await read_schedule(get_group_on_date_text, group, date)
+    if text is None:
         await callback.message.answer(f"❌ Для группы <b>{group}</b> на {date} расписание не найдено.", parse_mode="HTML")
         return
-    dates = get_all_dates()
-    idx = dates.index(date) if date in dates else 0
-    prev_date = dates[idx-1] if idx > 0 else None
-    next_date = dates[idx+1] if idx < len(dates)-1 else None
-    lines = [f"📅 <b>{date}</b> | 🧩 <b>{group}</b>", "━"*30]
-    for l in sorted(lessons, key=lambda x: (x['pair'] or '999')):
-        lines.append(f"🔢 <b>{l['pair'] or '—'}</b>  ⏰ {l['time'] or '—'}")
-        lines.append(f"📚 <b>{l['subject']}</b>")
-        if l['teacher']:
-            lines.append(f"👨‍🏫 {l['teacher']}")
-        if l['room']:
-            lines.append(f"🏢 {l['room']}")
-        lines.append("─"*15)
-    nav = []
-    if prev_date:
-        nav.append(InlineKeyboardButton(text="⬅️ Пред. дата", callback_data=f"group_on_date:{prev_date}:{group}"))
-    nav.append(InlineKeyboardButton(text="🔙 К датам", callback_data="back_to_dates"))
-    if next_date:
-        nav.append(InlineKeyboardButton(text="След. дата ➡️", callback_data=f"group_on_date:{next_date}:{group}"))
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[nav])
-    await callback.message.edit_text("\n".join(lines), parse_mode="HTML", reply_markup=keyboard)
+    await callback.message.edit_text(text, parse_mode="HTML", reply_markup=await read_schedule(group_on_date_keyboard, group_id, group))
     await callback.answer()
 
 
-async def on_dates_page(callback: CallbackQuery):
-    page = int(callback.data.split(":", 1)[1])
-    dates = get_all_dates()
-    await callback.message.edit_text("Выберите дату:", reply_markup=dates_keyboard(dates, page=page))
+async def on_dates_page(callback: CallbackQuery, page: int):
+    await callback.message.edit_text("Выберите дату:", reply_markup=await read_schedule(dates_page_keyboard, page))
     await callback.answer()
 
 
 async def on_back_to_dates(callback: CallbackQuery):
-    dates = get_all_dates()
-    await callback.message.edit_text("Выберите дату:", reply_markup=dates_keyboard(dates))
+    await callback.message.edit_text("Выберите дату:", reply_markup=await read_schedule(dates_page_keyboard))
     await callback.answer()
 
 
-async def on_admin_callback(callback: CallbackQuery):
+async def on_admin_callback(callback: CallbackQuery, action: str):
     if not is_admin(callback.from_user.id):
         await callback.answer("❌ Нет прав доступа")
         return
     
-    action = callback.data.split(":", 1)[1]
     await callback.answer()
     
     if action == "view_dates":
-        files = get_schedule_files()
+        files = list_schedule_files(10)
         if files:
             text = "📅 <b>Файлы расписания:</b>\n\n"
-            for filename, create_time in files[:10]:
-                text += f"📄 {filename}\n"
-                text += f"🕒 {create_time.strftime('%d.%m.%Y %H:%M')}\n\n"
+            for row in files:
+                text += f"📄 {row['name']} ({row['size'] // 1024} КБ)\n"
+                text += f"🕒 {row['stored_at'][:16]}, разбор: {FILE_STATUS_LABELS.get(row['ingest_status'], row['ingest_status'])}\n\n"
         else:
             text = "📝 Файлы расписания не найдены"
         
         await callback.message.answer(text, parse_mode="HTML")
     
-    elif action == "cleanup_old":
-        deleted_count, message = cleanup_old_schedules()
-        await callback.message.answer(message)
+    elif action == "archive_old":
+        await callback.message.answer(await run_archive(ARCHIVE_KEEP_WEEKS or 1))
     
     elif action == "stats":
         stats = get_schedule_stats()
+        cache = get_cache_stats()
+        generation = get_generation_stats(DB_PATH)
+        throttled = int(THROTTLED.value("message") + THROTTLED.value("callback"))
         text = f"""📊 <b>Статистика расписания:</b>
 
 📁 Всего файлов: {stats['total_files']}
 📅 Текущая неделя: {stats['current_week_files']}
 🗑️ Старых файлов: {stats['old_files']}
+💾 Объём: {stats['total_size'] // 1024} КБ, уникальных: {stats['unique_files']}
+
+🧠 Кэш: версия {cache['version']}, попаданий {cache['hits']}, промахов {cache['misses']}, совмещённых {cache['coalesced']}
+🗂 Поколение БД: {generation['current']}, хранится {generation['generations']} ({generation['size'] // 1024} КБ)
+⏳ Ограничено частотой: {throttled} обновлений
 
 <b>Последние файлы:</b>"""
         
@@ -325,11 +442,15 @@ async def on_admin_callback(callback: CallbackQuery):
         await callback.message.answer(text, parse_mode="HTML")
     
     elif action == "reload_db":
-        await callback.message.answer("🔄 Перезагружаем базу данных...")
+        if operations.in_flight(("rebuild",)):
+            await callback.message.answer("⏳ Пересборка уже идёт, дождитесь результата...")
+        else:
+            await callback.message.answer("🔄 Пересобираем базу данных из сохранённых файлов...")
         try:
-            init_db()
-            await callback.message.answer("✅ База данных перезагружена")
+            report = await operations.run(("rebuild",), run_rebuild, lock=CHECK_LOCK)
+            await callback.message.answer(format_rebuild_report(report))
         except Exception as e:
+            logging.error(f"Ошибка пересборки БД: {e}")
             await callback.message.answer(f"❌ Ошибка при перезагрузке: {e}")
     
     elif action == "back":
@@ -354,52 +475,54 @@ async def on_document_received(message: Message, bot: Bot):
         await message.answer("❌ Поддерживаются только DOCX файлы")
         return
     
-    await message.answer("📥 Загружаю файл...")
-    
+    status = await message.answer("📥 Загружаю файл...")
+
+    async def progress(text: str) -> None:
+        await status.edit_text(text)
+
+    file_path = new_job_path()
     try:
         file_info = await bot.get_file(message.document.file_id)
-        file_path = Path(__file__).parent / "temp_schedule.docx"
-        
         await bot.download_file(file_info.file_path, file_path)
         
         # TODO: Реализовать извлечение даты из файла
-        current_date = datetime.now().strftime("%d %B").replace("January", "января").replace("February", "февраля").replace("March", "марта").replace("April", "апреля").replace("May", "мая").replace("June", "июня").replace("July", "июля").replace("August", "августа").replace("September", "сентября").replace("October", "октября").replace("November", "ноября").replace("December", "декабря")
+        current_date = format_ru_date(datetime.now())
         
         success, message_text = await save_schedule_file(file_path, current_date)
 
-        
-        if success:
-            await message.answer("🔄 Парсирую расписание...")
-            try:
-                with WordParser(str(file_path)) as doc:
-                    tables = doc.get_tables()
-                    count = 0
-                    for table in tables:
-                        if save_table_to_db(table):
-                            count += 1
-                await message.answer(f"✅ Загружено и обработано {count} таблиц!")
-            except Exception as e:
-                await message.answer(f"⚠️ Файл сохранен, но ошибка при парсинге: {e}")
-        else:
-            await message.answer(f"❌ {message_text}")
-        
-        if file_path.exists():
-            file_path.unlink()
+        if not success:
+            await progress(f"❌ {message_text}")
+            file_path.unlink(missing_ok=True)
+            return
+
+        await ingest_queue.submit(file_path, current_date, progress, chat_id=status.chat.id, message_id=status.message_id)
             
     except Exception as e:
+        file_path.unlink(missing_ok=True)
         await message.answer(f"❌ Ошибка при обработке файла: {e}")
         logging.error(f"Ошибка при обработке файла: {e}")
 
 
+def job_progress(bot: Bot) -> Callable[[Dict], Callable[[str], Awaitable[None]]]:
+    """Прогресс возобновлённого задания пишется в его исходное сообщение"""
+    def make_progress(job: Dict):
+        async def progress(text: str) -> None:
+            if job.get("chat_id") and job.get("message_id"):
+                await bot.edit_message_text(text=text, chat_id=job["chat_id"], message_id=job["message_id"])
+        return progress
+    return make_progress
+
+
 async def preload_from_docx_if_present() -> None:
     docx_path = Path(__file__).with_name("file.docx")
     if docx_path.exists():
         logging.info(f"Найден DOCX файл: {docx_path}")
         init_db()
-        
-        from .parser import main as parse_main
-        parse_main()
-        logging.info("Данные из DOCX загружены в БД")
+        with WordParser(str(docx_path)) as doc:
+            tables = doc.get_tables()
+        # Весь документ — одно поколение; версию поднимает save_tables
+        count = save_tables(tables)
+        logging.info(f"Данные из DOCX загружены в БД: {count} таблиц")
     else:
         logging.info("DOCX файл не найден, используем существующие данные в БД")
 
@@ -408,6 +531,46 @@ async def document_handler(message: Message, bot: Bot):
     await on_document_received(message, bot)
 
 
+def build_callback_router() -> CallbackRouter:
+    router = CallbackRouter()
+    router.register(callbacks.GROUPS_PAGE, on_groups_pagination, int)
+    router.register(callbacks.GROUP, on_group_selected, int)
+    router.register(callbacks.TEACHER, on_teacher_selected, int)
+    router.register(callbacks.ADMIN, on_admin_callback, str)
+    router.register(callbacks.SUBSCRIBE, on_subscribe, int)
+    router.register(callbacks.UNSUBSCRIBE, on_unsubscribe, int)
+    router.register(callbacks.DATE, on_date_selected, int)
+    router.register(callbacks.GROUP_ON_DATE, on_group_on_date, int)
+    router.register(callbacks.DATES_PAGE, on_dates_page, int)
+    router.register(callbacks.BACK_TO_DATES, on_back_to_dates)
+    return router
+
+
+def build_dispatcher(storage: Optional[BaseStorage] = None) -> Dispatcher:
+    """Диспетчер со всеми хендлерами бота"""
+    dp = Dispatcher(storage=storage or MemoryStorage())
+
+    dp.message.register(on_start, CommandStart())
+    dp.message.register(on_get_id, Command("id"))
+    dp.message.register(on_subscriptions, Command("subscriptions"))
+    dp.message.register(on_search, Command("search"))
+    dp.message.register(on_teacher, Command("teacher"))
+    dp.message.register(on_room, Command("room"))
+    dp.message.register(on_archive, Command("archive"))
+    dp.message.register(on_show_schedule, F.text == "📅 Показать расписание")
+    dp.message.register(on_admin_panel, F.text == "⚙️ Админ-панель")
+    dp.message.register(on_upload_schedule, F.text == "📤 Загрузить расписание")
+    dp.message.register(on_schedule_management, F.text == "📋 Управление расписанием")
+    dp.message.register(on_check_schedule, F.text == "🔄 Проверить расписание")
+    dp.message.register(on_back_to_main, F.text == "🔙 Назад в главное меню")
+    dp.message.register(document_handler, F.document)
+
+    dp.callback_query.register(build_callback_router().dispatch)
+    install_throttling_middleware(dp)
+    install_metrics_middleware(dp)
+    return dp
+
+
 async def main() -> None:
     logging.basicConfig(
         level=logging.INFO,
@@ -418,12 +581,11 @@ async def main() -> None:
     logging.info("Запуск бота расписания...")
     
     token = load_token()
-    init_storage()
-    await preload_from_docx_if_present()
-
     timeout = ClientTimeout(total=30, connect=10)
 
-    dp = Dispatcher(storage=MemoryStorage())
+    # Общее хранилище состояний нужно, когда обновления обслуживают несколько процессов
+    storage = SQLiteStorage() if FSM_STORAGE == "sqlite" else MemoryStorage()
+    dp = build_dispatcher(storage)
     bot = Bot(
         token=token, 
         default=DefaultBotProperties(parse_mode="HTML"),
@@ -431,32 +593,60 @@ async def main() -> None:
         connector=TCPConnector(family=2)
     )
 
-    # Регистрация хендлеров
-    dp.message.register(on_start, CommandStart())
-    dp.message.register(on_get_id, Command("id"))
-    dp.message.register(on_show_schedule, F.text == "📅 Показать расписание")
-    dp.message.register(on_admin_panel, F.text == "⚙️ Админ-панель")
-    dp.message.register(on_upload_schedule, F.text == "📤 Загрузить расписание")
-    dp.message.register(on_schedule_management, F.text == "📋 Управление расписанием")
-    dp.message.register(on_check_schedule, F.text == "🔄 Проверить расписание")
-    dp.message.register(on_back_to_main, F.text == "🔙 Назад в главное меню")
-    dp.message.register(document_handler, F.document)
-
-    dp.callback_query.register(on_groups_pagination, F.data.startswith("groups:page:"))
-    dp.callback_query.register(on_group_selected, F.data.startswith("group:"))
-    dp.callback_query.register(on_admin_callback, F.data.startswith("admin:"))
-    dp.callback_query.register(on_date_selected, F.data.startswith("date:"))
-    dp.callback_query.register(on_group_on_date, F.data.startswith("group_on_date:"))
-    dp.callback_query.register(on_dates_page, F.data.startswith("dates_page:"))
-    dp.callback_query.register(on_back_to_dates, F.data == "back_to_dates")
+    notifier = ScheduleNotifier(Broadcaster(bot))
+    REGISTRY.add_collector(lambda: (
+        ("bot_broadcast_events_total", "counter", "События рассылки подписчикам", {"event": name}, value)
+        for name, value in notifier.broadcaster.metrics.items()
+    ))
+    add_version_listener(materialize_rendered)
+    add_version_listener(materialize_keyboards)
+    add_rendered_listener(notifier.on_rendered)
+    snapshot_writer = SnapshotWriter()
+    add_version_listener(snapshot_writer.on_version)
+    init_db()
+    # Снимок с теми же данными сразу даёт готовые ответы, без запросов к БД
+    if not load_snapshot():
+        bump_schedule_version()
+    init_ingest_db()
+    init_subscriptions_db()
+    init_file_manifest()
+    if ARCHIVE_KEEP_WEEKS > 0:
+        logging.info(await run_archive(ARCHIVE_KEEP_WEEKS))
+    await preload_from_docx_if_present()
 
+    # Другие процессы бота публикуют свои загрузки — их кэши сверяются со счётчиком данных БД
+    version_watcher = SchedulePoller(check_data_version, interval=DATA_VERSION_POLL_SECONDS, jitter=0,
+                                     name="Сверка версии расписания")
+    metrics_runner = await start_metrics_server() if METRICS_PORT > 0 else None
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        logging.info("Бот успешно запущен и готов к работе!")
-        await dp.start_polling(bot)
+        await ingest_queue.resume(job_progress(bot))
+        if DATA_VERSION_POLL_SECONDS > 0:
+            version_watcher.start()
+        if POLL_INTERVAL_MINUTES > 0:
+            poller.start()
+        if WEBHOOK_URL:
+            logging.info("Бот успешно запущен в режиме webhook!")
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            logging.info("Бот успешно запущен и готов к работе!")
+            await dp.start_polling(bot)
     except Exception as e:
         logging.error(f"Ошибка при запуске бота: {e}")
         raise
+    finally:
+        await version_watcher.stop()
+        await poller.stop()
+        await operations.shutdown()
+        await ingest_queue.shutdown()
+        await join_rendered()
+        await join_keyboards()
+        await notifier.join()
+        await snapshot_writer.join()
+        await close_downloader()
+        await storage.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from . import parser
+
+# Английские названия месяцев: проверка с сайта подписывает файлы через strftime("%d %B")
+MONTHS_EN = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+]
+
+INGEST_STATUSES = ("pending", "queued", "running", "done", "failed")
+
+
+def init_manifest_db() -> None:
+    conn = parser.connect()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS schedule_files (
+            name TEXT PRIMARY KEY,
+            date_label TEXT,
+            schedule_date TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            path TEXT NOT NULL,
+            ingest_status TEXT NOT NULL DEFAULT 'pending',
+            stored_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_schedule_files_date ON schedule_files(schedule_date);
+        CREATE INDEX IF NOT EXISTS idx_schedule_files_stored ON schedule_files(stored_at);
+        CREATE INDEX IF NOT EXISTS idx_schedule_files_hash ON schedule_files(content_hash);
+    """)
+    conn.commit()
+    conn.close()
+
+
+def parse_schedule_date(label: str, reference: datetime) -> Optional[date]:
+    """Дата из подписи «22 сентября» или «22 September».
+
+    Год в подписи не указан — берётся ближайший к reference.
+    """
+    match = re.match(r"\s*(\d{1,2})[\s_]+([^\s_]+)", label or "")
+    if not match:
+        return None
+    month_name = match.group(2).lower()
+    if month_name in parser.MONTHS_GENITIVE:
+        month = parser.MONTHS_GENITIVE.index(month_name) + 1
+    elif month_name in MONTHS_EN:
+        month = MONTHS_EN.index(month_name) + 1
+    else:
+        return None
+
+    candidates = []
+    for year in (reference.year - 1, reference.year, reference.year + 1):
+        try:
+            candidates.append(date(year, month, int(match.group(1))))
+        except ValueError:
+            continue
+    if not candidates:
+        return None
+    return min(candidates, key=lambda day: abs((day - reference.date()).days))
+
+
+def record_file(name: str, date_label: str, schedule_date: date, size: int, content_hash: str,
+                path: str, stored_at: datetime) -> Optional[str]:
+    """Добавить или заменить запись о файле. Возвращает хэш прежнего содержимого."""
+    conn = parser.connect()
+    try:
+        row = conn.execute("SELECT content_hash FROM schedule_files WHERE name = ?", (name,)).fetchone()
+        conn.execute(
+            """INSERT OR REPLACE INTO schedule_files
+               (name, date_label, schedule_date, size, content_hash, path, ingest_status, stored_at)
+               VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)""",
+            (name, date_label, schedule_date.isoformat(), size, content_hash, path,
+             stored_at.isoformat(sep=" ", timespec="seconds")),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def set_ingest_status(content_hash: str, status: str) -> int:
+    """Статус разбора для всех файлов с таким содержимым"""
+    if status not in INGEST_STATUSES:
+        raise ValueError(f"Неизвестный статус: {status}")
+    conn = parser.connect()
+    cur = conn.execute(
+        "UPDATE schedule_files SET ingest_status = ? WHERE content_hash = ?", (status, content_hash)
+    )
+    conn.commit()
+    conn.close()
+    return cur.rowcount
+
+
+def is_referenced(content_hash: str) -> bool:
+    conn = parser.connect()
+    row = conn.execute("SELECT 1 FROM schedule_files WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone()
+    conn.close()
+    return row is not None
+
+
+def _rows(sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+    conn = parser.connect()
+    conn.row_factory = parser.sqlite3.Row
+    rows = [dict(row) for row in conn.execute(sql, params)]
+    conn.close()
+    return rows
+
+
+def list_files(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Файлы от новых дат расписания к старым"""
+    sql = "SELECT * FROM schedule_files ORDER BY schedule_date DESC, stored_at DESC"
+    if limit is not None:
+        return _rows(sql + " LIMIT ?", (limit,))
+    return _rows(sql)
+
+
+def get_file(name: str) -> Optional[Dict[str, Any]]:
+    rows = _rows("SELECT * FROM schedule_files WHERE name = ?", (name,))
+    return rows[0] if rows else None
+
+
+def known_paths() -> Dict[str, str]:
+    """Имя файла → путь его содержимого"""
+    conn = parser.connect()
+    paths = dict(conn.execute("SELECT name, path FROM schedule_files"))
+    conn.close()
+    return paths
+
+
+def move_file(name: str, path: str) -> None:
+    """Содержимое файла переехало по новому пути; статус разбора остаётся"""
+    conn = parser.connect()
+    conn.execute("UPDATE schedule_files SET path = ? WHERE name = ?", (path, name))
+    conn.commit()
+    conn.close()
+
+
+def list_before(day: date) -> List[Dict[str, Any]]:
+    """Файлы с датой расписания раньше day"""
+    return _rows("SELECT * FROM schedule_files WHERE schedule_date < ? ORDER BY schedule_date", (day.isoformat(),))
+
+
+def delete_before(day: date) -> List[Dict[str, Any]]:
+    """Удалить записи с датой расписания раньше day; возвращает удалённые"""
+    conn = parser.connect()
+    conn.row_factory = parser.sqlite3.Row
+    try:
+        rows = [dict(row) for row in conn.execute(
+            "SELECT * FROM schedule_files WHERE schedule_date < ?", (day.isoformat(),)
+        )]
+        conn.execute("DELETE FROM schedule_files WHERE schedule_date < ?", (day.isoformat(),))
+        conn.commit()
+    finally:
+        conn.close()
+    return rows
+
+
+def get_stats(week_start: date) -> Dict[str, int]:
+    conn = parser.connect()
+    row = conn.execute(
+        """SELECT COUNT(*),
+                  COALESCE(SUM(schedule_date >= ?), 0),
+                  COALESCE(SUM(size), 0),
+                  COUNT(DISTINCT content_hash)
+           FROM schedule_files""",
+        (week_start.isoformat(),),
+    ).fetchone()
+    statuses = dict(conn.execute(
+        "SELECT ingest_status, COUNT(*) FROM schedule_files GROUP BY ingest_status"
+    ).fetchall())
+    conn.close()
+    total, current_week, total_size, unique = row
+    return {
+        "total_files": total,
+        "current_week_files": current_week,
+        "old_files": total - current_week,
+        "total_size": total_size,
+        "unique_files": unique,
+        "statuses": statuses,
+    }
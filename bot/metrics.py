@@ -0,0 +1,241 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from .config import load_setting, load_int_setting
+
+# Локальный порт с метриками в формате Prometheus; 0 — не запускать (по умолчанию).
+# У каждого процесса-воркера на хосте должен быть свой порт
+METRICS_HOST = load_setting("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = load_int_setting("METRICS_PORT", 0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(total)}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами; observe — бинарный поиск и два сложения"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # метки → [счётчики по корзинам (+Inf последней), сумма]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((values, (list(series[0]), series[1])) for values, series in self._series.items())
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}"
+
+
+class Registry:
+    """Набор метрик процесса и функций, снимающих значения в момент запроса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Iterator[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+    def register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector) -> None:
+        """collector() возвращает кортежи (имя, тип, описание, метки, значение)"""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+
+        described = set()
+        for collector in list(self._collectors):
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logging.warning(f"Метрики: ошибка сборщика {collector!r}: {e}")
+                continue
+            for name, kind, documentation, labels, value in samples:
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_seconds", "Время работы хендлера обновления", ["handler"])
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ["handler"])
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "bot_db_query_seconds", "Время запросов чтения расписания к SQLite (промахи кэша)", ["query"])
+PARSE_SECONDS = REGISTRY.histogram(
+    "bot_parse_seconds", "Разбор DOCX WordParser", buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+SAVE_TABLE_SECONDS = REGISTRY.histogram(
+    "bot_save_table_seconds", "Запись одной таблицы документа")
+INGEST_SECONDS = REGISTRY.histogram(
+    "bot_ingest_seconds", "Задание на разбор документа целиком", ["status"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "bot_download_seconds", "Загрузки с сайта колледжа", ["kind", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+DOWNLOAD_BYTES = REGISTRY.counter(
+    "bot_download_bytes_total", "Скачано байт с сайта колледжа", ["kind"])
+
+
+def handler_label(handler, event) -> str:
+    """Имя хендлера для метки; для таблицы callback — префикс кнопки"""
+    data = getattr(event, "data", None)
+    name = getattr(handler, "__name__", type(handler).__name__)
+    if name == "dispatch" and isinstance(data, str):
+        return "callback:" + data.split(":", 1)[0]
+    return name
+
+
+class MetricsMiddleware:
+    """Внутренний middleware aiogram: время и ошибки каждого хендлера.
+
+    Регистрируется на наблюдателях message и callback_query.
+    """
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        label = handler_label(handler_object.callback if handler_object else handler, event)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(1, label)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, label)
+
+
+def install_middleware(dp) -> MetricsMiddleware:
+    middleware = MetricsMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    return middleware
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT, registry: Registry = REGISTRY):
+    """HTTP-сервер /metrics; возвращает AppRunner для остановки через cleanup()
+    или None, если порт занят — бот работает и без метрик"""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logging.error(f"Метрики Prometheus не запущены: {host}:{port} недоступен ({e})")
+        await runner.cleanup()
+        return None
+    logging.info(f"Метрики Prometheus: http://{host}:{port}/metrics")
+    return runner
@@ -1,6 +1,7 @@
 import sys
 import sqlite3
 import re
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Any, Tuple, Optional
 
@@ -8,8 +9,17 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "wordparsers"))
 
 from wordparser import WordParser
 
+try:
+    from . import generations
+except ImportError:  # parser.py загружен без пакета: python parser.py, from parser import ...
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    from bot import generations
+
 DB_PATH = Path(__file__).with_name("schedule.db")
 
+# Сколько секунд ждать освобождения БД, если в неё пишет другой процесс
+DB_TIMEOUT = 30
+
 PAIR_NAMES = ["1 пара", "2 пара", "3 пара", "4 пара", "5 пара", "6 пара"]
 PAIR_TIMES = [
     "08:30 - 10:05",
@@ -20,9 +30,46 @@ PAIR_TIMES = [
     "17:25 - 19:00"
 ]
 
+def connect(path: Optional[Path] = None) -> sqlite3.Connection:
+    """Служебная БД: задания, манифест файлов, подписки"""
+    return sqlite3.connect(path or DB_PATH, timeout=DB_TIMEOUT)
+
+
+def connect_schedule() -> sqlite3.Connection:
+    """Текущее поколение расписания (см. generations)"""
+    return sqlite3.connect(generations.ensure_generation(DB_PATH), timeout=DB_TIMEOUT)
+
+
+def publish_schedule(copy: bool = True):
+    """Новое поколение расписания: with publish_schedule() as conn — см. generations.publish"""
+    return generations.publish(DB_PATH, copy)
+
+
+MONTHS_GENITIVE = [
+    "января", "февраля", "марта", "апреля", "мая", "июня",
+    "июля", "августа", "сентября", "октября", "ноября", "декабря",
+]
+
+
+def format_ru_date(day: datetime) -> str:
+    """Дата в формате расписания: «22 сентября»"""
+    return f"{day.day} {MONTHS_GENITIVE[day.month - 1]}"
+
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_schedule()
     cur = conn.cursor()
+    init_schema(cur)
+    init_search_index(cur)
+    init_lookup_indexes(cur)
+    init_data_version(cur)
+    conn.commit()
+    conn.close()
+    print("БД проверена/создана (данные не удалялись)")
+
+
+def init_schema(cur: sqlite3.Cursor) -> None:
+    """Таблицы расписания: даты, группы, занятия"""
     cur.executescript("""
         CREATE TABLE IF NOT EXISTS schedules (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -47,9 +94,102 @@ def init_db():
             FOREIGN KEY(group_id) REFERENCES groups(id)
         );
     """)
-    conn.commit()
+
+
+def init_data_version(cur: sqlite3.Cursor) -> None:
+    """Счётчик изменений расписания, общий для всех процессов"""
+    cur.executescript("""
+        CREATE TABLE IF NOT EXISTS schedule_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO schedule_meta (key, value) VALUES ('data_version', 0);
+    """)
+
+
+def bump_data_version(cur: sqlite3.Cursor) -> None:
+    """Отметить изменение расписания; вызывается в транзакции записи"""
+    cur.execute("UPDATE schedule_meta SET value = value + 1 WHERE key = 'data_version'")
+
+
+def get_data_version() -> Optional[int]:
+    conn = connect_schedule()
+    try:
+        row = conn.execute("SELECT value FROM schedule_meta WHERE key = 'data_version'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
     conn.close()
-    print("БД проверена/создана (данные не удалялись)")
+    return row[0] if row else None
+
+
+def normalize_teacher(name: Optional[str]) -> str:
+    """«Иванов  И. И.» → «иванов и.и.»: ключ поиска преподавателя"""
+    if not name:
+        return ""
+    text = " ".join(name.lower().replace("ё", "е").split())
+    return re.sub(r"\.\s+(?=\w\.)", ".", text)
+
+
+def normalize_room(room: Optional[str]) -> str:
+    """«Ауд. 105 а» → «105а»: ключ поиска аудитории"""
+    if not room:
+        return ""
+    text = room.lower().replace("ауд.", "")
+    return "".join(text.split())
+
+
+def init_lookup_indexes(cur: sqlite3.Cursor) -> None:
+    """Нормализованные столбцы преподавателя и аудитории и индексы для выборок"""
+    cur.execute("PRAGMA table_info(lessons)")
+    columns = {row[1] for row in cur.fetchall()}
+    if "teacher_norm" not in columns:
+        cur.execute("ALTER TABLE lessons ADD COLUMN teacher_norm TEXT")
+    if "room_norm" not in columns:
+        cur.execute("ALTER TABLE lessons ADD COLUMN room_norm TEXT")
+    if "teacher_norm" not in columns or "room_norm" not in columns:
+        rows = cur.execute("SELECT id, teacher, room FROM lessons").fetchall()
+        cur.executemany(
+            "UPDATE lessons SET teacher_norm = ?, room_norm = ? WHERE id = ?",
+            [(normalize_teacher(teacher), normalize_room(room), lesson_id) for lesson_id, teacher, room in rows],
+        )
+
+    cur.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_lessons_group ON lessons(group_id);
+        CREATE INDEX IF NOT EXISTS idx_lessons_teacher_norm ON lessons(teacher_norm);
+        CREATE INDEX IF NOT EXISTS idx_lessons_room_norm ON lessons(room_norm);
+        CREATE INDEX IF NOT EXISTS idx_groups_schedule ON groups(schedule_id, code);
+        CREATE INDEX IF NOT EXISTS idx_groups_code ON groups(code);
+    """)
+
+
+def init_search_index(cur: sqlite3.Cursor) -> None:
+    """Полнотекстовый индекс FTS5 по предметам, преподавателям и аудиториям"""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lessons_fts'")
+    exists = cur.fetchone() is not None
+    cur.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS lessons_fts USING fts5(
+            subject, teacher, room,
+            content='lessons', content_rowid='id',
+            tokenize='unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_ai AFTER INSERT ON lessons BEGIN
+            INSERT INTO lessons_fts(rowid, subject, teacher, room)
+            VALUES (new.id, new.subject, new.teacher, new.room);
+        END;
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_ad AFTER DELETE ON lessons BEGIN
+            INSERT INTO lessons_fts(lessons_fts, rowid, subject, teacher, room)
+            VALUES ('delete', old.id, old.subject, old.teacher, old.room);
+        END;
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_au AFTER UPDATE OF subject, teacher, room ON lessons BEGIN
+            INSERT INTO lessons_fts(lessons_fts, rowid, subject, teacher, room)
+            VALUES ('delete', old.id, old.subject, old.teacher, old.room);
+            INSERT INTO lessons_fts(rowid, subject, teacher, room)
+            VALUES (new.id, new.subject, new.teacher, new.room);
+        END;
+    """)
+    if not exists:
+        # Индекс появился в уже заполненной БД — проиндексировать старые занятия
+        cur.execute("INSERT INTO lessons_fts(lessons_fts) VALUES ('rebuild')")
 
 
 def parse_date_from_row(row: List[str]) -> Tuple[Optional[str], Optional[str]]:
@@ -127,14 +267,59 @@ def parse_group_row(row: List[str], pairs: List[str], times: List[str]) -> Optio
     
     return group_data if group_data["lessons"] else None
 
-def save_table_to_db(table: List[List[str]]) -> bool:
+class ChangeSet:
+    """Изменения расписания одной даты после загрузки таблицы.
+
+    Занятия определяются ключом (группа, пара); inserted/updated/deleted —
+    списки таких ключей.
+    """
+
+    def __init__(self, date: str):
+        self.date = date
+        self.schedule_added = False
+        self.groups_added: List[str] = []
+        self.inserted: List[Tuple[str, str]] = []
+        self.updated: List[Tuple[str, str]] = []
+        self.deleted: List[Tuple[str, str]] = []
+        self.unchanged = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.schedule_added or self.groups_added or self.inserted or self.updated or self.deleted)
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "schedule_added": int(self.schedule_added),
+            "groups_added": len(self.groups_added),
+            "inserted": len(self.inserted),
+            "updated": len(self.updated),
+            "deleted": len(self.deleted),
+            "unchanged": self.unchanged,
+        }
+
+    def __repr__(self) -> str:
+        return f"ChangeSet({self.date!r}, {self.counts()})"
+
+
+def _lesson_values(lesson: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (lesson['time'], lesson['subject'], lesson['teacher'], lesson['room'])
+
+
+def upsert_table(table: List[List[str]], conn: sqlite3.Connection) -> Optional[ChangeSet]:
+    """Сохранить таблицу в conn, записывая только отличия от БД.
+
+    conn — обычно открытая публикация: все таблицы документа пишутся в одно
+    поколение расписания (with publish_schedule() as conn).
+    Возвращает набор изменений или None, если таблицу не удалось разобрать
+    или сохранить. Группы, которых нет в таблице, не трогаются.
+    """
     if len(table) < 3:
-        return False
+        return None
     
     date, weekday = parse_date_from_row(table[0])
     if not date:
         print(f"Не удалось извлечь дату из: {table[0]}")
-        return False
+        return None
     
     print(f"Обрабатываем дату: {date} {weekday}")
     
@@ -143,8 +328,15 @@ def save_table_to_db(table: List[List[str]]) -> bool:
     
     print(f"Пары: {pairs}")
     print(f"Время: {times}")
-    
-    conn = sqlite3.connect(DB_PATH)
+
+    # Строки таблицы по группам; повторная строка группы заменяет предыдущую
+    incoming: Dict[str, List[Dict[str, Any]]] = {}
+    for row in table[3:]:
+        group_data = parse_group_row(row, pairs, times)
+        if group_data:
+            incoming[group_data['code']] = group_data['lessons']
+
+    changes = ChangeSet(date)
     cur = conn.cursor()
     
     try:
@@ -156,51 +348,80 @@ def save_table_to_db(table: List[List[str]]) -> bool:
         else:
             cur.execute("INSERT INTO schedules (date, weekday) VALUES (?, ?)", (date, weekday))
             schedule_id = cur.lastrowid
-        
-        for row in table[3:]:
-            group_data = parse_group_row(row, pairs, times)
-            if not group_data:
-                continue
-            
-            print(f"  Группа: {group_data['code']} ({len(group_data['lessons'])} занятий)")
-            
-            cur.execute("SELECT id FROM groups WHERE code = ? AND schedule_id = ?", (group_data['code'], schedule_id))
-            existing_group = cur.fetchone()
-            
-            if existing_group:
-                group_id = existing_group[0]
-                cur.execute("DELETE FROM lessons WHERE group_id = ?", (group_id,))
+            changes.schedule_added = True
+
+        group_ids = dict(cur.execute(
+            "SELECT code, MIN(id) FROM groups WHERE schedule_id = ? GROUP BY code", (schedule_id,)
+        ).fetchall())
+        stored: Dict[str, Dict[str, Tuple[Any, ...]]] = {}
+        duplicates: List[int] = []
+        for lesson_id, code, pair, time_slot, subject, teacher, room in cur.execute("""
+            SELECT l.id, g.code, l.pair_number, l.time_slot, l.subject, l.teacher, l.room
+            FROM lessons l
+            JOIN groups g ON g.id = l.group_id
+            WHERE g.schedule_id = ?
+            ORDER BY l.id
+        """, (schedule_id,)).fetchall():
+            by_pair = stored.setdefault(code, {})
+            if pair in by_pair:
+                # Дубликаты пары из старых загрузок — оставляем первое занятие
+                duplicates.append(lesson_id)
             else:
-                cur.execute("INSERT INTO groups (code, schedule_id) VALUES (?, ?)", (group_data['code'], schedule_id))
+                by_pair[pair] = (lesson_id, time_slot, subject, teacher, room)
+
+        inserts = []
+        updates = []
+        deletes = duplicates[:]
+        for code, lessons in incoming.items():
+            print(f"  Группа: {code} ({len(lessons)} занятий)")
+            group_id = group_ids.get(code)
+            if group_id is None:
+                cur.execute("INSERT INTO groups (code, schedule_id) VALUES (?, ?)", (code, schedule_id))
                 group_id = cur.lastrowid
-            
-            for lesson in group_data['lessons']:
-                cur.execute("""
-                    INSERT INTO lessons (group_id, pair_number, time_slot, subject, teacher, room)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    group_id,
-                    lesson['pair'],
-                    lesson['time'],
-                    lesson['subject'],
-                    lesson['teacher'],
-                    lesson['room']
-                ))
-        
+                changes.groups_added.append(code)
+
+            old = stored.get(code, {})
+            for lesson in lessons:
+                key = (code, lesson['pair'])
+                current = old.pop(lesson['pair'], None)
+                values = _lesson_values(lesson)
+                norms = (normalize_teacher(lesson['teacher']), normalize_room(lesson['room']))
+                if current is None:
+                    inserts.append((group_id, lesson['pair'], *values, *norms))
+                    changes.inserted.append(key)
+                elif current[1:] != values:
+                    updates.append((*values, *norms, current[0]))
+                    changes.updated.append(key)
+                else:
+                    changes.unchanged += 1
+            for pair, current in old.items():
+                deletes.append(current[0])
+                changes.deleted.append((code, pair))
+
+        cur.executemany("""
+            INSERT INTO lessons (group_id, pair_number, time_slot, subject, teacher, room, teacher_norm, room_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, inserts)
+        cur.executemany("""
+            UPDATE lessons SET time_slot = ?, subject = ?, teacher = ?, room = ?, teacher_norm = ?, room_norm = ?
+            WHERE id = ?
+        """, updates)
+        cur.executemany("DELETE FROM lessons WHERE id = ?", [(lesson_id,) for lesson_id in deletes])
+
+        if changes.changed:
+            bump_data_version(cur)
         conn.commit()
-        print(f"✓ Сохранено расписание для {date}")
-        return True
+        print(f"✓ Сохранено расписание для {date}: {changes.counts()}")
+        return changes
         
     except Exception as e:
         print(f"Ошибка при сохранении: {e}")
         conn.rollback()
-        return False
-    finally:
-        conn.close()
+        return None
 
 
 def get_all_groups() -> List[str]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_schedule()
     cur = conn.cursor()
     
     cur.execute("SELECT DISTINCT code FROM groups ORDER BY code")
@@ -211,7 +432,7 @@ def get_all_groups() -> List[str]:
 
 
 def get_schedule_for_group(group_code: str) -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_schedule()
     cur = conn.cursor()
     
     cur.execute("""
@@ -241,8 +462,293 @@ def get_schedule_for_group(group_code: str) -> List[Dict[str, Any]]:
     return lessons
 
 
+def _read_all_lessons(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    cur = conn.cursor()
+    
+    cur.execute("""
+        SELECT 
+            g.code, s.date, s.weekday,
+            l.pair_number, l.time_slot, l.subject, l.teacher, l.room
+        FROM lessons l
+        JOIN groups g ON g.id = l.group_id
+        JOIN schedules s ON s.id = g.schedule_id
+        ORDER BY g.code, s.date, l.time_slot
+    """)
+    
+    lessons = []
+    for row in cur.fetchall():
+        lessons.append({
+            "group": row[0],
+            "date": row[1],
+            "weekday": row[2],
+            "pair": row[3],
+            "time": row[4],
+            "subject": row[5],
+            "teacher": row[6],
+            "room": row[7]
+        })
+    return lessons
+
+
+def get_all_lessons() -> List[Dict[str, Any]]:
+    conn = connect_schedule()
+    try:
+        return _read_all_lessons(conn)
+    finally:
+        conn.close()
+
+
+def get_all_lessons_with_version() -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """Счётчик данных и все занятия из одного поколения расписания"""
+    conn = connect_schedule()
+    try:
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT value FROM schedule_meta WHERE key = 'data_version'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        return (row[0] if row else None), _read_all_lessons(conn)
+    finally:
+        conn.close()
+
+
+def get_groups_for_date(date: str) -> List[str]:
+    conn = connect_schedule()
+    cur = conn.cursor()
+    
+    cur.execute("""
+        SELECT DISTINCT g.code
+        FROM groups g
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE s.date = ?
+          AND EXISTS (SELECT 1 FROM lessons l WHERE l.group_id = g.id)
+        ORDER BY g.code
+    """, (date,))
+    groups = [row[0] for row in cur.fetchall()]
+    
+    conn.close()
+    return groups
+
+
+def get_lessons_for_group_on_date(group_code: str, date: str) -> List[Dict[str, Any]]:
+    conn = connect_schedule()
+    cur = conn.cursor()
+    
+    cur.execute("""
+        SELECT 
+            s.date, s.weekday,
+            l.pair_number, l.time_slot, l.subject, l.teacher, l.room
+        FROM lessons l
+        JOIN groups g ON g.id = l.group_id
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE g.code = ? AND s.date = ?
+        ORDER BY l.time_slot
+    """, (group_code, date))
+    
+    lessons = []
+    for row in cur.fetchall():
+        lessons.append({
+            "date": row[0],
+            "weekday": row[1],
+            "pair": row[2],
+            "time": row[3],
+            "subject": row[4],
+            "teacher": row[5],
+            "room": row[6]
+        })
+    
+    conn.close()
+    return lessons
+
+
+def build_fts_query(text: str) -> Optional[str]:
+    """Запрос FTS5 из пользовательского ввода: все слова по префиксу"""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_lessons(text: str, limit: int = 20) -> List[Dict[str, Any]]:
+    fts_query = build_fts_query(text)
+    if fts_query is None:
+        return []
+
+    conn = connect_schedule()
+    cur = conn.cursor()
+    
+    cur.execute("""
+        SELECT 
+            s.date, s.weekday, g.code,
+            l.pair_number, l.time_slot, l.subject, l.teacher, l.room
+        FROM lessons_fts f
+        JOIN lessons l ON l.id = f.rowid
+        JOIN groups g ON g.id = l.group_id
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE lessons_fts MATCH ?
+        ORDER BY bm25(lessons_fts), s.date, l.time_slot
+        LIMIT ?
+    """, (fts_query, limit))
+    
+    results = []
+    for row in cur.fetchall():
+        results.append({
+            "date": row[0],
+            "weekday": row[1],
+            "group": row[2],
+            "pair": row[3],
+            "time": row[4],
+            "subject": row[5],
+            "teacher": row[6],
+            "room": row[7]
+        })
+    
+    conn.close()
+    return results
+
+
+def find_teacher_ids(text: str, limit: int = 20) -> List[Tuple[int, str]]:
+    """Преподаватели, чья нормализованная фамилия начинается с text,
+    вместе с id одного из их занятий"""
+    prefix = normalize_teacher(text)
+    if not prefix:
+        return []
+
+    conn = connect_schedule()
+    cur = conn.cursor()
+    
+    # Диапазон вместо LIKE, чтобы работал индекс idx_lessons_teacher_norm
+    cur.execute("""
+        SELECT teacher_norm, MIN(id), MIN(teacher)
+        FROM lessons
+        WHERE teacher_norm >= ? AND teacher_norm < ?
+        GROUP BY teacher_norm
+        ORDER BY teacher_norm
+        LIMIT ?
+    """, (prefix, prefix + "\uffff", limit))
+    teachers = [(row[1], row[2]) for row in cur.fetchall()]
+    
+    conn.close()
+    return teachers
+
+
+def get_lesson_teacher(lesson_id: int) -> Optional[str]:
+    """Преподаватель занятия по первичному ключу"""
+    conn = connect_schedule()
+    row = conn.execute("SELECT teacher FROM lessons WHERE id = ?", (lesson_id,)).fetchone()
+    conn.close()
+    return row[0] if row and row[0] else None
+
+
+def _lessons_where(condition: str, params: tuple) -> List[Dict[str, Any]]:
+    conn = connect_schedule()
+    cur = conn.cursor()
+    
+    cur.execute(f"""
+        SELECT 
+            s.date, s.weekday, g.code,
+            l.pair_number, l.time_slot, l.subject, l.teacher, l.room
+        FROM lessons l
+        JOIN groups g ON g.id = l.group_id
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE {condition}
+        ORDER BY s.date, l.time_slot
+    """, params)
+    
+    lessons = []
+    for row in cur.fetchall():
+        lessons.append({
+            "date": row[0],
+            "weekday": row[1],
+            "group": row[2],
+            "pair": row[3],
+            "time": row[4],
+            "subject": row[5],
+            "teacher": row[6],
+            "room": row[7]
+        })
+    
+    conn.close()
+    return lessons
+
+
+def get_schedule_for_teacher(teacher: str) -> List[Dict[str, Any]]:
+    return _lessons_where("l.teacher_norm = ?", (normalize_teacher(teacher),))
+
+
+def get_schedule_for_room(room: str) -> List[Dict[str, Any]]:
+    return _lessons_where("l.room_norm = ?", (normalize_room(room),))
+
+
+def get_all_schedules() -> List[Tuple[int, str]]:
+    """Пары (id расписания, дата)"""
+    conn = connect_schedule()
+    rows = conn.execute("SELECT id, date FROM schedules ORDER BY date").fetchall()
+    conn.close()
+    return [(row[0], row[1]) for row in rows]
+
+
+def get_schedule_by_id(schedule_id: int) -> Optional[Dict[str, Any]]:
+    conn = connect_schedule()
+    row = conn.execute("SELECT id, date, weekday FROM schedules WHERE id = ?", (schedule_id,)).fetchone()
+    conn.close()
+    return {"id": row[0], "date": row[1], "weekday": row[2]} if row else None
+
+
+def get_group_ids() -> List[Tuple[int, str]]:
+    """Для каждой группы — id одной из её строк в groups"""
+    conn = connect_schedule()
+    rows = conn.execute("SELECT MIN(id), code FROM groups GROUP BY code ORDER BY code").fetchall()
+    conn.close()
+    return [(row[0], row[1]) for row in rows]
+
+
+def get_groups_for_schedule(schedule_id: int) -> List[Tuple[int, str]]:
+    """Группы с занятиями в расписании: пары (id группы на дату, код)"""
+    conn = connect_schedule()
+    rows = conn.execute("""
+        SELECT g.id, g.code
+        FROM groups g
+        WHERE g.schedule_id = ?
+          AND EXISTS (SELECT 1 FROM lessons l WHERE l.group_id = g.id)
+        ORDER BY g.code
+    """, (schedule_id,)).fetchall()
+    conn.close()
+    return [(row[0], row[1]) for row in rows]
+
+
+def get_group_dates(group_code: str) -> List[Tuple[int, str]]:
+    """Даты с занятиями группы: пары (id группы на дату, дата)"""
+    conn = connect_schedule()
+    rows = conn.execute("""
+        SELECT g.id, s.date
+        FROM groups g
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE g.code = ?
+          AND EXISTS (SELECT 1 FROM lessons l WHERE l.group_id = g.id)
+        ORDER BY s.date
+    """, (group_code,)).fetchall()
+    conn.close()
+    return [(row[0], row[1]) for row in rows]
+
+
+def get_group_by_id(group_id: int) -> Optional[Dict[str, Any]]:
+    """Группа на дату по первичному ключу"""
+    conn = connect_schedule()
+    row = conn.execute("""
+        SELECT g.id, g.code, s.id, s.date, s.weekday
+        FROM groups g
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE g.id = ?
+    """, (group_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return {"id": row[0], "code": row[1], "schedule_id": row[2], "date": row[3], "weekday": row[4]}
+
+
 def get_all_dates() -> List[str]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_schedule()
     cur = conn.cursor()
     
     cur.execute("SELECT date FROM schedules ORDER BY date")
@@ -266,13 +772,14 @@ def main():
         tables = doc.get_tables()
         print(f"Найдено таблиц: {len(tables)}")
         
-        for i, table in enumerate(tables):
-            print(f"\nТаблица {i+1} ")
-            success = save_table_to_db(table)
-            if success:
-                print(f"✓ Таблица {i+1} обработана")
-            else:
-                print(f"✗ Ошибка в таблице {i+1}")
+        # Документ публикуется одним поколением
+        with publish_schedule() as conn:
+            for i, table in enumerate(tables):
+                print(f"\nТаблица {i+1} ")
+                if upsert_table(table, conn) is not None:
+                    print(f"✓ Таблица {i+1} обработана")
+                else:
+                    print(f"✗ Ошибка в таблице {i+1}")
     
     print("\n Парсинг завершен ")
     
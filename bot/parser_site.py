@@ -1,64 +1,354 @@
-import aiohttp
 import asyncio
+import hashlib
+import json
 import os
-import shutil
-from bs4 import BeautifulSoup
+import time
 from datetime import datetime, timedelta
+from html.parser import HTMLParser
 from pathlib import Path
 from urllib.parse import urljoin
-from aiogram import Bot
-from typing import Tuple
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
 
 from .admin_auth import ADMIN_IDS
 from .config import load_token
+from .metrics import DOWNLOAD_SECONDS, DOWNLOAD_BYTES
 
-bot_instance = Bot(token=load_token())
+# aiohttp, aiofiles и aiogram импортируются при первой загрузке или отправке:
+# модуль подключают CLI, тесты и планировщик, которым они не нужны
+if TYPE_CHECKING:
+    import aiohttp
+    from aiogram import Bot
 
-async def download_schedule_by_link_text(url, callback, admin_notify, bot_instance, date_str):
-    tomorrow = datetime.now() + timedelta(days=1)
-    tomorrow_day_str = str(tomorrow.day)
+# Валидаторы (ETag/Last-Modified) и кэш страниц между запусками бота
+DOWNLOAD_STATE_PATH = Path(__file__).with_name("download_state.json")
+DOWNLOAD_CACHE_DIR = Path(__file__).parent / "download_cache"
+DOWNLOADS_DIR = Path(__file__).parent / "downloads"
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                await admin_notify(f"Ошибка при загрузке страницы: {resp.status}", bot_instance)
-                return
-            html = await resp.text()
+SCHEDULE_PAGE_URL = "http://egorlyk-college.ru/%d1%80%d0%b0%d1%81%d0%bf%d0%b8%d1%81%d0%b0%d0%bd%d0%b8%d0%b5/"
 
-    soup = BeautifulSoup(html, "html.parser")
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Параметры aiohttp.ClientTimeout для загрузок, секунды
+DOWNLOAD_TIMEOUT = {"total": 120, "connect": 10, "sock_read": 30}
 
-    link_tag = None
-    for a in soup.find_all("a", href=True):
-        if a.get_text(strip=True) == tomorrow_day_str:
-            link_tag = a
-            break
 
-    if not link_tag:
-        await admin_notify(f"Ссылка с текстом '{tomorrow_day_str}' не найдена на странице", bot_instance)
-        return
+class DownloadError(Exception):
+    pass
+
+
+class FetchResult:
+    """Результат условного запроса: путь к телу ответа и признак изменения.
+
+    validators — ETag/Last-Modified нового файла, ещё не сохранённые в
+    состоянии (загрузка с commit=False): их сохраняет commit() после того,
+    как файл успешно обработан.
+    """
+
+    def __init__(self, url: str, path: Optional[Path], modified: bool, size: int = 0,
+                 validators: Optional[Dict[str, str]] = None):
+        self.url = url
+        self.path = path
+        self.modified = modified
+        self.size = size
+        self.validators = validators
+
+
+class ScheduleDownloader:
+    """HTTP-клиент сайта колледжа с общим пулом соединений и условными запросами"""
+
+    def __init__(self, state_path: Path = DOWNLOAD_STATE_PATH, cache_dir: Path = DOWNLOAD_CACHE_DIR,
+                 max_bytes: int = MAX_DOWNLOAD_BYTES, timeout: Optional["aiohttp.ClientTimeout"] = None,
+                 pool_size: int = 4):
+        self.state_path = state_path
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._state: Dict[str, Dict[str, str]] = self._load_state()
+        self._links: Dict[str, Dict[str, str]] = {}
+        self.links_cache_hits = 0
+
+    def _load_state(self) -> Dict[str, Dict[str, str]]:
+        try:
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _update_state(self, url: str, entry: Optional[Dict[str, str]]) -> None:
+        """Записать (None — удалить) запись url поверх состояния на диске.
+
+        Файл общий для процессов бота: перечитывается перед записью, чтобы
+        не затереть то, что сохранил другой процесс.
+        """
+        state = self._load_state()
+        if entry is None:
+            state.pop(url, None)
+        else:
+            state[url] = entry
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.state_path)
+        self._state = state
+
+    def commit(self, result: FetchResult) -> None:
+        """Сохранить валидаторы файла, скачанного с commit=False, — он обработан"""
+        if result.modified and result.validators:
+            self._update_state(result.url, {**result.validators, "path": str(result.path)})
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            timeout = self.timeout or aiohttp.ClientTimeout(**DOWNLOAD_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _conditional_headers(self, url: str, path: Optional[Path]) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        entry = self._state.get(url)
+        # Без сохранённой копии условный запрос бесполезен
+        if not entry or path is None or not path.exists():
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def fetch_to_file(self, url: str, target: Path, kind: str = "file", commit: bool = True) -> FetchResult:
+        """Скачать url в target потоково; при 304 файл не трогается.
+
+        commit=False — валидаторы нового файла не сохраняются до commit(result):
+        если обработать файл не удастся, следующая проверка скачает его снова.
+        """
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await self._fetch_to_file(url, target, commit)
+            status = "modified" if result.modified else "not_modified"
+            DOWNLOAD_BYTES.inc(result.size if result.modified else 0, kind)
+            return result
+        finally:
+            DOWNLOAD_SECONDS.observe(time.perf_counter() - started, kind, status)
+
+    async def _fetch_to_file(self, url: str, target: Path, commit: bool, retry: bool = True) -> FetchResult:
+        # Другой процесс мог скачать файл, пока этот ждал блокировку проверки
+        self._state = self._load_state()
+        entry = self._state.get(url, {})
+        previous = Path(entry["path"]) if entry.get("path") else None
+        headers = self._conditional_headers(url, previous)
+
+        async with self._get_session().get(url, headers=headers) as resp:
+            if resp.status == 304:
+                if headers and previous.exists():
+                    return FetchResult(url, previous, modified=False, size=previous.stat().st_size)
+                # 304 не к чему применить (копию удалили или валидаторы не отправлялись)
+                stale = True
+            else:
+                stale = False
+                size = await self._receive(url, resp, target)
+        if stale:
+            self._update_state(url, None)
+            if not retry:
+                raise DownloadError(f"HTTP 304 без сохранённой копии для {url}")
+            return await self._fetch_to_file(url, target, commit, retry=False)
+
+        validators = {
+            "etag": resp.headers.get("ETag", ""),
+            "last_modified": resp.headers.get("Last-Modified", ""),
+        }
+        # Без валидаторов следующая проверка не сможет получить 304 и скачает файл заново
+        self._update_state(url, {**(validators if commit else {}), "path": str(target)})
+        return FetchResult(url, target, modified=True, size=size, validators=None if commit else validators)
+
+    async def _receive(self, url: str, resp: "aiohttp.ClientResponse", target: Path) -> int:
+        """Потоково записать тело ответа в target; возвращает размер"""
+        if resp.status != 200:
+            raise DownloadError(f"HTTP {resp.status} для {url}")
+        if resp.content_length is not None and resp.content_length > self.max_bytes:
+            raise DownloadError(f"Файл слишком большой: {resp.content_length} байт")
+
+        import aiofiles
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        part_path = target.with_name(target.name + ".part")
+        size = 0
+        try:
+            async with aiofiles.open(part_path, "wb") as f:
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise DownloadError(f"Файл превысил лимит {self.max_bytes} байт")
+                    await f.write(chunk)
+            os.replace(part_path, target)
+        finally:
+            if part_path.exists():
+                part_path.unlink()
+        return size
+
+    async def fetch_links(self, url: str) -> Dict[str, str]:
+        """Ссылки страницы; разбор выполняется один раз на версию страницы"""
+        html, modified = await self.fetch_page(url)
+        cached = self._links.get(url)
+        if cached is not None and not modified:
+            self.links_cache_hits += 1
+            return cached
+        links = extract_links(html)
+        self._links[url] = links
+        return links
+
+    async def fetch_page(self, url: str) -> Tuple[str, bool]:
+        """Текст страницы и признак того, что она изменилась с прошлого запроса"""
+        cache_name = hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html"
+        result = await self.fetch_to_file(url, self.cache_dir / cache_name, kind="page")
+        import aiofiles
+
+        async with aiofiles.open(result.path, "rb") as f:
+            html = (await f.read()).decode("utf-8", errors="replace")
+        return html, result.modified
+
+
+_downloader: Optional[ScheduleDownloader] = None
+
+
+def get_downloader() -> ScheduleDownloader:
+    global _downloader
+    if _downloader is None:
+        _downloader = ScheduleDownloader()
+    return _downloader
+
+
+async def close_downloader() -> None:
+    if _downloader is not None:
+        await _downloader.close()
+
+
+class AnchorExtractor(HTMLParser):
+    """Однопроходный сбор ссылок <a href> страницы без построения дерева"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: Dict[str, str] = {}
+        self._href: Optional[str] = None
+        self._text: list = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self._href = dict(attrs).get("href") or None
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._href is not None:
+            # Как get_text(strip=True) у BeautifulSoup; первая ссылка с таким текстом побеждает
+            self.links.setdefault("".join(self._text), self._href)
+            self._href = None
+
+    def handle_data(self, data):
+        if self._href is not None:
+            stripped = data.strip()
+            if stripped:
+                self._text.append(stripped)
+
+
+def extract_links(html: str) -> Dict[str, str]:
+    """Словарь «текст ссылки → href»"""
+    extractor = AnchorExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.links
+
+
+async def fetch_schedule_links(url: str) -> Dict[str, str]:
+    import aiohttp
+
+    try:
+        return await get_downloader().fetch_links(url)
+    except (DownloadError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise DownloadError(f"Ошибка при загрузке страницы: {e}") from e
+
+
+async def fetch_schedule_for_day(url: str, day: datetime, links: Optional[Dict[str, str]] = None) -> FetchResult:
+    """Скачать файл расписания, ссылка на который подписана номером дня"""
+    import aiohttp
+
+    downloader = get_downloader()
+    day_str = str(day.day)
+
+    if links is None:
+        links = await fetch_schedule_links(url)
+
+    href = links.get(day_str)
+    if not href:
+        raise LookupError(f"Ссылка с текстом '{day_str}' не найдена на странице")
 
-    href = link_tag["href"]
     file_url = href if href.startswith("http") else urljoin(url, href)
+    file_path = DOWNLOADS_DIR / os.path.basename(file_url)
+
+    try:
+        # Валидаторы сохраняет вызывающий после успешной загрузки в БД (commit_download)
+        return await downloader.fetch_to_file(file_url, file_path, commit=False)
+    except (DownloadError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise DownloadError(f"Ошибка загрузки файла: {e}") from e
 
-    filename = os.path.basename(file_url)
-    file_path = Path(filename)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(file_url) as resp:
-            if resp.status != 200:
-                await admin_notify(f"Ошибка загрузки файла: {resp.status}", bot_instance)
-                return
-            content = await resp.read()
+def commit_download(result: FetchResult) -> None:
+    """Файл расписания загружен в БД — повторная проверка может получить 304"""
+    get_downloader().commit(result)
+
+
+async def download_schedule_by_link_text(url, callback, admin_notify, bot_instance, date_str, day: Optional[datetime] = None):
+    tomorrow = day or datetime.now() + timedelta(days=1)
+
+    try:
+        result = await fetch_schedule_for_day(url, tomorrow)
+    except (DownloadError, LookupError) as e:
+        await admin_notify(str(e), bot_instance)
+        return
 
-    with open(file_path, "wb") as f:
-        f.write(content)
+    filename = result.path.name
+    if not result.modified:
+        print(f"Файл {filename} не изменился с прошлой проверки")
+        await admin_notify(f"♻️ Файл {filename} не изменился", bot_instance)
+        return
 
     print(f"Файл {filename} ({tomorrow.strftime('%d %B %Y')}) успешно скачан ✅")
 
-    success, msg = await callback(file_path, date_str)
+    # callback сохраняет и разбирает файл; при ошибке валидаторы не сохраняются,
+    # и следующая проверка скачает файл заново
+    success, msg = await callback(result.path, date_str)
+    if success:
+        commit_download(result)
     await admin_notify(msg, bot_instance)
 
-async def admin_notify(message: str, bot: Bot = bot_instance):
+_bot_instance: Optional["Bot"] = None
+
+
+def get_bot_instance() -> "Bot":
+    """Бот для уведомлений вне хендлеров; создаётся при первом обращении"""
+    global _bot_instance
+    if _bot_instance is None:
+        from aiogram import Bot
+
+        _bot_instance = Bot(token=load_token())
+    return _bot_instance
+
+
+def __getattr__(name: str):
+    # Совместимость со старым импортом: from .parser_site import bot_instance
+    if name == "bot_instance":
+        return get_bot_instance()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def admin_notify(message: str, bot: Optional["Bot"] = None):
+    bot = bot or get_bot_instance()
     for admin_id in ADMIN_IDS:
         try:
             await bot.send_message(chat_id=admin_id, text=message)
@@ -67,7 +357,7 @@ async def admin_notify(message: str, bot: Bot = bot_instance):
 
 
 async def some_func():
-    await admin_notify("test", bot_instance)
+    await admin_notify("test")
 
 async def main():
     await some_func()
@@ -0,0 +1,207 @@
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import generations, manifest, parser
+from .config import load_int_setting
+
+# Процессов для разбора документов; 0 — по числу ядер
+REBUILD_WORKERS = load_int_setting("REBUILD_WORKERS", 0)
+
+Tables = List[List[List[str]]]
+
+
+def parse_document(path: str) -> Tables:
+    """Таблицы документа. Выполняется в процессе-воркере."""
+    with parser.WordParser(path) as doc:
+        return doc.get_tables()
+
+
+def _documents() -> List[Tuple[str, Path]]:
+    """Уникальные по содержимому файлы манифеста — от сохранённых раньше к позже"""
+    from .file_manager import SCHEDULE_FILES_DIR
+
+    rows = sorted(manifest.list_files(), key=lambda row: row["stored_at"])
+    documents: Dict[str, Path] = {}
+    for row in rows:
+        # Повторное содержимое переставляется в конец: загружено позже остальных
+        documents.pop(row["content_hash"], None)
+        documents[row["content_hash"]] = SCHEDULE_FILES_DIR / row["path"]
+    return list(documents.items())
+
+
+def parse_documents(paths: List[Path], workers: int) -> List[Optional[Tables]]:
+    """Разобрать документы в пуле процессов; None — документ не разобрался"""
+    results: List[Optional[Tables]] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_document, str(path)) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logging.error(f"Пересборка: не удалось разобрать {path.name}: {e}")
+                results.append(None)
+    return results
+
+
+def merge_tables(documents: List[Tables]) -> Dict[str, Tuple[Optional[str], Dict[str, List[Dict[str, Any]]]]]:
+    """Дата → (день недели, группа → занятия) с теми же правилами, что у upsert_table:
+    более поздняя строка группы заменяет её занятия целиком, прочие группы остаются"""
+    merged: Dict[str, Tuple[Optional[str], Dict[str, List[Dict[str, Any]]]]] = {}
+    for tables in documents:
+        for table in tables:
+            if len(table) < 3:
+                continue
+            date, weekday = parser.parse_date_from_row(table[0])
+            if not date:
+                continue
+            pairs = parser.parse_pairs_from_row(table[1])
+            times = parser.parse_times_from_row(table[2])
+            previous_weekday, groups = merged.get(date, (weekday, {}))
+            for row in table[3:]:
+                group_data = parser.parse_group_row(row, pairs, times)
+                if group_data:
+                    groups[group_data['code']] = group_data['lessons']
+            merged[date] = (previous_weekday or weekday, groups)
+    return merged
+
+
+def build_database(conn: sqlite3.Connection, merged, source: Optional[Path]) -> Dict[str, int]:
+    """Записать расписание в пустую БД conn; из source (прежнее поколение)
+    берутся даты загрузки, счётчик данных и id совпадающих дат, групп и занятий"""
+    cur = conn.cursor()
+    parser.init_schema(cur)
+    parser.init_lookup_indexes(cur)
+    parser.init_data_version(cur)
+
+    created: Dict[str, str] = {}
+    old_version = 0
+    # id прежнего поколения: их несут кнопки уже отправленных сообщений
+    schedule_ids: Dict[str, int] = {}
+    group_ids: Dict[Tuple[str, str], int] = {}
+    lesson_ids: Dict[Tuple[str, str, str], int] = {}
+    if source is not None:
+        cur.execute("ATTACH DATABASE ? AS old", (str(source),))
+        old_tables = {name for (name,) in cur.execute("SELECT name FROM old.sqlite_master WHERE type = 'table'")}
+        # Дата загрузки даты нужна архиву, чтобы восстановить год
+        if "schedules" in old_tables:
+            for schedule_id, date, created_at in cur.execute("SELECT id, date, created_at FROM old.schedules"):
+                schedule_ids[date] = schedule_id
+                created[date] = created_at
+        if {"schedules", "groups", "lessons"} <= old_tables:
+            group_ids = {(date, code): group_id for group_id, date, code in cur.execute(
+                "SELECT g.id, s.date, g.code FROM old.groups g JOIN old.schedules s ON s.id = g.schedule_id")}
+            lesson_ids = {(date, code, pair): lesson_id for lesson_id, date, code, pair in cur.execute("""
+                SELECT l.id, s.date, g.code, l.pair_number FROM old.lessons l
+                JOIN old.groups g ON g.id = l.group_id
+                JOIN old.schedules s ON s.id = g.schedule_id
+            """)}
+        if "sqlite_sequence" in old_tables:
+            # Новые строки получают id больше всех прежних, а не занимают id удалённых
+            cur.execute("INSERT INTO sqlite_sequence (name, seq) SELECT name, seq FROM old.sqlite_sequence "
+                        "WHERE name IN ('schedules', 'groups', 'lessons')")
+        if "schedule_meta" in old_tables:
+            row = cur.execute("SELECT value FROM old.schedule_meta WHERE key = 'data_version'").fetchone()
+            old_version = row[0] if row else 0
+        conn.commit()
+        cur.execute("DETACH DATABASE old")
+
+    counts = {"schedules": 0, "groups": 0, "lessons": 0}
+    cur.execute("BEGIN")
+    for date, (weekday, groups) in merged.items():
+        if date in created:
+            cur.execute("INSERT INTO schedules (id, date, weekday, created_at) VALUES (?, ?, ?, ?)",
+                        (schedule_ids.get(date), date, weekday, created[date]))
+        else:
+            cur.execute("INSERT INTO schedules (date, weekday) VALUES (?, ?)", (date, weekday))
+        schedule_id = cur.lastrowid
+        counts["schedules"] += 1
+        for code, lessons in groups.items():
+            cur.execute("INSERT INTO groups (id, code, schedule_id) VALUES (?, ?, ?)",
+                        (group_ids.get((date, code)), code, schedule_id))
+            group_id = cur.lastrowid
+            counts["groups"] += 1
+            cur.executemany("""
+                INSERT INTO lessons (id, group_id, pair_number, time_slot, subject, teacher, room, teacher_norm, room_norm)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(lesson_ids.pop((date, code, lesson['pair']), None), group_id, lesson['pair'], lesson['time'],
+                   lesson['subject'], lesson['teacher'], lesson['room'],
+                   parser.normalize_teacher(lesson['teacher']), parser.normalize_room(lesson['room']))
+                  for lesson in lessons])
+            counts["lessons"] += len(lessons)
+    # Новый счётчик данных больше старого — снимки и кэши других процессов устареют
+    cur.execute("UPDATE schedule_meta SET value = ? WHERE key = 'data_version'", (old_version + 1,))
+    conn.commit()
+    # Индекс создаётся после загрузки и заполняется одним проходом
+    parser.init_search_index(cur)
+    conn.commit()
+    return counts
+
+
+def rebuild_database(workers: Optional[int] = None) -> Dict[str, float]:
+    """Пересобрать расписание из сохранённых файлов в новое поколение и опубликовать его.
+
+    Бот всё это время читает прежнее поколение. Версию расписания обновляет вызывающий.
+    """
+    workers = workers or REBUILD_WORKERS or os.cpu_count() or 1
+    documents = _documents()
+
+    started = time.perf_counter()
+    parsed = parse_documents([path for _, path in documents], workers)
+    parse_seconds = time.perf_counter() - started
+    failed = sum(tables is None for tables in parsed)
+    if documents and failed == len(documents):
+        raise RuntimeError("Ни один файл расписания не разобрался, БД не тронута")
+
+    loaded = time.perf_counter()
+    merged = merge_tables([tables for tables in parsed if tables])
+    with parser.publish_schedule(copy=False) as conn:
+        # Под блокировкой публикации текущее поколение не сменится
+        counts = build_database(conn, merged, generations.current_path(Path(parser.DB_PATH)))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "documents": len(documents) - failed,
+        "failed": failed,
+        "workers": workers,
+        **counts,
+        "parse_seconds": parse_seconds,
+        "load_seconds": time.perf_counter() - loaded,
+        "seconds": elapsed,
+        "docs_per_second": (len(documents) - failed) / elapsed if elapsed else 0.0,
+    }
+    logging.info(f"БД пересобрана: {report}")
+    return report
+
+
+def format_report(report: Dict[str, float]) -> str:
+    text = (
+        f"✅ БД пересобрана из {report['documents']} файлов за {report['seconds']:.1f} с "
+        f"({report['docs_per_second']:.1f} док/с, процессов: {report['workers']})\n"
+        f"📅 Дат: {report['schedules']}, групп: {report['groups']}, занятий: {report['lessons']}"
+    )
+    if report["failed"]:
+        text += f"\n⚠️ Не разобрано файлов: {report['failed']}"
+    return text
+
+
+def main() -> None:
+    import argparse
+
+    args = argparse.ArgumentParser(description="Пересборка расписания из сохранённых файлов")
+    args.add_argument("--workers", type=int, default=None)
+    options = args.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    from .file_manager import init_file_manifest
+
+    parser.init_db()
+    init_file_manifest()
+    print(format_report(rebuild_database(options.workers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import asyncio
+import html
+import logging
+import re
+from collections import defaultdict
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from .parser import get_all_lessons_with_version
+from .storage import get_schedule_version, get_schedule_for_group, get_lessons
+
+
+def extract_pair_number(pair: str) -> int:
+    if not pair:
+        return 999
+    match = re.match(r"(\d+)-(\d+)", pair)
+    if match:
+        start = int(match.group(1))
+        return (start + 1) // 2
+    return 999
+
+
+def format_time(time_str: str) -> str:
+    if not time_str:
+        return "—"
+
+    match = re.match(r"(\d{4})\s*–\s*(\d{4})", time_str)
+    if match:
+        start, end = match.groups()
+        try:
+            start_h = int(start[:2])
+            start_m = int(start[2:])
+            end_h = int(end[:2])
+            end_m = int(end[2:])
+
+            if 0 <= start_h <= 23 and 0 <= start_m <= 59 and 0 <= end_h <= 23 and 0 <= end_m <= 59:
+                return f"{start_h:02d}:{start_m:02d} - {end_h:02d}:{end_m:02d}"
+        except (ValueError, IndexError):
+            pass
+
+    return time_str
+
+
+def render_group_schedule(group_name: str, items: List[Dict[str, Any]]) -> str:
+    """Текст расписания группы по всем датам"""
+    by_date = defaultdict(list)
+    for it in items:
+        by_date[(it.get("date"), it.get("weekday"))].append(it)
+
+    lines = []
+
+    lines.append(f"🎓 <b>РАСПИСАНИЕ ГРУППЫ {group_name}</b>")
+    lines.append("━" * 30)
+
+    for (date, weekday), arr in by_date.items():
+        lines.append(f"\n📅 <b>{date or ''} {weekday or ''}</b>")
+        lines.append("─" * 25)
+
+        arr_sorted = sorted(arr, key=lambda x: extract_pair_number(x.get("pair", "")))
+
+        for it in arr_sorted:
+            pair = it.get("pair") or "—"
+            time = format_time(it.get("time", ""))
+            subj = it.get("subject") or ""
+            teacher = it.get("teacher") or ""
+            room = it.get("room") or ""
+
+            pair_num = extract_pair_number(pair)
+            if pair_num != 999:
+                pair_display = f"🔢 {pair_num} пара"
+            else:
+                pair_display = f"🔢 {pair}"
+
+            if room:
+                room_text = f"🏢 ауд. {room}"
+            else:
+                room_text = "🏢 ауд. не указана"
+
+            if teacher:
+                teacher_text = f"👨‍🏫 {teacher}"
+            else:
+                teacher_text = "👨‍🏫 не указан"
+
+            lines.append(f"{pair_display}")
+            lines.append(f"⏰ {time}")
+            lines.append(f"📚 <b>{subj}</b>")
+            lines.append(f"{teacher_text}")
+            lines.append(f"{room_text}")
+            lines.append("")
+
+    return "\n".join(lines) if lines else "📝 Нет занятий"
+
+
+def render_group_on_date(group: str, date: str, lessons: List[Dict[str, Any]]) -> str:
+    """Текст расписания группы на одну дату"""
+    lines = [f"📅 <b>{date}</b> | 🧩 <b>{group}</b>", "━"*30]
+    for l in sorted(lessons, key=lambda x: (x['pair'] or '999')):
+        lines.append(f"🔢 <b>{l['pair'] or '—'}</b>  ⏰ {l['time'] or '—'}")
+        lines.append(f"📚 <b>{l['subject']}</b>")
+        if l['teacher']:
+            lines.append(f"👨‍🏫 {l['teacher']}")
+        if l['room']:
+            lines.append(f"🏢 {l['room']}")
+        lines.append("─"*15)
+    return "\n".join(lines)
+
+
+def render_search_results(query: str, results: List[Dict[str, Any]]) -> str:
+    """Текст результатов поиска"""
+    if not results:
+        return f"🔍 По запросу «{html.escape(query)}» ничего не найдено."
+    lines = [f"🔍 <b>Поиск: {html.escape(query)}</b>", "━" * 30]
+    for r in results:
+        lines.append(f"📅 <b>{r['date']}</b> | 🧩 <b>{r['group']}</b> | 🔢 {r['pair'] or '—'}")
+        lines.append(f"📚 {html.escape(r['subject'] or '')}")
+        details = []
+        if r['teacher']:
+            details.append(f"👨‍🏫 {html.escape(r['teacher'])}")
+        if r['room']:
+            details.append(f"🏢 ауд. {html.escape(r['room'])}")
+        if details:
+            lines.append("  ".join(details))
+        lines.append("")
+    return "\n".join(lines)
+
+
+# Ограничение Telegram на длину одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Разбить длинный текст на сообщения по границам строк"""
+    parts: List[str] = []
+    current = ""
+    for line in text.split("\n"):
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit and current:
+            parts.append(current)
+            candidate = line
+        current = candidate[:limit]
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _render_by_date(header: str, lessons: List[Dict[str, Any]], detail) -> str:
+    by_date = defaultdict(list)
+    for lesson in lessons:
+        by_date[(lesson["date"], lesson["weekday"])].append(lesson)
+
+    lines = [header, "━" * 30]
+    for (date, weekday), arr in by_date.items():
+        lines.append(f"\n📅 <b>{date or ''} {weekday or ''}</b>")
+        lines.append("─" * 25)
+        for l in sorted(arr, key=lambda x: (x['pair'] or '999')):
+            lines.append(f"🔢 <b>{l['pair'] or '—'}</b>  ⏰ {l['time'] or '—'}")
+            lines.append(f"📚 <b>{html.escape(l['subject'] or '')}</b>")
+            lines.append(detail(l))
+            lines.append("")
+    return "\n".join(lines)
+
+
+def render_teacher_schedule(teacher: str, lessons: List[Dict[str, Any]]) -> str:
+    """Текст расписания преподавателя"""
+    return _render_by_date(
+        f"👨‍🏫 <b>РАСПИСАНИЕ: {html.escape(teacher)}</b>",
+        lessons,
+        lambda l: f"🧩 {l['group']}  🏢 ауд. {html.escape(l['room']) if l['room'] else 'не указана'}",
+    )
+
+
+def render_room_schedule(room: str, lessons: List[Dict[str, Any]]) -> str:
+    """Текст занятости аудитории"""
+    return _render_by_date(
+        f"🏢 <b>АУДИТОРИЯ {html.escape(room)}</b>",
+        lessons,
+        lambda l: f"🧩 {l['group']}  👨‍🏫 {html.escape(l['teacher']) if l['teacher'] else 'не указан'}",
+    )
+
+
+class RenderedSchedule:
+    """Готовые тексты сообщений для одной версии расписания"""
+
+    def __init__(self, version: int, by_group: Dict[str, str], by_group_date: Dict[Tuple[str, str], str],
+                 data_version: Optional[int] = None):
+        self.version = version
+        self.by_group = by_group
+        self.by_group_date = by_group_date
+        # Счётчик данных БД, по которому собраны сообщения: общий для всех процессов бота
+        self.data_version = data_version
+
+
+_rendered = RenderedSchedule(-1, {}, {})
+_rendered_listeners: List[Callable[[RenderedSchedule], None]] = []
+
+# Фоновая сборка сообщений: последняя запрошенная версия и задача, которая её собирает
+_pending_version: Optional[int] = None
+_build_task: Optional[asyncio.Task] = None
+
+
+def build_rendered(version: int) -> RenderedSchedule:
+    """Отрисовать все сообщения по текущему содержимому БД"""
+    by_group_items: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    by_group_date_items: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+    data_version, lessons = get_all_lessons_with_version()
+    for lesson in lessons:
+        by_group_items[lesson["group"]].append(lesson)
+        by_group_date_items[(lesson["group"], lesson["date"])].append(lesson)
+
+    by_group = {group: render_group_schedule(group, items) for group, items in by_group_items.items()}
+    by_group_date = {
+        (group, date): render_group_on_date(group, date, items)
+        for (group, date), items in by_group_date_items.items()
+    }
+    return RenderedSchedule(version, by_group, by_group_date, data_version)
+
+
+def add_rendered_listener(listener: Callable[[RenderedSchedule], None]) -> None:
+    """Подписаться на подстановку новых готовых сообщений"""
+    if listener not in _rendered_listeners:
+        _rendered_listeners.append(listener)
+
+
+def remove_rendered_listener(listener: Callable[[RenderedSchedule], None]) -> None:
+    if listener in _rendered_listeners:
+        _rendered_listeners.remove(listener)
+
+
+def install_rendered(rendered: RenderedSchedule) -> None:
+    """Подставить готовые сообщения (собранные или из снимка) и оповестить подписчиков"""
+    global _rendered
+    _rendered = rendered
+    for listener in list(_rendered_listeners):
+        try:
+            listener(rendered)
+        except Exception as e:
+            logging.error(f"Ошибка обработчика готовых сообщений {listener!r}: {e}")
+
+
+def _install_built(rendered: RenderedSchedule) -> None:
+    install_rendered(rendered)
+    logging.info(
+        f"Сообщения расписания v{rendered.version}: {len(rendered.by_group)} групп, "
+        f"{len(rendered.by_group_date)} групп/дат"
+    )
+
+
+def materialize_rendered(version: int) -> None:
+    """Обработчик смены версии: пересобрать готовые сообщения.
+
+    В работающем цикле событий сборка идёт в пуле потоков, а до её окончания
+    current_rendered() отдаёт None и ответы отрисовываются по запросу.
+    """
+    global _pending_version, _build_task
+    if _rendered.version == version:
+        # Уже подставлены из снимка
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _install_built(build_rendered(version))
+        return
+    _pending_version = version
+    if _build_task is None or _build_task.done():
+        _build_task = loop.create_task(_build_in_background())
+
+
+async def _build_in_background() -> None:
+    global _pending_version
+    loop = asyncio.get_running_loop()
+    while _pending_version is not None:
+        version, _pending_version = _pending_version, None
+        try:
+            rendered = await loop.run_in_executor(None, build_rendered, version)
+        except Exception as e:
+            logging.error(f"Ошибка сборки сообщений расписания v{version}: {e}")
+            continue
+        # Пока шла сборка, версия могла смениться — устаревший результат не подставляем
+        if version == get_schedule_version():
+            _install_built(rendered)
+
+
+async def join_rendered() -> None:
+    """Дождаться фоновой сборки готовых сообщений"""
+    if _build_task is not None:
+        await asyncio.gather(_build_task, return_exceptions=True)
+
+
+def current_rendered() -> Optional[RenderedSchedule]:
+    """Готовые сообщения, если они соответствуют текущей версии расписания"""
+    rendered = _rendered
+    if rendered.version == get_schedule_version():
+        return rendered
+    return None
+
+
+def get_group_text(group: str) -> Optional[str]:
+    """Готовый текст расписания группы или None, если занятий нет"""
+    rendered = current_rendered()
+    if rendered is not None:
+        return rendered.by_group.get(group)
+    items = get_schedule_for_group(group)
+    return render_group_schedule(group, items) if items else None
+
+
+def get_group_on_date_text(group: str, date: str) -> Optional[str]:
+    """Готовый текст расписания группы на дату или None, если занятий нет"""
+    rendered = current_rendered()
+    if rendered is not None:
+        return rendered.by_group_date.get((group, date))
+    lessons = get_lessons(group, date)
+    return render_group_on_date(group, date, lessons) if lessons else None
@@ -0,0 +1,37 @@
+"""Синтетические таблицы расписания в формате WordParser для тестов и бенчмарков"""
+
+from typing import List, Sequence, Tuple
+
+Subject = Tuple[str, str, str]
+
+SAMPLE_SUBJECTS: List[Subject] = [
+    ("Математика", "Иванов И.И.", "101"),
+    ("Физика", "Петров П.П.", "202"),
+    ("История", "Сидорова А.А.", "105"),
+    ("Информатика", "Кузнецов К.К.", "301"),
+]
+
+# Бенчмарки гоняют таблицы пошире: шесть предметов и четыре пары
+BENCH_SUBJECTS: List[Subject] = SAMPLE_SUBJECTS + [
+    ("Литература", "Смирнова Е.В.", "214"),
+    ("Химия", "Волков Д.С.", "118"),
+]
+
+PAIR_TIMES = ["08:30", "10:15", "12:00", "13:45"]
+
+
+def make_table(date_line: str, groups: List[str], shift: int = 0, pairs: int = 3,
+               subjects: Sequence[Subject] = SAMPLE_SUBJECTS) -> List[List[str]]:
+    """Таблица в формате WordParser: дата, пары, время, строки групп"""
+    table = [
+        [date_line],
+        [""] + [f"{pair + 1} пара" for pair in range(pairs)],
+        [""] + PAIR_TIMES[:pairs],
+    ]
+    for i, group in enumerate(groups):
+        row = [group]
+        for pair in range(pairs):
+            subject, teacher, room = subjects[(i + pair + shift) % len(subjects)]
+            row.append(f"{subject}\nпреп. {teacher}\nауд. {room}")
+        table.append(row)
+    return table
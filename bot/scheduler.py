@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from .config import load_int_setting
+from .file_manager import save_schedule_file
+from .ingest import IngestQueue, stage_file
+from .parser import format_ru_date
+from .parser_site import SCHEDULE_PAGE_URL, DownloadError, commit_download, fetch_schedule_for_day, fetch_schedule_links
+
+# Период опроса сайта, разброс запуска и на сколько дней вперёд качать расписание
+POLL_INTERVAL_MINUTES = load_int_setting("POLL_INTERVAL_MINUTES", 30)
+POLL_JITTER_SECONDS = load_int_setting("POLL_JITTER_SECONDS", 120)
+PREFETCH_DAYS = load_int_setting("PREFETCH_DAYS", 3)
+
+
+async def prefetch_and_ingest(queue: IngestQueue, days: int = PREFETCH_DAYS, url: str = SCHEDULE_PAGE_URL) -> int:
+    """Скачать расписание на несколько дней вперёд и загрузить новые файлы"""
+    today = datetime.now()
+    submitted = 0
+    jobs = []
+
+    async def log_progress(text: str) -> None:
+        logging.info(f"Автозагрузка: {text}")
+
+    try:
+        links = await fetch_schedule_links(url)
+    except DownloadError as e:
+        logging.warning(f"Автозагрузка: {e}")
+        return 0
+
+    for offset in range(1, days + 1):
+        day = today + timedelta(days=offset)
+        try:
+            result = await fetch_schedule_for_day(url, day, links)
+        except LookupError:
+            # Расписание на этот день ещё не опубликовано
+            continue
+        except DownloadError as e:
+            logging.warning(f"Автозагрузка на {day:%d.%m}: {e}")
+            continue
+
+        if not result.modified:
+            continue
+
+        date_str = format_ru_date(day)
+        success, msg = await save_schedule_file(result.path, date_str)
+        logging.info(msg)
+        if not success:
+            continue
+        job_id = await queue.submit(stage_file(result.path), date_str, log_progress)
+        if job_id is None:
+            # Такой документ уже в БД
+            commit_download(result)
+        else:
+            jobs.append((result, job_id))
+            submitted += 1
+
+    await queue.join()
+    # Валидаторы — только у загруженных файлов: неудачный разбор повторится при следующем опросе
+    for result, job_id in jobs:
+        if await queue.wait(job_id):
+            commit_download(result)
+    return submitted
+
+
+class SchedulePoller:
+    """Периодический запуск задачи с разбросом по времени и без наложений"""
+
+    def __init__(self, job: Callable[[], Awaitable[object]], interval: float = POLL_INTERVAL_MINUTES * 60,
+                 jitter: float = POLL_JITTER_SECONDS, name: str = "Автозагрузка расписания"):
+        self.job = job
+        self.name = name
+        self.interval = interval
+        self.jitter = jitter
+        self.runs = 0
+        self.skipped = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Task] = None
+
+    def next_delay(self) -> float:
+        return max(0.0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    async def run_once(self) -> bool:
+        """Выполнить задачу, если предыдущий запуск уже закончился"""
+        if self._lock.locked():
+            self.skipped += 1
+            logging.info(f"{self.name}: предыдущий запуск ещё идёт, пропускаем")
+            return False
+        async with self._lock:
+            self.runs += 1
+            try:
+                await self.job()
+            except Exception as e:
+                logging.error(f"{self.name}: ошибка: {e}")
+        return True
+
+    async def _loop(self) -> None:
+        # Первый запуск вскоре после старта, чтобы новое расписание появилось без ожидания интервала
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        while True:
+            self._current = asyncio.create_task(self.run_once())
+            await asyncio.sleep(self.next_delay())
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logging.info(f"{self.name}: каждые {self.interval:.0f} с")
+
+    async def stop(self) -> None:
+        for task in (self._task, self._current):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        self._current = None
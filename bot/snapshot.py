@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import marshal
+import os
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional
+
+from . import parser, storage
+from .render import RenderedSchedule, build_rendered, install_rendered
+
+# Снимок модели чтения: ответы кэша и готовые сообщения для последней версии данных
+SNAPSHOT_PATH = Path(__file__).with_name("schedule.snapshot")
+
+MAGIC = b"WPSNAP"
+FORMAT_VERSION = 1
+# Заголовок: формат, версия Python (marshal от неё зависит), счётчик данных БД
+HEADER = struct.Struct(">HBBQ")
+
+# Счётчик данных последнего записанного или загруженного снимка
+_snapshot_data_version: Optional[int] = None
+
+
+def build_entries() -> Dict[Hashable, Any]:
+    """Ответы storage для всех групп и дат — с теми же ключами, что в кэше"""
+    entries: Dict[Hashable, Any] = {
+        ("groups",): parser.get_all_groups(),
+        ("dates",): parser.get_all_dates(),
+        ("schedules",): parser.get_all_schedules(),
+        ("group_ids",): parser.get_group_ids(),
+    }
+    for date in entries[("dates",)]:
+        groups = parser.get_groups_for_date(date)
+        entries[("groups", date)] = groups
+        for group in groups:
+            entries[("lessons", group, date)] = parser.get_lessons_for_group_on_date(group, date)
+    for schedule_id, _ in entries[("schedules",)]:
+        entries[("schedule_row", schedule_id)] = parser.get_schedule_by_id(schedule_id)
+        groups = parser.get_groups_for_schedule(schedule_id)
+        entries[("schedule_groups", schedule_id)] = groups
+        for group_id, _ in groups:
+            entries[("group_row", group_id)] = parser.get_group_by_id(group_id)
+    for group in entries[("groups",)]:
+        entries[("group_dates", group)] = parser.get_group_dates(group)
+        entries[("schedule", group)] = parser.get_schedule_for_group(group)
+    return entries
+
+
+def write_snapshot(path: Path = SNAPSHOT_PATH) -> Optional[int]:
+    """Записать снимок текущего содержимого БД. Возвращает счётчик данных или None.
+
+    Если пока собирался снимок, расписание изменилось, снимок не пишется.
+    """
+    data_version = parser.get_data_version()
+    if data_version is None:
+        return None
+    entries = build_entries()
+    rendered = build_rendered(-1)
+    if parser.get_data_version() != data_version:
+        logging.info("Снимок расписания устарел во время сборки, пропускаем")
+        return None
+
+    payload = {
+        "entries": entries,
+        "by_group": rendered.by_group,
+        "by_group_date": rendered.by_group_date,
+    }
+    body = zlib.compress(marshal.dumps(payload), 6)
+    header = MAGIC + HEADER.pack(FORMAT_VERSION, sys.version_info.major, sys.version_info.minor, data_version)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(header + body)
+    os.replace(tmp, path)
+    logging.info(f"Снимок расписания записан: данные v{data_version}, {len(header) + len(body)} байт")
+    return data_version
+
+
+def read_snapshot(path: Path, data_version: int) -> Optional[Dict[str, Any]]:
+    """Содержимое снимка, если он сделан с этих же данных этой же версией Python"""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    if not raw.startswith(MAGIC) or len(raw) < len(MAGIC) + HEADER.size:
+        return None
+    fmt, major, minor, version = HEADER.unpack_from(raw, len(MAGIC))
+    if (fmt, major, minor) != (FORMAT_VERSION, sys.version_info.major, sys.version_info.minor):
+        return None
+    if version != data_version:
+        return None
+    try:
+        return marshal.loads(zlib.decompress(raw[len(MAGIC) + HEADER.size:]))
+    except (ValueError, EOFError, TypeError, zlib.error) as e:
+        logging.warning(f"Снимок расписания повреждён: {e}")
+        return None
+
+
+def load_snapshot(path: Path = SNAPSHOT_PATH) -> bool:
+    """Поднять кэш чтений и готовые сообщения из снимка вместо запросов к БД.
+
+    Возвращает False, если снимка нет или он не соответствует БД; тогда
+    версия расписания не меняется.
+    """
+    global _snapshot_data_version
+    started = time.perf_counter()
+    data_version = parser.get_data_version()
+    payload = read_snapshot(path, data_version) if data_version is not None else None
+    if payload is None:
+        return False
+
+    _snapshot_data_version = data_version
+    version = storage.get_schedule_version() + 1
+    install_rendered(RenderedSchedule(version, payload["by_group"], payload["by_group_date"], data_version))
+    storage.bump_schedule_version(preload=payload["entries"], data_version=data_version)
+    logging.info(
+        f"Расписание загружено из снимка за {(time.perf_counter() - started) * 1000:.1f} мс: "
+        f"{len(payload['entries'])} ответов, {len(payload['by_group_date'])} групп/дат"
+    )
+    return True
+
+
+class SnapshotWriter:
+    """Слушатель версии расписания: после загрузки новых данных пишет снимок в фоне"""
+
+    def __init__(self, path: Path = SNAPSHOT_PATH):
+        self.path = path
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    def on_version(self, version: int) -> None:
+        if parser.get_data_version() == _snapshot_data_version:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write()
+            return
+        if self._task is not None and not self._task.done():
+            self._dirty = True
+            return
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._dirty = False
+            await loop.run_in_executor(None, self._write)
+            if not self._dirty:
+                return
+
+    def _write(self) -> None:
+        global _snapshot_data_version
+        try:
+            written = write_snapshot(self.path)
+        except Exception as e:
+            logging.error(f"Не удалось записать снимок расписания: {e}")
+            return
+        if written is not None:
+            _snapshot_data_version = written
+
+    async def join(self) -> None:
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
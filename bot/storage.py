@@ -1,39 +1,376 @@
 from __future__ import annotations
 
+import asyncio
 import sqlite3
 import logging
-from pathlib import Path
-from typing import Dict, Any, List, Tuple
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Any, List, Tuple, Callable, Hashable, Optional, TypeVar
 
-from .parser import get_all_groups, get_schedule_for_group as parser_get_schedule, init_db
+from .parser import (
+    get_all_groups,
+    get_all_dates,
+    get_groups_for_date,
+    get_lessons_for_group_on_date,
+    get_schedule_for_group as parser_get_schedule,
+    search_lessons as parser_search_lessons,
+    find_teacher_ids as parser_find_teacher_ids,
+    get_lesson_teacher as parser_get_lesson_teacher,
+    get_all_schedules,
+    get_schedule_by_id,
+    get_group_ids,
+    get_groups_for_schedule,
+    get_group_dates,
+    get_group_by_id,
+    get_schedule_for_teacher as parser_get_teacher_schedule,
+    get_schedule_for_room as parser_get_room_schedule,
+    normalize_teacher,
+    normalize_room,
+    upsert_table as parser_upsert_table,
+    publish_schedule,
+    get_data_version,
+    ChangeSet,
+    init_db,
+)
 
-DB_PATH = Path(__file__).with_name("schedule.db")
+from .config import load_int_setting
+from .coordination import SingleFlight
+from .metrics import REGISTRY, DB_QUERY_SECONDS, SAVE_TABLE_SECONDS
 
+T = TypeVar("T")
 
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Максимальное число закэшированных ответов (группы, даты, занятия)
+CACHE_MAX_ENTRIES = 4096
+
+# Как часто сверять счётчик данных БД, секунды: расписание могли загрузить другие процессы
+DATA_VERSION_POLL_SECONDS = load_int_setting("DATA_VERSION_POLL_SECONDS", 2)
+
+
+class _Flight:
+    """Загрузка ключа, которую сейчас выполняет один из потоков"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# Чтение только из кэша: промах не идёт в БД, а поднимает CacheMiss
+_cache_only: ContextVar[bool] = ContextVar("schedule_cache_only", default=False)
+
+
+class CacheMiss(Exception):
+    """Ответа нет в кэше, а запрос к БД в этом контексте запрещён"""
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class ScheduleCache:
+    """LRU-кэш чтений расписания, привязанный к глобальной версии данных.
+
+    Версия увеличивается при каждой загрузке расписания, при этом все
+    закэшированные ответы сбрасываются. Одновременные промахи по одному
+    ключу из пула потоков ждут одну загрузку, а не идут в БД каждый сам;
+    хендлеры читают через read_schedule и совмещаются на уровне asyncio.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            if _cache_only.get():
+                raise CacheMiss(key)
+            flight = self._inflight.get(key)
+            if flight is not None and flight.version == self.version:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._inflight[key] = _Flight(self.version)
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            if _on_event_loop():
+                # Поток event loop не ждёт загрузку из другого потока — иначе встанут все хендлеры
+                with DB_QUERY_SECONDS.time(key[0] if isinstance(key, tuple) and key else str(key)):
+                    return loader()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        query = key[0] if isinstance(key, tuple) and key else str(key)
+        try:
+            with DB_QUERY_SECONDS.time(query):
+                flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                # Пока шёл запрос в БД, расписание могло обновиться — такой ответ не кэшируем
+                if flight.error is None and self.version == flight.version:
+                    self._entries[key] = flight.value
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            flight.done.set()
+        return flight.value
+
+    def bump_version(self, preload: Optional[Dict[Hashable, Any]] = None) -> int:
+        """Новая версия; preload — готовые ответы для неё (например, из снимка)"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            for key, value in (preload or {}).items():
+                if len(self._entries) >= self.max_entries:
+                    break
+                self._entries[key] = value
+            return self.version
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+            }
+
+
+schedule_cache = ScheduleCache()
+
+# Одинаковые одновременные чтения хендлеров
+_reads = SingleFlight("read")
+
+# Обработчики, вызываемые после каждой смены версии расписания
+_version_listeners: List[Callable[[int], None]] = []
+
+# Счётчик данных БД, которому соответствует текущая версия кэша
+_seen_data_version: Optional[int] = None
 
 
 def init_storage() -> None:
     """Инициализация хранилища"""
     init_db()
+    bump_schedule_version()
+
+
+def get_schedule_version() -> int:
+    """Текущая версия расписания"""
+    return schedule_cache.version
+
+
+def add_version_listener(listener: Callable[[int], None]) -> None:
+    """Подписаться на смену версии расписания"""
+    if listener not in _version_listeners:
+        _version_listeners.append(listener)
+
+
+def remove_version_listener(listener: Callable[[int], None]) -> None:
+    if listener in _version_listeners:
+        _version_listeners.remove(listener)
+
+
+def bump_schedule_version(preload: Optional[Dict[Hashable, Any]] = None,
+                          data_version: Optional[int] = None) -> int:
+    """Новая версия расписания: сбрасывает кэш чтений и оповещает подписчиков.
+
+    data_version — счётчик данных БД, если вызывающий его уже прочитал.
+    """
+    global _seen_data_version
+    # Счётчик читается до сброса: всё, что загрузится после, не старше него
+    _seen_data_version = get_data_version() if data_version is None else data_version
+    version = schedule_cache.bump_version(preload)
+    logging.info(f"Версия расписания: {version}")
+    for listener in list(_version_listeners):
+        try:
+            listener(version)
+        except Exception as e:
+            logging.error(f"Ошибка обработчика версии расписания {listener!r}: {e}")
+    return version
+
+
+async def check_data_version() -> bool:
+    """Сбросить кэш, если расписание в БД изменил другой процесс.
+
+    Процесс, который сам загрузил документ, уже поднял версию — повторно не сбрасывает.
+    """
+    loop = asyncio.get_running_loop()
+    data_version = await loop.run_in_executor(None, get_data_version)
+    if data_version is None or data_version == _seen_data_version:
+        return False
+    logging.info(f"Расписание изменено другим процессом: данные v{data_version}")
+    bump_schedule_version(data_version=data_version)
+    return True
+
+
+async def read_schedule(func: Callable[..., T], *args: Any) -> T:
+    """Чтение расписания для хендлера, не блокирующее event loop.
+
+    Ответ из кэша или готовых сообщений отдаётся сразу; если нужен запрос
+    к БД, func(*args) выполняется в пуле потоков. Одновременные вызовы с той
+    же функцией и аргументами ждут одно чтение; после смены версии новые
+    вызовы к старому чтению не присоединяются.
+    """
+    token = _cache_only.set(True)
+    try:
+        return func(*args)
+    except CacheMiss:
+        pass
+    finally:
+        _cache_only.reset(token)
+    loop = asyncio.get_running_loop()
+    key = (func, args, schedule_cache.version)
+    return await _reads.run(key, lambda: loop.run_in_executor(None, func, *args))
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """Счётчики кэша чтений"""
+    return schedule_cache.stats()
+
+
+def _collect_cache_metrics():
+    stats = schedule_cache.stats()
+    yield "bot_schedule_version", "gauge", "Текущая версия расписания", {}, stats["version"]
+    yield "bot_cache_entries", "gauge", "Записей в кэше чтений", {}, stats["entries"]
+    for name in ("hits", "misses", "evictions", "coalesced"):
+        yield "bot_cache_events_total", "counter", "События кэша чтений", {"event": name}, stats[name]
+
+
+REGISTRY.add_collector(_collect_cache_metrics)
 
 
 def list_groups() -> List[str]:
     """Список всех групп"""
-    return get_all_groups()
+    return list(schedule_cache.get_or_load(("groups",), get_all_groups))
+
+
+def list_dates() -> List[str]:
+    """Список всех дат"""
+    return list(schedule_cache.get_or_load(("dates",), get_all_dates))
+
+
+def list_groups_for_date(date: str) -> List[str]:
+    """Группы, у которых есть занятия на дату"""
+    return list(schedule_cache.get_or_load(("groups", date), lambda: get_groups_for_date(date)))
+
+
+def list_schedules() -> List[Tuple[int, str]]:
+    """Пары (id расписания, дата)"""
+    return list(schedule_cache.get_or_load(("schedules",), get_all_schedules))
+
+
+def list_group_ids() -> List[Tuple[int, str]]:
+    """Пары (id группы, код) — по одной на группу"""
+    return list(schedule_cache.get_or_load(("group_ids",), get_group_ids))
+
+
+def list_groups_for_schedule(schedule_id: int) -> List[Tuple[int, str]]:
+    """Группы с занятиями в расписании с id их строк"""
+    return list(schedule_cache.get_or_load(("schedule_groups", schedule_id), lambda: get_groups_for_schedule(schedule_id)))
+
+
+def list_group_dates(code: str) -> List[Tuple[int, str]]:
+    """Даты с занятиями группы с id её строк"""
+    return list(schedule_cache.get_or_load(("group_dates", code), lambda: get_group_dates(code)))
+
+
+def get_schedule_row(schedule_id: int) -> Optional[Dict[str, Any]]:
+    """Расписание на дату по первичному ключу"""
+    row = schedule_cache.get_or_load(("schedule_row", schedule_id), lambda: get_schedule_by_id(schedule_id))
+    return dict(row) if row else None
+
+
+def get_group_row(group_id: int) -> Optional[Dict[str, Any]]:
+    """Группа на дату по первичному ключу"""
+    row = schedule_cache.get_or_load(("group_row", group_id), lambda: get_group_by_id(group_id))
+    return dict(row) if row else None
+
+
+def get_lessons(group: str, date: str) -> List[Dict[str, Any]]:
+    """Занятия группы на дату"""
+    return list(schedule_cache.get_or_load(("lessons", group, date), lambda: get_lessons_for_group_on_date(group, date)))
 
 
 def get_schedule_for_group_db(code: str) -> List[Dict[str, Any]]:
     """Расписание для группы"""
-    return parser_get_schedule(code)
+    return list(schedule_cache.get_or_load(("schedule", code), lambda: parser_get_schedule(code)))
+
+
+def search_lessons(text: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Полнотекстовый поиск по предметам, преподавателям и аудиториям"""
+    key = ("search", " ".join(text.lower().split()), limit)
+    return list(schedule_cache.get_or_load(key, lambda: parser_search_lessons(text, limit)))
+
+
+def find_teacher_ids(text: str) -> List[Tuple[int, str]]:
+    """Преподаватели по началу фамилии с id одного из их занятий"""
+    return list(schedule_cache.get_or_load(("teacher_ids", normalize_teacher(text)), lambda: parser_find_teacher_ids(text)))
+
+
+def get_lesson_teacher(lesson_id: int) -> Optional[str]:
+    """Преподаватель занятия по первичному ключу"""
+    return schedule_cache.get_or_load(("lesson_teacher", lesson_id), lambda: parser_get_lesson_teacher(lesson_id))
+
+
+def get_teacher_schedule(teacher: str) -> List[Dict[str, Any]]:
+    """Все занятия преподавателя"""
+    return list(schedule_cache.get_or_load(("teacher", normalize_teacher(teacher)), lambda: parser_get_teacher_schedule(teacher)))
+
+
+def get_room_schedule(room: str) -> List[Dict[str, Any]]:
+    """Занятость аудитории"""
+    return list(schedule_cache.get_or_load(("room", normalize_room(room)), lambda: parser_get_room_schedule(room)))
+
+
+def _save_table(table: List[List[str]], conn: sqlite3.Connection) -> Optional[ChangeSet]:
+    with SAVE_TABLE_SECONDS.time():
+        return parser_upsert_table(table, conn)
+
 
+def save_tables(tables: List[List[List[str]]]) -> int:
+    """Сохранить таблицы документа одним поколением расписания;
+    версия обновляется не чаще раза на документ"""
+    count = 0
+    changed = False
+    with publish_schedule() as conn:
+        for table in tables:
+            changes = _save_table(table, conn)
+            if changes is not None:
+                count += 1
+                changed = changed or changes.changed
+    if changed:
+        bump_schedule_version()
+    return count
 
-def save_schedules(schedules: List[Dict[str, Any]]) -> None:
-    """Заглушка - данные уже сохранены через parser.py"""
-    logging.info("Данные уже сохранены в БД через parser.py")
 
 def get_schedule_for_group(code: str) -> List[Dict[str, Any]]:
     """Получаем расписание для конкретной группы (совместимость)"""
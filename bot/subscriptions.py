@@ -0,0 +1,109 @@
+from typing import List
+
+from . import parser
+
+
+def init_subscriptions_db() -> None:
+    conn = parser.connect()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            chat_id INTEGER NOT NULL,
+            group_code TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, group_code)
+        );
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_group ON subscriptions(group_code);
+        CREATE TABLE IF NOT EXISTS notified_versions (
+            data_version INTEGER PRIMARY KEY,
+            notified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    conn.commit()
+    conn.close()
+
+
+def subscribe(chat_id: int, group_code: str) -> bool:
+    """Подписать чат на группу. False, если подписка уже была."""
+    conn = parser.connect()
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO subscriptions (chat_id, group_code) VALUES (?, ?)",
+        (chat_id, group_code),
+    )
+    conn.commit()
+    conn.close()
+    return cur.rowcount > 0
+
+
+def unsubscribe(chat_id: int, group_code: str) -> bool:
+    conn = parser.connect()
+    cur = conn.execute(
+        "DELETE FROM subscriptions WHERE chat_id = ? AND group_code = ?",
+        (chat_id, group_code),
+    )
+    conn.commit()
+    conn.close()
+    return cur.rowcount > 0
+
+
+def unsubscribe_chat(chat_id: int) -> int:
+    """Удалить все подписки чата (например, пользователь заблокировал бота)"""
+    conn = parser.connect()
+    cur = conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+    conn.commit()
+    conn.close()
+    return cur.rowcount
+
+
+def is_subscribed(chat_id: int, group_code: str) -> bool:
+    conn = parser.connect()
+    row = conn.execute(
+        "SELECT 1 FROM subscriptions WHERE chat_id = ? AND group_code = ?",
+        (chat_id, group_code),
+    ).fetchone()
+    conn.close()
+    return row is not None
+
+
+def get_chat_subscriptions(chat_id: int) -> List[str]:
+    conn = parser.connect()
+    rows = conn.execute(
+        "SELECT group_code FROM subscriptions WHERE chat_id = ? ORDER BY group_code",
+        (chat_id,),
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def get_subscribers(group_codes: List[str]) -> List[tuple]:
+    """Пары (chat_id, group_code) для подписчиков указанных групп"""
+    if not group_codes:
+        return []
+    placeholders = ", ".join("?" for _ in group_codes)
+    conn = parser.connect()
+    rows = conn.execute(
+        f"SELECT chat_id, group_code FROM subscriptions WHERE group_code IN ({placeholders}) ORDER BY chat_id",
+        list(group_codes),
+    ).fetchall()
+    conn.close()
+    return [(row[0], row[1]) for row in rows]
+
+
+# Сколько последних отметок о рассылке хранить
+NOTIFIED_VERSIONS_KEEP = 100
+
+
+def claim_notification(data_version: int) -> bool:
+    """Занять рассылку изменений для счётчика данных БД.
+
+    Каждый процесс бота видит одно и то же изменение; True получает только
+    первый из них, остальные рассылку пропускают.
+    """
+    conn = parser.connect()
+    try:
+        cur = conn.execute("INSERT OR IGNORE INTO notified_versions (data_version) VALUES (?)", (data_version,))
+        conn.execute("DELETE FROM notified_versions WHERE data_version <= ?",
+                     (data_version - NOTIFIED_VERSIONS_KEEP,))
+        conn.commit()
+    finally:
+        conn.close()
+    return cur.rowcount > 0
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Тестируем перенос прошлых недель в архив"""
+
+import asyncio
+from datetime import datetime
+from pathlib import Path
+
+from bot.sample_tables import make_table
+
+SCHEDULE_FILES = Path(__file__).parent / "schedule_files"
+SAMPLE_DOCX = SCHEDULE_FILES / "schedule_14_september.docx"
+OTHER_DOCX = SCHEDULE_FILES / "schedule_20_сентября.docx"
+
+
+def test_old_weeks_move_to_archive(schedule_db, tmp_path, monkeypatch):
+    from bot import archive, file_manager, ingest, manifest, parser, storage
+
+    monkeypatch.setattr(file_manager, "SCHEDULE_FILES_DIR", tmp_path / "schedule_files")
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(archive, "ARCHIVE_DB_PATH", tmp_path / "archive" / "archive.db")
+    manifest.init_manifest_db()
+    ingest.init_ingest_db()
+    ingest.record_ingested("old-week", "15 сентября", 1)
+    ingest.record_ingested("this-week", "22 сентября, 23 сентября", 2)
+    storage.save_tables([make_table("15 сентября ПОНЕДЕЛЬНИК", ["К101", "К104"], shift=2)])
+
+    async def store():
+        for label, source in (("15 сентября", OTHER_DOCX), ("22 сентября", SAMPLE_DOCX)):
+            assert (await file_manager.save_schedule_file(source, label))[0]
+
+    asyncio.run(store())
+    conn = parser.connect_schedule()
+    conn.execute("UPDATE schedules SET created_at = '2025-09-23 10:00:00'")
+    conn.commit()
+    conn.close()
+    conn = parser.connect()
+    conn.execute("UPDATE schedule_files SET schedule_date = '2025-' || "
+                 "CASE date_label WHEN '15 сентября' THEN '09-15' ELSE '09-22' END")
+    conn.commit()
+    conn.close()
+    lessons_before = len(parser.get_all_lessons())
+    # Неделя, заархивированная раньше под тем же id, что сейчас у 15 сентября в горячей БД
+    (hot_id,) = parser.connect_schedule().execute("SELECT id FROM schedules WHERE date = '15 сентября'").fetchone()
+    archive.init_archive_db()
+    conn = archive.connect_archive()
+    conn.execute("INSERT INTO schedules (id, date, weekday, schedule_date) "
+                 "VALUES (?, '8 сентября', 'ПОНЕДЕЛЬНИК', '2025-09-08')", (hot_id,))
+    conn.execute("INSERT INTO groups (code, schedule_id) VALUES ('К104', ?)", (hot_id,))
+    conn.commit()
+    conn.close()
+
+    result = archive.archive_old_weeks(today=datetime(2025, 9, 24))
+    assert result == {"files": 1, "schedules": 1, "lessons": 6}
+
+    # Горячая БД: только текущая неделя
+    assert parser.get_all_dates() == ["22 сентября", "23 сентября"]
+    assert len(parser.get_all_lessons()) == lessons_before - 6
+    assert parser.search_lessons("Информатика") and all(
+        row["date"] != "15 сентября" for row in parser.search_lessons("Информатика"))
+    assert [row["name"] for row in manifest.list_files()] == ["schedule_22_сентября.docx"]
+    # Документ архивной недели можно загрузить заново
+    assert ingest.find_ingested("old-week") is None
+    assert ingest.find_ingested("this-week") is not None
+
+    # Архив доступен по запросу
+    assert archive.list_archived_dates("К104") == [("2025-09-15", "15 сентября"), ("2025-09-08", "8 сентября")]
+    lessons = archive.get_archived_lessons("К101", "15 сентября")
+    assert [lesson["subject"] for lesson in lessons] == ["История", "Информатика", "Математика"]
+    assert archive.get_archived_lessons("К101", "2025-09-15") == lessons
+    assert archive.read_archived_file("schedule_15_сентября.docx") == OTHER_DOCX.read_bytes()
+    assert (tmp_path / "archive" / "week_2025-09-15.zip").exists()
+
+    # Повторный запуск ничего не переносит
+    assert archive.archive_old_weeks(today=datetime(2025, 9, 24)) == {"files": 0, "schedules": 0, "lessons": 0}
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
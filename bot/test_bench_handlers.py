@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""Короткий нагрузочный прогон: все хендлеры отрабатывают без ошибок"""
+
+import asyncio
+
+
+def test_load_run_reports_latency(tmp_path, monkeypatch):
+    from bot import bench_handlers, parser
+
+    db_path = tmp_path / "schedule.db"
+    monkeypatch.setattr(parser, "DB_PATH", db_path)
+    bench_handlers.seed_database(db_path, dates=3, groups=12)
+
+    report = asyncio.run(bench_handlers.run_load(updates=400, concurrency=20))
+
+    assert report["errors"] == 0
+    assert report["api_calls"] >= 400
+    assert 0 < report["p50_ms"] <= report["p95_ms"] <= report["p99_ms"]
+    assert report["throughput"] > 0
+    assert "group_on_date_p95_ms" in report
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
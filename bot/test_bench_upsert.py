@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""Короткий прогон сравнения повторной публикации: дифф пишет меньше строк"""
+
+
+def test_diff_writes_fewer_rows(tmp_path, monkeypatch):
+    from bot import bench_upsert, parser
+
+    db_path = tmp_path / "schedule.db"
+    monkeypatch.setattr(parser, "DB_PATH", db_path)
+    tables = bench_upsert.seed(db_path, dates=2, groups=10)
+
+    report = bench_upsert.run_bench(db_path, tables, share=0.1)
+
+    assert report["legacy"]["rows_written"] == 2 * report["cells"]["total"]
+    assert 0 < report["diff"]["rows_written"] < report["cells"]["total"]
+    assert report["diff"]["wal_kb"] < report["legacy"]["wal_kb"]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Тестируем рассылку подписчикам на подставной сессии Bot"""
+
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+from bot.sample_tables import make_table
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot API, которая отвечает 429 при превышении лимита скорости"""
+
+    def __init__(self, limit_per_second=None, fail_first=0, blocked=(), clock=time.monotonic):
+        super().__init__()
+        self.clock = clock
+        self.limit_per_second = limit_per_second
+        self.fail_first = fail_first
+        self.blocked = set(blocked)
+        self.calls = 0
+        self.too_many = 0
+        self.delivered = []
+        self._window = deque()
+
+    async def make_request(self, bot, method, timeout=None):
+        assert isinstance(method, SendMessage)
+        self.calls += 1
+        now = self.clock()
+        while self._window and now - self._window[0] > 1.0:
+            self._window.popleft()
+        self._window.append(now)
+        if self.fail_first > 0 or (self.limit_per_second and len(self._window) > self.limit_per_second):
+            self.fail_first -= 1
+            self.too_many += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        if method.chat_id in self.blocked:
+            raise TelegramForbiddenError(method=method, message="bot was blocked by the user")
+        self.delivered.append((method.chat_id, method.text))
+        return Message(message_id=self.calls, date=datetime.now(), chat=Chat(id=method.chat_id, type="private"), text=method.text)
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+class FakeClock:
+    """Часы, которые идут только во время ожиданий ограничителя"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def make_bot(session):
+    return Bot(token="42:TEST", session=session)
+
+
+def test_thousands_of_subscribers_without_429_storm():
+    from bot.broadcast import Broadcaster, RateLimiter
+
+    clock = FakeClock()
+    session = FakeSession(limit_per_second=1200, clock=clock)
+    limiter = RateLimiter(1000, clock=clock, sleep=clock.sleep)
+    broadcaster = Broadcaster(make_bot(session), concurrency=50, limiter=limiter)
+    messages = [(chat_id, f"обновление {chat_id}") for chat_id in range(1, 3001)]
+
+    stats = asyncio.run(broadcaster.send_many(messages))
+
+    assert stats["sent"] == 3000
+    assert len({chat for chat, _ in session.delivered}) == 3000
+    assert session.too_many == 0
+    # 3000 сообщений при 1000/с: запас в 100 сразу, остальные 2900 — по одному раз в 1 мс
+    assert abs(sum(clock.sleeps) - 2.9) < 0.01
+    assert max(clock.sleeps) <= 0.001 + 1e-9
+
+
+def test_retry_after_pauses_and_resends():
+    from bot.broadcast import Broadcaster, RateLimiter
+
+    clock = FakeClock()
+    session = FakeSession(fail_first=3, clock=clock)
+    limiter = RateLimiter(200, clock=clock, sleep=clock.sleep)
+    broadcaster = Broadcaster(make_bot(session), concurrency=5, limiter=limiter)
+    stats = asyncio.run(broadcaster.send_many([(i, "текст") for i in range(1, 21)]))
+
+    assert stats["sent"] == 20
+    assert stats["retry_after"] == 3
+    assert stats["failed"] == 0
+    # Все отправки стояли, пока не истёк retry_after
+    assert clock.now >= 1.0
+    assert broadcaster.metrics["sent"] == 20
+
+
+def test_notifier_sends_changed_days_and_drops_blocked(schedule_db):
+    from bot import render, storage, subscriptions
+    from bot.broadcast import Broadcaster, ScheduleNotifier
+
+    subscriptions.init_subscriptions_db()
+    subscriptions.subscribe(1, "К101")
+    subscriptions.subscribe(2, "К102")
+    subscriptions.subscribe(3, "К101")
+
+    session = FakeSession(blocked={3})
+    notifier = ScheduleNotifier(Broadcaster(make_bot(session), rate=100, per_chat_interval=0))
+
+    async def scenario():
+        storage.add_version_listener(render.materialize_rendered)
+        render.add_rendered_listener(notifier.on_rendered)
+        try:
+            storage.bump_schedule_version()
+            await render.join_rendered()
+            # К101 на 22 сентября меняется, К102 остаётся прежней
+            storage.save_tables([make_table("22 сентября ПОНЕДЕЛЬНИК", ["К101"], shift=3)])
+            await render.join_rendered()
+            await notifier.join()
+        finally:
+            render.remove_rendered_listener(notifier.on_rendered)
+            storage.remove_version_listener(render.materialize_rendered)
+
+    asyncio.run(scenario())
+
+    assert [chat for chat, _ in session.delivered] == [1]
+    assert "22 сентября" in session.delivered[0][1]
+    assert subscriptions.get_chat_subscriptions(3) == []
+    assert subscriptions.get_chat_subscriptions(1) == ["К101"]
+
+
+def test_each_change_is_broadcast_by_one_worker(schedule_db):
+    from bot import render, storage, subscriptions
+    from bot.broadcast import Broadcaster, ScheduleNotifier
+
+    subscriptions.init_subscriptions_db()
+    subscriptions.subscribe(1, "К101")
+    sessions = [FakeSession(), FakeSession()]
+    notifiers = [ScheduleNotifier(Broadcaster(make_bot(session), rate=100, per_chat_interval=0))
+                 for session in sessions]
+
+    async def scenario():
+        # Каждый процесс бота сам собирает сообщения по общей БД и сравнивает со своими прежними
+        for notifier in notifiers:
+            notifier.on_rendered(render.build_rendered(storage.get_schedule_version()))
+        storage.save_tables([make_table("22 сентября ПОНЕДЕЛЬНИК", ["К101"], shift=3)])
+        for notifier in notifiers:
+            notifier.on_rendered(render.build_rendered(storage.get_schedule_version()))
+        storage.save_tables([make_table("22 сентября ПОНЕДЕЛЬНИК", ["К101"], shift=1)])
+        for notifier in reversed(notifiers):
+            notifier.on_rendered(render.build_rendered(storage.get_schedule_version()))
+        for notifier in notifiers:
+            await notifier.join()
+
+    asyncio.run(scenario())
+
+    # Два изменения — два сообщения подписчику, а не по одному от каждого процесса
+    assert [len(session.delivered) for session in sessions] == [1, 1]
+    assert [chat for session in sessions for chat, _ in session.delivered] == [1, 1]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
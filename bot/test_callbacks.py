@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Тестируем протокол callback_data"""
+
+import asyncio
+
+import pytest
+
+
+class FakeCallback:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+def test_pack_unpack():
+    from bot.callbacks import pack, unpack, GROUP_ON_DATE, NOOP
+
+    assert pack(GROUP_ON_DATE, 1234) == "gd:1234"
+    assert unpack("gd:1234") == ("gd", ["1234"])
+    assert unpack(pack(NOOP)) == ("n", [])
+    with pytest.raises(ValueError):
+        pack("t", "Ю" * 40)
+
+
+def test_router_dispatches_by_prefix():
+    from bot.callbacks import CallbackRouter, STALE_BUTTON
+
+    calls = []
+
+    async def on_group(callback, group_id):
+        calls.append(group_id)
+
+    router = CallbackRouter()
+    router.register("g", on_group, int)
+
+    async def scenario():
+        await router.dispatch(FakeCallback("g:42"))
+        stale = FakeCallback("g:К101")
+        await router.dispatch(stale)
+        unknown = FakeCallback("group:К101")
+        await router.dispatch(unknown)
+        return stale, unknown
+
+    stale, unknown = asyncio.run(scenario())
+    assert calls == [42]
+    assert stale.answers == [STALE_BUTTON]
+    assert unknown.answers == [None]
+
+
+def test_rows_by_primary_key(schedule_db):
+    from bot import storage
+
+    schedule_id, date = storage.list_schedules()[0]
+    assert storage.get_schedule_row(schedule_id)["date"] == date
+    group_id, code = storage.list_groups_for_schedule(schedule_id)[0]
+    row = storage.get_group_row(group_id)
+    assert (row["code"], row["date"]) == (code, date)
+    assert storage.get_group_row(10**6) is None
+
+    lesson_id, teacher = storage.find_teacher_ids("ив")[0]
+    assert storage.get_lesson_teacher(lesson_id) == teacher == "Иванов И.И."
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
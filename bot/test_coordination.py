@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Тестируем совмещение операций и межпроцессные блокировки"""
+
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+SAMPLE_DOCX = Path(__file__).parent / "schedule_files" / "schedule_14_september.docx"
+
+HOLD_LOCK = """
+import sys
+from pathlib import Path
+from bot.coordination import FileLock
+with FileLock("demo", Path(sys.argv[1])):
+    print("locked", flush=True)
+    sys.stdin.readline()
+"""
+
+
+def test_identical_operations_share_one_run(tmp_path, monkeypatch):
+    from bot import coordination
+
+    monkeypatch.setattr(coordination, "LOCKS_DIR", tmp_path)
+    flight = coordination.SingleFlight("demo")
+    calls = []
+
+    async def check():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "готово"
+
+    async def scenario():
+        waiters = [asyncio.create_task(flight.run("check", check, lock="demo")) for _ in range(4)]
+        await asyncio.sleep(0)
+        # Отмена одного из ждущих не мешает остальным
+        waiters[0].cancel()
+        results = await asyncio.gather(*waiters[1:])
+        assert not flight.in_flight("check")
+        again = await flight.run("check", check)
+        return results, again
+
+    started = coordination.OPERATIONS.value("demo", "started")
+    coalesced = coordination.OPERATIONS.value("demo", "coalesced")
+    results, again = asyncio.run(scenario())
+    assert results == ["готово"] * 3
+    assert again == "готово"
+    assert len(calls) == 2
+    assert coordination.OPERATIONS.value("demo", "started") == started + 2
+    assert coordination.OPERATIONS.value("demo", "coalesced") == coalesced + 3
+
+
+def test_file_lock_excludes_other_process(tmp_path):
+    from bot.coordination import FileLock
+
+    holder = subprocess.Popen([sys.executable, "-c", HOLD_LOCK, str(tmp_path)], cwd=ROOT,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        lock = FileLock("demo", tmp_path, poll_interval=0.01)
+        assert not lock.acquire(blocking=False)
+        assert not asyncio.run(lock.acquire_async(timeout=0.05))
+
+        holder.stdin.write("\n")
+        holder.stdin.flush()
+        assert asyncio.run(lock.acquire_async(timeout=5))
+        lock.release()
+    finally:
+        holder.kill()
+        holder.wait()
+
+
+def test_file_lock_excludes_same_process(tmp_path):
+    from bot.coordination import FileLock
+
+    first = FileLock("demo", tmp_path)
+    second = FileLock("demo", tmp_path, poll_interval=0.01)
+    with first:
+        assert not second.acquire(blocking=False)
+        assert not asyncio.run(second.acquire_async(timeout=0.05))
+    assert second.acquire(blocking=False)
+    second.release()
+
+
+class FakeMsvcrt:
+    """msvcrt.locking поверх таблицы занятых файлов — как LockFileEx в Windows"""
+
+    LK_NBLCK, LK_UNLCK = 2, 0
+
+    def __init__(self):
+        self.owners = {}
+
+    def locking(self, fd, mode, nbytes):
+        import os
+
+        key = os.fstat(fd).st_ino
+        if mode == self.LK_UNLCK:
+            del self.owners[key]
+        elif key in self.owners:
+            raise OSError(36, "Resource deadlock avoided")
+        else:
+            self.owners[key] = fd
+
+
+def test_file_lock_without_fcntl_uses_msvcrt(tmp_path, monkeypatch):
+    from bot import coordination
+
+    fake = FakeMsvcrt()
+    monkeypatch.setattr(coordination, "fcntl", None)
+    monkeypatch.setattr(coordination, "msvcrt", fake, raising=False)
+
+    first = coordination.FileLock("demo", tmp_path)
+    second = coordination.FileLock("demo", tmp_path, poll_interval=0.01)
+    with first:
+        assert not second.acquire(blocking=False)
+        assert not asyncio.run(second.acquire_async(timeout=0.05))
+    assert not fake.owners
+    assert second.acquire(blocking=False)
+    second.release()
+
+
+def test_same_document_submitted_twice_joins_running_job(schedule_db, tmp_path, monkeypatch):
+    from bot import ingest, storage
+
+    monkeypatch.setattr(ingest, "INGEST_TMP_DIR", tmp_path / "ingest_tmp")
+    monkeypatch.setattr(ingest, "PROGRESS_INTERVAL", 0.05)
+    ingest.init_ingest_db()
+    version = storage.get_schedule_version()
+
+    async def scenario():
+        queue = ingest.IngestQueue(concurrency=2)
+        reports = {1: [], 2: []}
+        try:
+            ids = []
+            for n in (1, 2):
+                async def progress(text, n=n):
+                    reports[n].append(text)
+
+                ids.append(await queue.submit(ingest.stage_file(SAMPLE_DOCX), "14 сентября", progress))
+            await queue.join()
+        finally:
+            await queue.shutdown()
+        return ids, reports
+
+    ids, reports = asyncio.run(scenario())
+    assert ids[0] == ids[1]
+    assert reports[2][0].startswith("⏳")
+    assert reports[1][-1] == reports[2][-1] == "✅ Загружено и обработано 4 таблиц!"
+    assert storage.get_schedule_version() == version + 1
+    assert not list((tmp_path / "ingest_tmp").iterdir())
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
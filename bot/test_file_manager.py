@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Тестируем манифест сохранённых файлов расписания"""
+
+import asyncio
+import os
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCHEDULE_FILES = Path(__file__).parent / "schedule_files"
+SAMPLE_DOCX = SCHEDULE_FILES / "schedule_14_september.docx"
+OTHER_DOCX = SCHEDULE_FILES / "schedule_20_сентября.docx"
+
+
+def test_parse_schedule_date_picks_nearest_year():
+    from bot.manifest import parse_schedule_date
+
+    assert parse_schedule_date("22 сентября", datetime(2025, 9, 20)).isoformat() == "2025-09-22"
+    assert parse_schedule_date("14 September", datetime(2025, 9, 20)).isoformat() == "2025-09-14"
+    assert parse_schedule_date("30 декабря", datetime(2026, 1, 5)).isoformat() == "2025-12-30"
+    assert parse_schedule_date("файл", datetime(2025, 9, 20)) is None
+
+
+def test_duplicates_stored_once_and_cleanup_by_date(schedule_db, tmp_path, monkeypatch):
+    from bot import file_manager, ingest, manifest
+
+    files_dir = tmp_path / "schedule_files"
+    monkeypatch.setattr(file_manager, "SCHEDULE_FILES_DIR", files_dir)
+    ingest.init_ingest_db()
+
+    # Файл из старой версии бота — без записи в манифесте
+    files_dir.mkdir()
+    old = datetime.now() - timedelta(days=60)
+    legacy = files_dir / f"schedule_{old.day}_{ingest.parser.MONTHS_GENITIVE[old.month - 1]}.docx"
+    shutil.copy2(OTHER_DOCX, legacy)
+    os.utime(legacy, (old.timestamp(), old.timestamp()))
+    assert file_manager.init_file_manifest() == 1
+    assert file_manager.init_file_manifest() == 0
+
+    today = datetime.now()
+    labels = [f"{day.day} {ingest.parser.MONTHS_GENITIVE[day.month - 1]}"
+              for day in (today, today + timedelta(days=1))]
+
+    async def scenario():
+        for label in labels:
+            assert (await file_manager.save_schedule_file(SAMPLE_DOCX, label))[0]
+
+    asyncio.run(scenario())
+
+    # Файл прежней версии переехал в блобы
+    assert not legacy.exists()
+    blobs = {path.name: path for path in (files_dir / file_manager.BLOBS_DIR_NAME).iterdir()}
+    assert len(blobs) == 2
+    stats = file_manager.get_schedule_stats()
+    assert stats["total_files"] == 3
+    assert stats["unique_files"] == 2
+    assert stats["old_files"] == 1
+    assert stats["total_size"] == 2 * SAMPLE_DOCX.stat().st_size + OTHER_DOCX.stat().st_size
+    sample_blob = blobs[f"{ingest.file_sha256(SAMPLE_DOCX)}.docx"]
+    assert files_dir / manifest.get_file(file_manager.schedule_file_name(labels[0]))["path"] == sample_blob
+
+    week_start = file_manager.get_week_start(today).date()
+    for row in manifest.delete_before(week_start):
+        file_manager.remove_unreferenced(row["path"], row["content_hash"])
+    assert sample_blob.exists() and len(list(sample_blob.parent.iterdir())) == 1
+    assert [row["name"] for row in file_manager.list_schedule_files()] == [
+        file_manager.schedule_file_name(label) for label in reversed(labels)
+    ]
+    assert all(row["ingest_status"] == "pending" for row in manifest.list_files())
+
+
+def test_reuploaded_legacy_file_survives_restart(schedule_db, tmp_path, monkeypatch):
+    from bot import file_manager, ingest, manifest
+
+    files_dir = tmp_path / "schedule_files"
+    monkeypatch.setattr(file_manager, "SCHEDULE_FILES_DIR", files_dir)
+    ingest.init_ingest_db()
+
+    # Запись прежней версии бота указывает на файл в корне папки
+    files_dir.mkdir()
+    legacy = files_dir / "schedule_14_september.docx"
+    shutil.copy2(OTHER_DOCX, legacy)
+    manifest.init_manifest_db()
+    manifest.record_file(legacy.name, "14 september", datetime(2025, 9, 14).date(), legacy.stat().st_size,
+                         ingest.file_sha256(legacy), legacy.name, datetime(2025, 9, 14))
+
+    assert asyncio.run(file_manager.save_schedule_file(SAMPLE_DOCX, "14 September"))[0]
+    manifest.set_ingest_status(ingest.file_sha256(SAMPLE_DOCX), "done")
+    uploaded = manifest.get_file(legacy.name)
+
+    # Перезапуск: старый файл не возвращается поверх новой загрузки
+    assert file_manager.init_file_manifest() == 0
+    assert manifest.get_file(legacy.name) == uploaded
+    assert uploaded["ingest_status"] == "done"
+    assert (files_dir / uploaded["path"]).read_bytes() == SAMPLE_DOCX.read_bytes()
+    assert not legacy.exists()
+    assert file_manager.init_file_manifest() == 0
+
+
+def test_ingest_status_follows_jobs(schedule_db, tmp_path, monkeypatch):
+    from bot import file_manager, ingest, manifest
+
+    monkeypatch.setattr(file_manager, "SCHEDULE_FILES_DIR", tmp_path / "schedule_files")
+    monkeypatch.setattr(ingest, "INGEST_TMP_DIR", tmp_path / "ingest_tmp")
+    monkeypatch.setattr(ingest, "PROGRESS_INTERVAL", 0.05)
+    ingest.init_ingest_db()
+
+    async def progress(text):
+        pass
+
+    async def scenario():
+        queue = ingest.IngestQueue(concurrency=1)
+        try:
+            for label in ("14 сентября", "15 сентября"):
+                await file_manager.save_schedule_file(SAMPLE_DOCX, label)
+                await queue.submit(ingest.stage_file(SAMPLE_DOCX), label, progress)
+                await queue.join()
+        finally:
+            await queue.shutdown()
+
+    asyncio.run(scenario())
+    rows = manifest.list_files()
+    assert len(rows) == 2
+    assert {row["ingest_status"] for row in rows} == {"done"}
+    assert ingest.get_job(1)["content_hash"] == rows[0]["content_hash"]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
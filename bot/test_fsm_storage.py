@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Тестируем SQLite-хранилище состояний FSM"""
+
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+
+class Upload(StatesGroup):
+    waiting_file = State()
+
+
+def make_key(user_id):
+    return StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+
+
+def worker(path, first_user, count):
+    """Процесс-воркер: записывает состояния своих пользователей"""
+    from bot.fsm_storage import SQLiteStorage
+
+    async def run():
+        storage = SQLiteStorage(path)
+        for user_id in range(first_user, first_user + count):
+            context = FSMContext(storage, make_key(user_id))
+            await context.set_state(Upload.waiting_file)
+            await context.update_data(user=user_id)
+        await storage.close()
+        return storage.metrics["flushes"]
+
+    return asyncio.run(run())
+
+
+def test_state_roundtrip_and_batching(tmp_path):
+    from bot.fsm_storage import SQLiteStorage
+
+    path = tmp_path / "fsm.db"
+
+    async def scenario():
+        storage = SQLiteStorage(path, flush_interval=0.05)
+        other = SQLiteStorage(path)
+        context = FSMContext(storage, make_key(1))
+        await context.set_state(Upload.waiting_file)
+        await context.update_data(group="К101")
+
+        # Свой процесс видит изменения сразу, чужой — после записи пачки
+        assert await context.get_state() == "Upload:waiting_file"
+        assert await other.get_state(make_key(1)) is None
+
+        for user_id in range(2, 500):
+            await storage.set_state(make_key(user_id), "Upload:waiting_file")
+        await asyncio.sleep(0.1)
+
+        assert await other.get_state(make_key(1)) == "Upload:waiting_file"
+        assert await other.get_data(make_key(1)) == {"group": "К101"}
+        assert await other.get_state(make_key(499)) == "Upload:waiting_file"
+
+        await context.clear()
+        await storage.close()
+        assert await other.get_state(make_key(1)) is None
+        await other.close()
+        return storage.metrics
+
+    metrics = asyncio.run(scenario())
+    assert metrics["writes"] == 502
+    assert metrics["flushes"] <= 5
+
+
+def test_ttl_expiry(tmp_path):
+    from bot.fsm_storage import SQLiteStorage
+
+    async def scenario():
+        storage = SQLiteStorage(tmp_path / "fsm.db", ttl=0.2, cleanup_interval=0)
+        await storage.set_data(make_key(7), {"page": 3})
+        await storage.flush()
+        assert await storage.get_data(make_key(7)) == {"page": 3}
+        time.sleep(0.3)
+        assert await storage.get_data(make_key(7)) == {}
+
+        # Очередная запись удаляет просроченные строки
+        await storage.set_state(make_key(8), "Upload:waiting_file")
+        await storage.flush()
+        await storage.close()
+        return storage.metrics["expired"]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_reads_do_not_wait_for_other_writer(tmp_path):
+    import sqlite3
+
+    from bot.fsm_storage import SQLiteStorage
+
+    path = tmp_path / "fsm.db"
+
+    async def scenario():
+        storage = SQLiteStorage(path)
+        await storage.set_state(make_key(1), "Upload:waiting_file")
+        await storage.flush()
+
+        # Другой процесс держит блокировку записи — наша пачка ждёт её в executor
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        await storage.set_state(make_key(2), "Upload:waiting_file")
+        flush = asyncio.create_task(storage.flush())
+        await asyncio.sleep(0.05)
+        assert not flush.done()
+
+        # Чтение из БД не ждёт ни чужой, ни своей записи и не стоит на event loop
+        assert await asyncio.wait_for(storage.get_state(make_key(1)), 5) == "Upload:waiting_file"
+        assert await storage.get_state(make_key(2)) == "Upload:waiting_file"
+
+        other.execute("ROLLBACK")
+        other.close()
+        assert await flush == 1
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_several_processes_share_state(tmp_path):
+    from bot.fsm_storage import SQLiteStorage
+
+    path = tmp_path / "fsm.db"
+    SQLiteStorage(path)  # создать таблицу до запуска воркеров
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        list(pool.map(worker, [path] * 3, [0, 1000, 2000], [200] * 3))
+
+    async def check():
+        storage = SQLiteStorage(path)
+        for user_id in (0, 199, 1000, 2199):
+            assert await storage.get_state(make_key(user_id)) == "Upload:waiting_file"
+            assert await storage.get_data(make_key(user_id)) == {"user": user_id}
+        await storage.close()
+
+    asyncio.run(check())
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Тестируем публикацию расписания поколениями"""
+
+import os
+import threading
+from pathlib import Path
+
+from bot.sample_tables import make_table
+
+
+def publish(table):
+    from bot import parser
+
+    with parser.publish_schedule() as conn:
+        return parser.upsert_table(table, conn)
+
+
+def test_reader_keeps_its_generation_until_done(schedule_db):
+    from bot import generations, parser
+
+    before = generations.current_number(schedule_db)
+    reader = parser.connect_schedule()
+    reader.execute("BEGIN")
+    old_dates = [row[0] for row in reader.execute("SELECT date FROM schedules ORDER BY id")]
+
+    # Публикация не ждёт читателя и не блокируется им
+    assert publish(make_table("24 сентября СРЕДА", ["К101"])).changed
+    assert generations.current_number(schedule_db) == before + 1
+    assert "24 сентября" in parser.get_all_dates()
+
+    # Открытое соединение дочитывает прежнее поколение
+    assert [row[0] for row in reader.execute("SELECT date FROM schedules ORDER BY id")] == old_dates
+    reader.rollback()
+    reader.close()
+
+
+def test_unchanged_publish_is_discarded(schedule_db):
+    from bot import generations, parser
+
+    numbers = generations.list_generations(schedule_db)
+    version = parser.get_data_version()
+    changes = publish(make_table("22 сентября ПОНЕДЕЛЬНИК", ["К101", "К102", "К103"]))
+
+    assert changes is not None and not changes.changed
+    assert generations.list_generations(schedule_db) == numbers
+    assert parser.get_data_version() == version
+    assert not list(generations.generations_dir(schedule_db).glob("*.tmp"))
+
+
+def test_failed_publish_leaves_current_generation(schedule_db):
+    from bot import generations, parser
+
+    current = generations.current_number(schedule_db)
+    try:
+        with parser.publish_schedule() as conn:
+            conn.execute("DELETE FROM lessons")
+            parser.bump_data_version(conn.cursor())
+            raise RuntimeError("сбой посреди публикации")
+    except RuntimeError:
+        pass
+
+    assert generations.current_number(schedule_db) == current
+    assert parser.get_all_lessons()
+    assert not list(generations.generations_dir(schedule_db).glob("*.tmp"))
+
+
+def test_service_tables_stay_in_schedule_db(schedule_db):
+    from bot import generations, parser
+
+    conn = parser.connect()
+    conn.execute("CREATE TABLE IF NOT EXISTS chat_notes (chat_id INTEGER)")
+    conn.commit()
+    conn.close()
+
+    publish(make_table("24 сентября СРЕДА", ["К101"]))
+    generation = parser.connect_schedule()
+    names = {name for (name,) in generation.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    generation.close()
+
+    assert "chat_notes" not in names
+    assert generations.SCHEDULE_TABLES <= names
+
+
+def test_cleanup_keeps_recent_and_grace_period(schedule_db):
+    from bot import generations, parser
+
+    for day, weekday in zip(range(24, 29), ("СРЕДА", "ЧЕТВЕРГ", "ПЯТНИЦА", "СУББОТА", "ПОНЕДЕЛЬНИК")):
+        publish(make_table(f"{day} сентября {weekday}", ["К101"]))
+    numbers = generations.list_generations(schedule_db)
+    assert len(numbers) > 3
+    # Публикации только что прошли: старые поколения ещё может дочитывать кто-то
+    assert generations.cleanup_generations(schedule_db, keep=1, grace=300) == 0
+
+    # Через grace секунд после замены лишние поколения удаляются
+    for number in numbers:
+        path = generations.generation_path(schedule_db, number)
+        os.utime(path, (path.stat().st_atime, path.stat().st_mtime - 600))
+    removed = generations.cleanup_generations(schedule_db, keep=2, grace=300)
+
+    assert removed == len(numbers) - 2
+    assert generations.list_generations(schedule_db) == numbers[-2:]
+    assert generations.current_number(schedule_db) == numbers[-1]
+    assert generations.get_generation_stats(schedule_db)["generations"] == 2
+
+
+def test_locked_generation_is_left_for_next_cleanup(schedule_db, monkeypatch):
+    from bot import generations, parser
+
+    for day, weekday in zip(range(24, 27), ("СРЕДА", "ЧЕТВЕРГ", "ПЯТНИЦА")):
+        publish(make_table(f"{day} сентября {weekday}", ["К101"]))
+    numbers = generations.list_generations(schedule_db)
+    busy = generations.generation_path(schedule_db, numbers[0])
+    unlink = Path.unlink
+
+    def windows_unlink(path, missing_ok=False):
+        if path == busy:
+            raise PermissionError(32, "Процесс не может получить доступ к файлу")
+        unlink(path, missing_ok=missing_ok)
+
+    monkeypatch.setattr(Path, "unlink", windows_unlink)
+    monkeypatch.setattr(generations, "GENERATIONS_KEEP", 1)
+    monkeypatch.setattr(generations, "GENERATION_GRACE_SECONDS", 0)
+    # Публикация проходит, хотя чистка внутри неё не смогла удалить занятый файл
+    assert publish(make_table("27 сентября СУББОТА", ["К101"])).changed
+    current = generations.current_number(schedule_db)
+    assert generations.list_generations(schedule_db) == [numbers[0], current]
+    assert "27 сентября" in parser.get_all_dates()
+
+    monkeypatch.setattr(Path, "unlink", unlink)
+    assert generations.cleanup_generations(schedule_db) == 1
+    assert generations.list_generations(schedule_db) == [current]
+
+
+def test_concurrent_publishes_keep_every_change(schedule_db):
+    from bot import generations, parser
+
+    before = generations.current_number(schedule_db)
+    days = list(zip(range(24, 30), ("СРЕДА", "ЧЕТВЕРГ", "ПЯТНИЦА", "СУББОТА", "ПОНЕДЕЛЬНИК", "ВТОРНИК")))
+    threads = [threading.Thread(target=publish, args=(make_table(f"{day} сентября {weekday}", ["К101"]),))
+               for day, weekday in days]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Каждая публикация копировала результат предыдущей, ни одна не потерялась
+    dates = parser.get_all_dates()
+    assert all(f"{day} сентября" in dates for day, _ in days)
+    assert generations.current_number(schedule_db) == before + len(days)
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
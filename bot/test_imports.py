@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Тестируем, что вспомогательные модули импортируются быстро и без побочных эффектов"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Бюджет импорта в свежем интерпретаторе, мс (с aiogram было около 5 с)
+IMPORT_BUDGET_MS = 1500
+
+LIGHT_MODULES = ["bot.parser_site", "bot.file_manager", "bot.scheduler", "bot.ingest", "bot.archive", "bot.snapshot", "bot.coordination", "bot.generations"]
+HEAVY_PACKAGES = ["aiogram", "aiohttp", "aiofiles"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - started) * 1000
+site = sys.modules.get("bot.parser_site")
+print(json.dumps({{
+    "ms": elapsed,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+    "bot_created": site is not None and site._bot_instance is not None,
+}}))
+"""
+
+
+def probe(module):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_light_modules_import_within_budget():
+    for module in LIGHT_MODULES:
+        result = probe(module)
+        assert result["loaded"] == [], f"{module} тянет {result['loaded']}"
+        assert not result["bot_created"], f"{module} создаёт Bot при импорте"
+        assert result["ms"] < IMPORT_BUDGET_MS, f"{module}: {result['ms']:.0f} мс"
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Тестируем очередь заданий на разбор расписания"""
+
+import asyncio
+import shutil
+from pathlib import Path
+
+SCHEDULE_FILES = Path(__file__).parent / "schedule_files"
+SAMPLE_DOCX = SCHEDULE_FILES / "schedule_14_september.docx"
+OTHER_DOCX = SCHEDULE_FILES / "schedule_20_сентября.docx"
+
+
+def test_concurrent_jobs_use_own_files(schedule_db, tmp_path, monkeypatch):
+    from bot import ingest, metrics, storage
+
+    monkeypatch.setattr(ingest, "INGEST_TMP_DIR", tmp_path / "ingest_tmp")
+    monkeypatch.setattr(ingest, "PROGRESS_INTERVAL", 0.05)
+    ingest.init_ingest_db()
+    version = storage.get_schedule_version()
+    parses = metrics.PARSE_SECONDS.count()
+    jobs_done = metrics.INGEST_SECONDS.count("done")
+
+    async def scenario():
+        queue = ingest.IngestQueue(concurrency=2)
+        reports = {1: [], 2: []}
+        paths = []
+        try:
+            for n, source in ((1, SAMPLE_DOCX), (2, OTHER_DOCX)):
+                path = ingest.new_job_path()
+                shutil.copy2(source, path)
+                paths.append(path)
+
+                async def progress(text, n=n):
+                    reports[n].append(text)
+
+                await queue.submit(path, "14 сентября", progress)
+            await queue.join()
+        finally:
+            await queue.shutdown()
+        return reports, paths
+
+    reports, paths = asyncio.run(scenario())
+
+    assert paths[0] != paths[1]
+    assert not any(p.exists() for p in paths)
+    for texts in reports.values():
+        assert texts[0].startswith("🕐")
+        assert texts[-1] == "✅ Загружено и обработано 4 таблиц!"
+    assert ingest.get_job(1)["status"] == "done"
+    assert storage.get_schedule_version() == version + 2
+    assert "15 сентября" in storage.list_dates()
+    assert "22 сентября" in storage.list_dates()
+    # Длительности этапов из воркеров попали в метрики главного процесса
+    assert metrics.PARSE_SECONDS.count() == parses + 2
+    assert metrics.INGEST_SECONDS.count("done") == jobs_done + 2
+
+
+def test_same_document_is_ingested_once(schedule_db, tmp_path, monkeypatch):
+    from bot import ingest, storage
+
+    monkeypatch.setattr(ingest, "INGEST_TMP_DIR", tmp_path / "ingest_tmp")
+    monkeypatch.setattr(ingest, "PROGRESS_INTERVAL", 0.05)
+    ingest.init_ingest_db()
+
+    async def scenario():
+        queue = ingest.IngestQueue(concurrency=1)
+        reports = []
+
+        async def progress(text):
+            reports.append(text)
+
+        try:
+            first = await queue.submit(ingest.stage_file(SAMPLE_DOCX), "14 сентября", progress)
+            await queue.join()
+            version = storage.get_schedule_version()
+            second_path = ingest.stage_file(SAMPLE_DOCX)
+            second = await queue.submit(second_path, "14 сентября", progress)
+            await queue.join()
+        finally:
+            await queue.shutdown()
+        return first, second, second_path, version, reports
+
+    first, second, second_path, version, reports = asyncio.run(scenario())
+
+    assert first == 1
+    assert second is None
+    assert not second_path.exists()
+    assert storage.get_schedule_version() == version
+    assert reports[-1].startswith("♻️ Этот документ уже загружен")
+    doc = ingest.find_ingested(ingest.file_sha256(SAMPLE_DOCX))
+    assert doc["date"] == "15 сентября"
+    assert doc["table_count"] == 4
+
+
+def test_resume_marks_lost_files_failed(schedule_db, tmp_path):
+    from bot import ingest, parser
+
+    ingest.init_ingest_db()
+    conn = parser.connect()
+    conn.execute("INSERT INTO ingest_jobs (file_path, status) VALUES (?, 'running')", (str(tmp_path / "lost.docx"),))
+    conn.commit()
+    conn.close()
+
+    async def scenario():
+        queue = ingest.IngestQueue(concurrency=1)
+        return await queue.resume(lambda job: None)
+
+    assert asyncio.run(scenario()) == 0
+    assert ingest.get_job(1)["status"] == "failed"
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Тестируем готовые inline-клавиатуры"""
+
+from bot.sample_tables import make_table
+
+
+def _callbacks(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+def _ids():
+    from bot import storage
+
+    schedules = {date: schedule_id for schedule_id, date in storage.list_schedules()}
+    groups = {
+        (code, date): group_id
+        for _, code in storage.list_group_ids()
+        for group_id, date in storage.list_group_dates(code)
+    }
+    return schedules, groups
+
+
+def test_keyboards_materialized_on_ingest(schedule_db, monkeypatch):
+    from bot import keyboards, parser, storage
+
+    storage.add_version_listener(keyboards.materialize_keyboards)
+    try:
+        groups = [f"К{200 + i}" for i in range(10)]
+        storage.save_tables([make_table("24 сентября СРЕДА", groups)])
+        schedules, group_ids = _ids()
+
+        def no_db(*args, **kwargs):
+            raise AssertionError("запрос в БД при готовых клавиатурах")
+
+        monkeypatch.setattr(parser.sqlite3, "connect", no_db)
+        first = keyboards.groups_keyboard(0)
+        assert keyboards.groups_keyboard(0) is first
+        assert "gp:1" in _callbacks(first)
+        assert len(_callbacks(keyboards.groups_keyboard(1))) == 8
+
+        assert f"d:{schedules['24 сентября']}" in _callbacks(keyboards.dates_page_keyboard())
+        date_groups = _callbacks(keyboards.date_groups_keyboard(schedules["24 сентября"]))
+        assert f"gd:{group_ids[('К205', '24 сентября')]}" in date_groups
+        assert keyboards.date_groups_keyboard(10**6) is None
+
+        # Навигация идёт только по датам, на которые у группы есть занятия
+        k101 = group_ids[("К101", "22 сентября")]
+        nav = _callbacks(keyboards.group_on_date_keyboard(k101, "К101"))
+        assert nav == ["bd", f"gd:{group_ids[('К101', '23 сентября')]}"]
+    finally:
+        storage.remove_version_listener(keyboards.materialize_keyboards)
+
+
+def test_keyboards_built_off_the_event_loop(schedule_db):
+    import asyncio
+
+    from bot import keyboards, storage
+
+    async def scenario():
+        storage.add_version_listener(keyboards.materialize_keyboards)
+        try:
+            storage.bump_schedule_version()
+            # Сборка ещё идёт в пуле потоков — клавиатуры строятся по запросу
+            assert keyboards.current_keyboards() is None
+            assert _callbacks(keyboards.groups_keyboard())
+            storage.bump_schedule_version()
+            await keyboards.join_keyboards()
+        finally:
+            storage.remove_version_listener(keyboards.materialize_keyboards)
+
+    asyncio.run(scenario())
+    assert keyboards.current_keyboards().version == storage.get_schedule_version()
+
+
+def test_stale_version_builds_from_db(schedule_db):
+    from bot import keyboards, storage
+
+    storage.bump_schedule_version()
+    assert keyboards.current_keyboards() is None
+    schedules, group_ids = _ids()
+    assert f"g:{group_ids[('К103', '22 сентября')]}" in _callbacks(keyboards.groups_keyboard())
+    assert _callbacks(keyboards.date_groups_keyboard(schedules["23 сентября"]))[:2] == [
+        f"gd:{group_ids[('К101', '23 сентября')]}",
+        f"gd:{group_ids[('К102', '23 сентября')]}",
+    ]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
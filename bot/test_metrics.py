@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Тестируем метрики в формате Prometheus"""
+
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+from aiohttp import ClientSession
+
+
+def test_histogram_and_counter_text_format():
+    from bot.metrics import Registry
+
+    registry = Registry()
+    latency = registry.histogram("demo_seconds", "Демо", ["handler"], buckets=(0.1, 1.0))
+    errors = registry.counter("demo_errors_total", "Ошибки", ["handler"])
+    latency.observe(0.05, 'a"b')
+    latency.observe(0.5, 'a"b')
+    latency.observe(5.0, 'a"b')
+    errors.inc(2, "x")
+    registry.add_collector(lambda: [("demo_gauge", "gauge", "Гейдж", {"kind": "k"}, 7)])
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{handler="a\\"b",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{handler="a\\"b",le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{handler="a\\"b",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{handler="a\\"b"} 3' in text
+    assert 'demo_seconds_sum{handler="a\\"b"} 5.55' in text
+    assert 'demo_errors_total{handler="x"} 2' in text
+    assert 'demo_gauge{kind="k"} 7' in text
+
+
+def test_handlers_and_queries_are_timed(schedule_db):
+    from bot import callbacks, metrics, storage
+    from bot.bench_handlers import StubSession
+    from bot.main import build_dispatcher
+
+    user = User(id=5001, is_bot=False, first_name="Студент")
+    chat = Chat(id=5001, type="private")
+    schedule_id = storage.list_schedules()[0][0]
+    updates = [
+        Update(update_id=1, message=Message(message_id=1, date=datetime.now(), chat=chat, from_user=user,
+                                            text="📅 Показать расписание")),
+        Update(update_id=2, callback_query=CallbackQuery(
+            id="1", from_user=user, chat_instance="t", data=callbacks.pack(callbacks.DATE, schedule_id),
+            message=Message(message_id=2, date=datetime.now(), chat=chat, text="Выберите дату:"))),
+    ]
+    handled = metrics.HANDLER_SECONDS.count("on_show_schedule")
+    selected = metrics.HANDLER_SECONDS.count("callback:d")
+    storage.bump_schedule_version()
+    queries = metrics.DB_QUERY_SECONDS.count("schedule_groups")
+
+    async def scenario():
+        dp = build_dispatcher()
+        bot = Bot(token="42:TEST", session=StubSession())
+        for update in updates:
+            await dp.feed_update(bot, update)
+
+        runner = await metrics.start_metrics_server("127.0.0.1", 0)
+        try:
+            host, port = runner.addresses[0][:2]
+            async with ClientSession() as session:
+                async with session.get(f"http://{host}:{port}/metrics") as resp:
+                    return resp.status, resp.headers["Content-Type"], await resp.text()
+        finally:
+            await runner.cleanup()
+
+    status, content_type, text = asyncio.run(scenario())
+    assert status == 200
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert metrics.HANDLER_SECONDS.count("on_show_schedule") == handled + 1
+    assert metrics.HANDLER_SECONDS.count("callback:d") == selected + 1
+    assert metrics.DB_QUERY_SECONDS.count("schedule_groups") == queries + 1
+    assert 'bot_handler_seconds_count{handler="callback:d"}' in text
+    assert "bot_cache_events_total{event=\"misses\"}" in text
+
+
+def test_busy_metrics_port_does_not_stop_bot():
+    import socket
+
+    from bot import metrics
+
+    async def scenario():
+        with socket.socket() as busy:
+            busy.bind(("127.0.0.1", 0))
+            busy.listen()
+            return await metrics.start_metrics_server("127.0.0.1", busy.getsockname()[1])
+
+    assert asyncio.run(scenario()) is None
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
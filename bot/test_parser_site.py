@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Тестируем загрузку расписания с сайта на локальном сервере"""
+
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+DOCX_BODY = b"PK" + b"x" * 200_000
+PAGE = '<html><body><a href="/files/22.docx">22</a><a href="/other">23</a></body></html>'
+
+
+def make_app(counters):
+    async def page(request):
+        counters["page"] += 1
+        if request.headers.get("If-None-Match") == '"page-v1"':
+            return web.Response(status=304)
+        return web.Response(text=PAGE, content_type="text/html", headers={"ETag": '"page-v1"'})
+
+    async def docx(request):
+        counters["docx"] += 1
+        modified = "Mon, 22 Sep 2025 08:00:00 GMT"
+        if request.headers.get("If-Modified-Since") == modified:
+            return web.Response(status=304)
+        resp = web.StreamResponse(headers={"Last-Modified": modified})
+        await resp.prepare(request)
+        for i in range(0, len(DOCX_BODY), 16_384):
+            await resp.write(DOCX_BODY[i:i + 16_384])
+        await resp.write_eof()
+        return resp
+
+    async def unconditional_304(request):
+        # Кэширующий прокси, который отвечает 304 и без валидаторов в запросе
+        counters["proxy"] = counters.get("proxy", 0) + 1
+        if counters["proxy"] == 1 or request.path.endswith("broken"):
+            return web.Response(status=304)
+        return web.Response(body=DOCX_BODY)
+
+    app = web.Application()
+    app.router.add_get("/page", page)
+    app.router.add_get("/files/22.docx", docx)
+    app.router.add_get("/proxy/{name}", unconditional_304)
+    return app
+
+
+def run_with_server(scenario):
+    async def runner():
+        counters = {"page": 0, "docx": 0}
+        server = TestServer(make_app(counters))
+        await server.start_server()
+        try:
+            return await scenario(server, counters)
+        finally:
+            await server.close()
+
+    return asyncio.run(runner())
+
+
+def test_conditional_requests_survive_restart(tmp_path):
+    from bot.parser_site import ScheduleDownloader
+
+    state = tmp_path / "state.json"
+
+    async def scenario(server, counters):
+        first = ScheduleDownloader(state_path=state, cache_dir=tmp_path / "cache")
+        html, changed = await first.fetch_page(str(server.make_url("/page")))
+        assert changed and "22.docx" in html
+        result = await first.fetch_to_file(str(server.make_url("/files/22.docx")), tmp_path / "22.docx")
+        assert result.modified and result.size == len(DOCX_BODY)
+        await first.close()
+
+        # Новый экземпляр читает валидаторы с диска
+        second = ScheduleDownloader(state_path=state, cache_dir=tmp_path / "cache")
+        html_again, changed = await second.fetch_page(str(server.make_url("/page")))
+        assert not changed and html_again == html
+        again = await second.fetch_to_file(str(server.make_url("/files/22.docx")), tmp_path / "22.docx")
+        assert not again.modified and again.path == tmp_path / "22.docx"
+        await second.close()
+        return counters
+
+    counters = run_with_server(scenario)
+    assert counters == {"page": 2, "docx": 2}
+    assert (tmp_path / "22.docx").read_bytes() == DOCX_BODY
+
+
+def test_validators_saved_only_after_commit(tmp_path):
+    from bot.parser_site import ScheduleDownloader
+
+    state = tmp_path / "state.json"
+
+    async def scenario(server, counters):
+        url = str(server.make_url("/files/22.docx"))
+        downloader = ScheduleDownloader(state_path=state, cache_dir=tmp_path / "cache")
+        first = await downloader.fetch_to_file(url, tmp_path / "22.docx", commit=False)
+        assert first.modified
+        # Файл не обработан (разбор упал) — следующая проверка скачивает его снова
+        again = await downloader.fetch_to_file(url, tmp_path / "22.docx", commit=False)
+        assert again.modified
+        downloader.commit(again)
+        assert not (await downloader.fetch_to_file(url, tmp_path / "22.docx", commit=False)).modified
+        await downloader.close()
+        return counters
+
+    assert run_with_server(scenario)["docx"] == 3
+
+
+def test_processes_share_download_state(tmp_path):
+    from bot.parser_site import ScheduleDownloader
+
+    state = tmp_path / "state.json"
+
+    async def scenario(server, counters):
+        page, url = str(server.make_url("/page")), str(server.make_url("/files/22.docx"))
+        # Оба процесса запущены до первой проверки
+        first = ScheduleDownloader(state_path=state, cache_dir=tmp_path / "cache")
+        second = ScheduleDownloader(state_path=state, cache_dir=tmp_path / "cache")
+        await first.fetch_page(page)
+        await first.fetch_to_file(url, tmp_path / "22.docx")
+
+        # Второй дождался блокировки: видит скачанное первым и не затирает его записи
+        assert not (await second.fetch_to_file(url, tmp_path / "22.docx")).modified
+        await second.fetch_page(page)
+        assert set(ScheduleDownloader(state_path=state)._state) == {page, url}
+        await first.close()
+        await second.close()
+        return counters
+
+    assert run_with_server(scenario) == {"page": 2, "docx": 2}
+
+
+def test_304_without_saved_copy_retries_unconditionally(tmp_path):
+    from bot.parser_site import DownloadError, ScheduleDownloader
+
+    async def scenario(server, counters):
+        downloader = ScheduleDownloader(state_path=tmp_path / "state.json", cache_dir=tmp_path / "cache")
+        try:
+            result = await downloader.fetch_to_file(str(server.make_url("/proxy/ok")), tmp_path / "ok.docx")
+            assert result.modified and result.path.read_bytes() == DOCX_BODY
+            with pytest.raises(DownloadError):
+                await downloader.fetch_to_file(str(server.make_url("/proxy/broken")), tmp_path / "broken.docx")
+        finally:
+            await downloader.close()
+        return counters
+
+    assert run_with_server(scenario)["proxy"] == 4
+
+
+def test_size_limit_aborts_stream(tmp_path):
+    from bot.parser_site import ScheduleDownloader, DownloadError
+
+    async def scenario(server, counters):
+        downloader = ScheduleDownloader(state_path=tmp_path / "state.json", max_bytes=50_000)
+        try:
+            with pytest.raises(DownloadError):
+                await downloader.fetch_to_file(str(server.make_url("/files/22.docx")), tmp_path / "big.docx")
+        finally:
+            await downloader.close()
+
+    run_with_server(scenario)
+    assert list(tmp_path.glob("big.docx*")) == []
+    assert not (tmp_path / "state.json").exists()
+
+
+def test_session_is_shared(tmp_path):
+    from bot.parser_site import ScheduleDownloader
+
+    async def scenario(server, counters):
+        downloader = ScheduleDownloader(state_path=tmp_path / "state.json", cache_dir=tmp_path / "cache")
+        session = downloader._get_session()
+        await downloader.fetch_page(str(server.make_url("/page")))
+        await downloader.fetch_page(str(server.make_url("/page")))
+        assert downloader._get_session() is session
+        await downloader.close()
+
+    run_with_server(scenario)
+
+
+def test_extract_links_matches_beautifulsoup():
+    from bot.bench_links import FIXTURE, soup_find
+    from bot.parser_site import extract_links
+
+    html = FIXTURE.read_text(encoding="utf-8")
+    links = extract_links(html)
+    for day in range(1, 32):
+        assert links.get(str(day)) == soup_find(html, str(day))
+    assert extract_links('<a href="/a"> <b>1</b>\n</a><a href="/b">1</a>') == {"1": "/a"}
+
+
+def test_links_parsed_once_per_page_version(tmp_path, monkeypatch):
+    from bot import parser_site
+
+    calls = []
+    real_extract = parser_site.extract_links
+    monkeypatch.setattr(parser_site, "extract_links", lambda html: calls.append(1) or real_extract(html))
+
+    async def scenario(server, counters):
+        downloader = parser_site.ScheduleDownloader(state_path=tmp_path / "state.json", cache_dir=tmp_path / "cache")
+        for _ in range(3):
+            links = await downloader.fetch_links(str(server.make_url("/page")))
+            assert links["22"] == "/files/22.docx"
+        await downloader.close()
+        return downloader
+
+    downloader = run_with_server(scenario)
+    assert len(calls) == 1
+    assert downloader.links_cache_hits == 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Тестируем пересборку БД из сохранённых файлов расписания"""
+
+import asyncio
+from pathlib import Path
+
+SCHEDULE_FILES = Path(__file__).parent / "schedule_files"
+SAMPLE_DOCX = SCHEDULE_FILES / "schedule_14_september.docx"
+OTHER_DOCX = SCHEDULE_FILES / "schedule_20_сентября.docx"
+
+
+def lessons_without_ids(parser):
+    return sorted(tuple(sorted(lesson.items())) for lesson in parser.get_all_lessons())
+
+
+def test_rebuild_matches_sequential_ingest(schedule_db, tmp_path, monkeypatch):
+    from bot import file_manager, generations, ingest, manifest, parser, rebuild, subscriptions
+
+    monkeypatch.setattr(file_manager, "SCHEDULE_FILES_DIR", tmp_path / "schedule_files")
+    ingest.init_ingest_db()
+    subscriptions.init_subscriptions_db()
+    subscriptions.subscribe(42, "К101")
+
+    async def store():
+        for label, source in (("14 сентября", SAMPLE_DOCX), ("20 сентября", OTHER_DOCX)):
+            assert (await file_manager.save_schedule_file(source, label))[0]
+
+    asyncio.run(store())
+
+    # Эталон: те же документы, загруженные по одному в пустую БД
+    monkeypatch.setattr(parser, "DB_PATH", tmp_path / "expected.db")
+    parser.init_db()
+    for source in (SAMPLE_DOCX, OTHER_DOCX):
+        with parser.publish_schedule() as conn:
+            for table in rebuild.parse_document(str(source)):
+                parser.upsert_table(table, conn)
+    expected = lessons_without_ids(parser)
+    monkeypatch.setattr(parser, "DB_PATH", schedule_db)
+
+    data_version = parser.get_data_version()
+    report = rebuild.rebuild_database(workers=2)
+
+    assert report["documents"] == 2 and report["failed"] == 0
+    assert report["docs_per_second"] > 0
+    assert lessons_without_ids(parser) == expected
+    # Группы из make_table не были сохранены файлами — их больше нет
+    assert "К103" not in parser.get_all_groups()
+    subject = dict(expected[0])["subject"]
+    assert parser.search_lessons(subject.split()[0])
+    assert parser.get_data_version() == data_version + 1
+    # Служебные таблицы не тронуты
+    assert subscriptions.get_chat_subscriptions(42) == ["К101"]
+    assert len(manifest.list_files()) == 2
+    assert not list(generations.generations_dir(schedule_db).glob("*.tmp"))
+
+
+def test_rebuild_keeps_ids_of_sent_buttons(schedule_db, tmp_path, monkeypatch):
+    from bot import file_manager, ingest, parser, rebuild
+
+    monkeypatch.setattr(file_manager, "SCHEDULE_FILES_DIR", tmp_path / "schedule_files")
+    ingest.init_ingest_db()
+
+    async def store():
+        for label, source in (("14 сентября", SAMPLE_DOCX), ("20 сентября", OTHER_DOCX)):
+            assert (await file_manager.save_schedule_file(source, label))[0]
+
+    asyncio.run(store())
+    for source in (SAMPLE_DOCX, OTHER_DOCX):
+        with parser.publish_schedule() as conn:
+            for table in rebuild.parse_document(str(source)):
+                parser.upsert_table(table, conn)
+
+    # id из кнопок g:<id>, d:<id> и t:<id>, отправленных до пересборки
+    conn = parser.connect_schedule()
+    lesson_id, group_id, schedule_id = conn.execute("""
+        SELECT l.id, g.id, s.id FROM lessons l
+        JOIN groups g ON g.id = l.group_id
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE l.teacher != '' ORDER BY l.id DESC LIMIT 1
+    """).fetchone()
+    (gone_group,) = conn.execute("SELECT MAX(g.id) FROM groups g WHERE g.code = 'К103'").fetchone()
+    conn.close()
+    group = parser.get_group_by_id(group_id)
+    schedule = parser.get_schedule_by_id(schedule_id)
+    teacher = parser.get_lesson_teacher(lesson_id)
+
+    rebuild.rebuild_database(workers=1)
+
+    assert parser.get_group_by_id(group_id) == group
+    assert parser.get_schedule_by_id(schedule_id) == schedule
+    assert parser.get_lesson_teacher(lesson_id) == teacher
+    # Строки, которых больше нет, не отдают свой id новым
+    assert parser.get_group_by_id(gone_group) is None
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Тестируем готовые сообщения расписания"""
+
+from bot.sample_tables import make_table
+
+
+def test_messages_materialized_on_ingest(schedule_db, monkeypatch):
+    from bot import parser, render, storage
+
+    storage.add_version_listener(render.materialize_rendered)
+    try:
+        storage.save_tables([make_table("24 сентября СРЕДА", ["К101"], shift=2)])
+
+        def no_db(*args, **kwargs):
+            raise AssertionError("запрос в БД при готовых сообщениях")
+
+        monkeypatch.setattr(parser.sqlite3, "connect", no_db)
+        text = render.get_group_text("К101")
+        assert "РАСПИСАНИЕ ГРУППЫ К101" in text
+        assert "24 сентября СРЕДА" in text
+        day = render.get_group_on_date_text("К101", "24 сентября")
+        assert day.startswith("📅 <b>24 сентября</b> | 🧩 <b>К101</b>")
+        assert render.get_group_on_date_text("К103", "23 сентября") is None
+    finally:
+        storage.remove_version_listener(render.materialize_rendered)
+
+
+def test_messages_built_off_the_event_loop(schedule_db):
+    import asyncio
+
+    from bot import render, storage
+
+    installed = []
+
+    async def scenario():
+        storage.add_version_listener(render.materialize_rendered)
+        render.add_rendered_listener(installed.append)
+        try:
+            storage.bump_schedule_version()
+            # Сборка ещё идёт в пуле потоков — ответы отрисовываются по запросу
+            assert render.current_rendered() is None
+            assert "РАСПИСАНИЕ ГРУППЫ К101" in render.get_group_text("К101")
+            # Версии, сменившиеся во время сборки, собираются один раз — последняя
+            storage.bump_schedule_version()
+            version = storage.bump_schedule_version()
+            await render.join_rendered()
+            return version
+        finally:
+            render.remove_rendered_listener(installed.append)
+            storage.remove_version_listener(render.materialize_rendered)
+
+    version = asyncio.run(scenario())
+    assert installed[-1].version == version
+    assert render.current_rendered() is installed[-1]
+    assert len(installed) <= 2
+
+
+def test_stale_version_falls_back_to_render(schedule_db):
+    from bot import render, storage
+
+    lessons = storage.get_lessons("К102", "22 сентября")
+    expected = render.render_group_on_date("К102", "22 сентября", lessons)
+
+    assert render.get_group_on_date_text("К102", "22 сентября") == expected
+    assert render.get_group_text("НЕТ") is None
+
+
+def test_format_time():
+    from bot.render import format_time, extract_pair_number
+
+    assert format_time("0830 – 1005") == "08:30 - 10:05"
+    assert format_time("") == "—"
+    assert extract_pair_number("3-4") == 2
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Тестируем автозагрузку расписания"""
+
+import asyncio
+from pathlib import Path
+
+SAMPLE_DOCX = Path(__file__).parent / "schedule_files" / "schedule_14_september.docx"
+
+
+def test_overlapping_runs_are_skipped():
+    from bot.scheduler import SchedulePoller
+
+    async def scenario():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def job():
+            started.set()
+            await release.wait()
+
+        poller = SchedulePoller(job, interval=60, jitter=10)
+        first = asyncio.create_task(poller.run_once())
+        await started.wait()
+        assert await poller.run_once() is False
+        release.set()
+        assert await first is True
+        return poller
+
+    poller = asyncio.run(scenario())
+    assert poller.runs == 1
+    assert poller.skipped == 1
+    assert all(50 <= poller.next_delay() <= 70 for _ in range(100))
+
+
+def test_prefetch_ingests_new_days(schedule_db, tmp_path, monkeypatch):
+    from bot import file_manager, ingest, scheduler, storage
+    from bot.parser_site import FetchResult
+
+    monkeypatch.setattr(ingest, "INGEST_TMP_DIR", tmp_path / "ingest_tmp")
+    monkeypatch.setattr(ingest, "PROGRESS_INTERVAL", 0.05)
+    monkeypatch.setattr(file_manager, "SCHEDULE_FILES_DIR", tmp_path / "schedule_files")
+    ingest.init_ingest_db()
+
+    async def fake_links(url):
+        return {}
+
+    monkeypatch.setattr(scheduler, "fetch_schedule_links", fake_links)
+
+    async def fake_fetch(url, day, links=None):
+        if day.toordinal() % 3 == 0:
+            raise LookupError("нет ссылки")
+        return FetchResult(url, SAMPLE_DOCX, modified=True)
+
+    monkeypatch.setattr(scheduler, "fetch_schedule_for_day", fake_fetch)
+    committed = []
+    monkeypatch.setattr(scheduler, "commit_download", committed.append)
+
+    async def scenario():
+        queue = ingest.IngestQueue(concurrency=1)
+        try:
+            return await scheduler.prefetch_and_ingest(queue, days=3)
+        finally:
+            await queue.shutdown()
+
+    # Один и тот же файл на два дня: второй день подключается к уже идущему заданию
+    assert asyncio.run(scenario()) == 2
+    assert ingest.get_job(1)["status"] == "done"
+    assert ingest.get_job(2) is None
+    # Валидаторы сохраняются для обоих дней: файл загружен в БД
+    assert len(committed) == 2
+    assert "15 сентября" in storage.list_dates()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Тестируем полнотекстовый поиск по расписанию"""
+
+import sqlite3
+
+from bot.sample_tables import make_table
+
+
+def test_search_by_subject_teacher_and_room(schedule_db):
+    from bot import storage
+
+    found = storage.search_lessons("физ")
+    assert {r["subject"] for r in found} == {"Физика"}
+    assert {(r["date"], r["group"]) for r in found} >= {("22 сентября", "К101"), ("23 сентября", "К101")}
+
+    by_teacher = storage.search_lessons("ИВАНОВ")
+    assert by_teacher and all(r["teacher"] == "Иванов И.И." for r in by_teacher)
+
+    assert {r["room"] for r in storage.search_lessons("301")} == {"301"}
+    assert storage.search_lessons("!!!") == []
+
+
+def test_index_follows_reingest(schedule_db):
+    from bot import storage
+
+    before = storage.search_lessons("Информатика")
+    assert ("22 сентября", "К102") in {(r["date"], r["group"]) for r in before}
+
+    # Перезагрузка дня заменяет занятия К102, информатики у неё больше нет
+    storage.save_tables([make_table("22 сентября ПОНЕДЕЛЬНИК", ["К102"])])
+    after = storage.search_lessons("Информатика")
+    assert ("22 сентября", "К102") not in {(r["date"], r["group"]) for r in after}
+
+
+def test_search_uses_index_not_scan(schedule_db):
+    from bot import parser
+
+    conn = parser.connect_schedule()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN "
+        "SELECT l.id FROM lessons_fts f JOIN lessons l ON l.id = f.rowid "
+        "JOIN groups g ON g.id = l.group_id JOIN schedules s ON s.id = g.schedule_id "
+        "WHERE lessons_fts MATCH ?", ('"физика"*',)
+    ).fetchall()
+    conn.close()
+    details = [row[3] for row in plan]
+    assert any("VIRTUAL TABLE INDEX" in d for d in details)
+    assert not any(d.startswith("SCAN") and "VIRTUAL" not in d for d in details)
+
+
+def test_existing_db_is_indexed_on_upgrade(tmp_path, monkeypatch):
+    from bot import parser
+
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE schedules (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT UNIQUE NOT NULL, weekday TEXT,
+                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE groups (id INTEGER PRIMARY KEY AUTOINCREMENT, code TEXT NOT NULL, schedule_id INTEGER);
+        CREATE TABLE lessons (id INTEGER PRIMARY KEY AUTOINCREMENT, group_id INTEGER, pair_number TEXT,
+                              time_slot TEXT, subject TEXT, teacher TEXT, room TEXT);
+        INSERT INTO schedules (date, weekday) VALUES ('1 сентября', 'ПОНЕДЕЛЬНИК');
+        INSERT INTO groups (code, schedule_id) VALUES ('К100', 1);
+        INSERT INTO lessons (group_id, pair_number, time_slot, subject, teacher, room)
+        VALUES (1, '1 пара', '08:30', 'Химия', 'Орлова О.О.', '12');
+    """)
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(parser, "DB_PATH", db_path)
+    parser.init_db()
+    assert [r["group"] for r in parser.search_lessons("химия")] == ["К100"]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Тестируем снимок модели чтения расписания"""
+
+import asyncio
+
+from bot.sample_tables import make_table
+
+
+def test_snapshot_serves_reads_without_db(schedule_db, tmp_path, monkeypatch):
+    from bot import keyboards, parser, render, snapshot, storage
+
+    path = tmp_path / "schedule.snapshot"
+    expected_lessons = storage.get_lessons("К102", "23 сентября")
+    expected_text = render.build_rendered(-1).by_group["К101"]
+    expected_schedules = parser.get_all_schedules()
+    assert snapshot.write_snapshot(path) == parser.get_data_version()
+
+    storage.bump_schedule_version()
+    storage.add_version_listener(render.materialize_rendered)
+    storage.add_version_listener(keyboards.materialize_keyboards)
+    try:
+        assert snapshot.load_snapshot(path)
+
+        def no_db(*args, **kwargs):
+            raise AssertionError("запрос в БД при загруженном снимке")
+
+        # Сама загрузка сверяет только счётчик данных; дальше БД не нужна
+        monkeypatch.setattr(parser.sqlite3, "connect", no_db)
+        assert storage.list_dates() == ["22 сентября", "23 сентября"]
+        assert storage.get_lessons("К102", "23 сентября") == expected_lessons
+        assert storage.list_schedules() == expected_schedules
+        assert render.get_group_text("К101") == expected_text
+        assert keyboards.current_keyboards() is not None
+        assert storage.list_groups_for_schedule(expected_schedules[0][0])
+    finally:
+        storage.remove_version_listener(render.materialize_rendered)
+        storage.remove_version_listener(keyboards.materialize_keyboards)
+
+
+def test_stale_snapshot_is_ignored_and_rewritten(schedule_db, tmp_path):
+    from bot import parser, snapshot, storage
+
+    path = tmp_path / "schedule.snapshot"
+    snapshot.write_snapshot(path)
+    storage.save_tables([make_table("24 сентября СРЕДА", ["К101"])])
+
+    version = storage.get_schedule_version()
+    assert not snapshot.load_snapshot(path)
+    assert storage.get_schedule_version() == version
+
+    writer = snapshot.SnapshotWriter(path)
+
+    async def scenario():
+        writer.on_version(version)
+        await writer.join()
+
+    asyncio.run(scenario())
+    assert snapshot.load_snapshot(path)
+    assert "24 сентября" in storage.list_dates()
+
+    # Другая версия формата — снимок не читается
+    raw = path.read_bytes()
+    path.write_bytes(raw[:len(snapshot.MAGIC)] + b"\x00\x63" + raw[len(snapshot.MAGIC) + 2:])
+    assert snapshot.read_snapshot(path, parser.get_data_version()) is None
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
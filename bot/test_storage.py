@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Тестируем кэш чтений расписания"""
+
+from bot.sample_tables import make_table
+
+
+def test_cached_reads_do_not_touch_db(schedule_db, monkeypatch):
+    from bot import parser, storage
+
+    assert storage.list_groups() == ["К101", "К102", "К103"]
+    assert storage.list_groups_for_date("23 сентября") == ["К101", "К102"]
+    lessons = storage.get_lessons("К101", "22 сентября")
+    assert [l["subject"] for l in lessons] == ["Математика", "Физика", "История"]
+
+    def no_db(*args, **kwargs):
+        raise AssertionError("запрос в БД при тёплом кэше")
+
+    monkeypatch.setattr(parser.sqlite3, "connect", no_db)
+    before = storage.get_cache_stats()["hits"]
+    assert storage.list_groups() == ["К101", "К102", "К103"]
+    assert storage.get_lessons("К101", "22 сентября") == lessons
+    assert storage.get_cache_stats()["hits"] == before + 2
+
+
+def test_ingest_bumps_version_and_invalidates(schedule_db):
+    from bot import storage
+
+    version = storage.get_schedule_version()
+    assert storage.list_dates() == ["22 сентября", "23 сентября"]
+
+    storage.save_tables([make_table("24 сентября СРЕДА", ["К104"])])
+
+    assert storage.get_schedule_version() == version + 1
+    assert storage.list_dates() == ["22 сентября", "23 сентября", "24 сентября"]
+    assert "К104" in storage.list_groups()
+
+
+def lesson_ids(date):
+    from bot import parser
+
+    conn = parser.connect_schedule()
+    rows = conn.execute("""
+        SELECT g.code, l.pair_number, l.id FROM lessons l
+        JOIN groups g ON g.id = l.group_id
+        JOIN schedules s ON s.id = g.schedule_id
+        WHERE s.date = ?
+    """, (date,)).fetchall()
+    conn.close()
+    return {(code, pair): lesson_id for code, pair, lesson_id in rows}
+
+
+def test_republish_writes_only_differences(schedule_db):
+    from bot import parser, storage
+
+    version = storage.get_schedule_version()
+    data_version = parser.get_data_version()
+    table = make_table("22 сентября ПОНЕДЕЛЬНИК", ["К101", "К102", "К103"])
+
+    # Та же таблица ещё раз — ни записей, ни новой версии
+    with parser.publish_schedule() as conn:
+        changes = parser.upsert_table(table, conn)
+    assert not changes.changed
+    assert changes.unchanged == 9
+    storage.save_tables([table])
+    assert storage.get_schedule_version() == version
+    assert parser.get_data_version() == data_version
+
+    ids_before = lesson_ids("22 сентября")
+    table[3][2] = "Химия\nпреп. Орлова О.О.\nауд. 404"
+    table[4] = table[4][:3]
+    with parser.publish_schedule() as conn:
+        changes = parser.upsert_table(table, conn)
+    assert changes.updated == [("К101", "2 пара")]
+    assert changes.deleted == [("К102", "3 пара")]
+    assert changes.counts()["unchanged"] == 7
+    assert parser.get_data_version() == data_version + 1
+
+    ids_after = lesson_ids("22 сентября")
+    assert ids_after[("К101", "2 пара")] == ids_before[("К101", "2 пара")]
+    assert ("К102", "3 пара") not in ids_after
+    assert parser.search_lessons("Химия")
+
+
+def test_change_from_other_process_invalidates_cache(schedule_db):
+    import asyncio
+
+    from bot import parser, storage
+
+    assert "24 сентября" not in storage.list_dates()
+    # Своя загрузка уже подняла версию — сверка её не повторяет
+    storage.save_tables([make_table("24 сентября СРЕДА", ["К101"])])
+    assert not asyncio.run(storage.check_data_version())
+    assert "24 сентября" in storage.list_dates()
+
+    # Другой процесс публикует поколение, не трогая кэш этого
+    with parser.publish_schedule() as conn:
+        parser.upsert_table(make_table("25 сентября ЧЕТВЕРГ", ["К102"]), conn)
+    version = storage.get_schedule_version()
+    assert "25 сентября" not in storage.list_dates()
+
+    assert asyncio.run(storage.check_data_version())
+    assert storage.get_schedule_version() == version + 1
+    assert "25 сентября" in storage.list_dates()
+    assert not asyncio.run(storage.check_data_version())
+
+
+def test_lru_eviction():
+    from bot.storage import ScheduleCache
+
+    cache = ScheduleCache(max_entries=2)
+    cache.get_or_load("a", lambda: 1)
+    cache.get_or_load("b", lambda: 2)
+    cache.get_or_load("a", lambda: 0)
+    cache.get_or_load("c", lambda: 3)
+
+    assert cache.get_or_load("a", lambda: 0) == 1
+    assert cache.get_or_load("b", lambda: 20) == 20
+    stats = cache.stats()
+    assert stats["evictions"] == 2
+    assert stats["entries"] == 2
+
+
+def test_concurrent_misses_share_one_load():
+    import threading
+    import time
+    from bot.storage import ScheduleCache
+
+    cache = ScheduleCache()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return ["К101"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(("groups",), slow_loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [["К101"]] * 8
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 7
+
+    # После смены версии ждать старую загрузку нельзя
+    gate = threading.Event()
+    thread = threading.Thread(target=lambda: cache.get_or_load("k", lambda: gate.wait() and "old"))
+    thread.start()
+    time.sleep(0.05)
+    cache.bump_version()
+    assert cache.get_or_load("k", lambda: "new") == "new"
+    gate.set()
+    thread.join()
+    assert cache.get_or_load("k", lambda: "again") == "new"
+
+
+def test_handler_reads_share_one_executor_call():
+    import asyncio
+    import threading
+    import time
+
+    from bot import storage
+
+    calls = []
+    loop_thread = []
+
+    def slow_query(group):
+        calls.append(threading.current_thread())
+        time.sleep(0.05)
+        return [group]
+
+    def read(group):
+        return storage.schedule_cache.get_or_load(("test_read", group), lambda: slow_query(group))
+
+    async def scenario():
+        loop_thread.append(threading.current_thread())
+        same = await asyncio.gather(*[storage.read_schedule(read, "К101") for _ in range(5)])
+        other = await storage.read_schedule(read, "К102")
+        # Тёплый кэш отдаётся сразу, без пула потоков
+        cached = await storage.read_schedule(read, "К101")
+        return same, other, cached
+
+    same, other, cached = asyncio.run(scenario())
+    assert same == [["К101"]] * 5
+    assert other == ["К102"]
+    assert cached == ["К101"]
+    assert len(calls) == 2
+    # Запросы шли в пуле потоков, event loop был свободен
+    assert loop_thread[0] not in calls
+
+
+def test_event_loop_never_waits_for_other_thread_load():
+    import asyncio
+    import threading
+    import time
+    from bot.storage import ScheduleCache
+
+    cache = ScheduleCache()
+    gate = threading.Event()
+    thread = threading.Thread(target=lambda: cache.get_or_load("k", lambda: gate.wait() and "thread"))
+    thread.start()
+    time.sleep(0.05)
+
+    async def handler():
+        return cache.get_or_load("k", lambda: "own")
+
+    # Старый код ждал бы здесь, пока таймер не отпустит загрузку другого потока
+    release = threading.Timer(1, gate.set)
+    release.start()
+    try:
+        # Загрузку держит другой поток: хендлер читает сам, а не ждёт его
+        assert asyncio.run(handler()) == "own"
+        assert not gate.is_set()
+    finally:
+        release.cancel()
+        gate.set()
+        thread.join()
+    assert cache.get_or_load("k", lambda: "again") == "thread"
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Тестируем ограничение частоты запросов пользователя"""
+
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+
+def test_token_bucket_refills():
+    from bot.throttle import TokenBuckets
+
+    buckets = TokenBuckets(rate=1.0, burst=3, max_buckets=2)
+    assert [buckets.allow("a", now=0) for _ in range(4)] == [True, True, True, False]
+    assert not buckets.allow("a", now=0.5)
+    assert buckets.allow("a", now=1.6)
+    assert buckets.allow("b", now=1.6)
+
+    # Наполнившиеся корзины выбрасываются при чистке
+    assert buckets.allow("c", now=10)
+    assert len(buckets) == 1
+
+
+def test_spammed_callbacks_are_throttled(schedule_db, monkeypatch):
+    from bot import callbacks, storage, throttle
+    from bot.bench_handlers import StubSession
+    from bot.main import build_dispatcher
+
+    class RecordingSession(StubSession):
+        def __init__(self):
+            super().__init__()
+            self.answers = []
+
+        async def make_request(self, bot, method, timeout=None):
+            if isinstance(method, AnswerCallbackQuery):
+                self.answers.append(method.text)
+            return await super().make_request(bot, method, timeout)
+
+    monkeypatch.setattr(throttle, "is_admin", lambda user_id: user_id == 1)
+    schedule_id = storage.list_schedules()[0][0]
+    chat = Chat(id=7001, type="private")
+
+    def tap(update_id, user_id):
+        user = User(id=user_id, is_bot=False, first_name="Студент")
+        message = Message(message_id=1, date=datetime.now(), chat=chat, text="Выберите дату:")
+        return Update(update_id=update_id, callback_query=CallbackQuery(
+            id=str(update_id), from_user=user, chat_instance="t",
+            data=callbacks.pack(callbacks.DATE, schedule_id), message=message))
+
+    session = RecordingSession()
+    before = throttle.THROTTLED.value("callback")
+
+    async def scenario():
+        dp = build_dispatcher()
+        bot = Bot(token="42:TEST", session=session)
+        for i in range(throttle.THROTTLE_BURST + 5):
+            await dp.feed_update(bot, tap(i, 7001))
+        for i in range(throttle.THROTTLE_BURST + 5):
+            await dp.feed_update(bot, tap(100 + i, 1))
+
+    asyncio.run(scenario())
+    assert throttle.THROTTLED.value("callback") == before + 5
+    assert session.answers.count(throttle.THROTTLED_TEXT) == 5
+    assert session.calls["EditMessageText"] == 2 * throttle.THROTTLE_BURST + 5
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
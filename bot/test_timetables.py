@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Тестируем расписание преподавателей и занятость аудиторий"""
+
+from bot.sample_tables import make_table
+
+
+def test_normalization():
+    from bot.parser import normalize_teacher, normalize_room
+
+    assert normalize_teacher("  Иванов  И. И. ") == "иванов и.и."
+    assert normalize_teacher("Семёнова А.А.") == "семенова а.а."
+    assert normalize_room("Ауд. 105 а") == "105а"
+    assert normalize_room(None) == ""
+
+
+def test_teacher_and_room_views(schedule_db):
+    from bot import render, storage
+
+    assert [name for _, name in storage.find_teacher_ids("ив")] == ["Иванов И.И."]
+    assert [name for _, name in storage.find_teacher_ids("ИВАНОВ И. И.")] == ["Иванов И.И."]
+    assert storage.find_teacher_ids("щ") == []
+
+    lessons = storage.get_teacher_schedule("иванов и.и.")
+    assert {(l["date"], l["group"]) for l in lessons} == {
+        ("22 сентября", "К101"), ("22 сентября", "К103"), ("23 сентября", "К102"),
+    }
+    text = render.render_teacher_schedule("Иванов И.И.", lessons)
+    assert "📅 <b>23 сентября ВТОРНИК</b>" in text
+
+    room = storage.get_room_schedule("ауд. 202")
+    assert room and all(l["room"] == "202" for l in room)
+
+
+def test_lookups_use_indexes(schedule_db):
+    from bot import parser
+
+    conn = parser.connect_schedule()
+    for column in ("teacher_norm", "room_norm"):
+        plan = conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT l.id FROM lessons l JOIN groups g ON g.id = l.group_id "
+            f"JOIN schedules s ON s.id = g.schedule_id WHERE l.{column} = ?", ("x",)
+        ).fetchall()
+        details = " | ".join(row[3] for row in plan)
+        assert f"idx_lessons_{column}" in details, details
+        assert "SCAN l" not in details
+    conn.close()
+
+
+def test_split_message():
+    from bot.render import split_message
+
+    text = "\n".join(f"строка {i}" for i in range(1000))
+    parts = split_message(text, limit=500)
+    assert all(len(p) <= 500 for p in parts)
+    assert "\n".join(parts) == text
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Тестируем приём обновлений по webhook на записанных обновлениях"""
+
+import asyncio
+import json
+from datetime import datetime
+from pathlib import Path
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, EditMessageText
+from aiogram.types import Chat, Message
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+
+UPDATES_PATH = Path(__file__).parent / "fixtures" / "updates.json"
+
+
+class RecordingSession(BaseSession):
+    """Сессия Bot API, которая запоминает вызванные методы"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(message_id=len(self.calls), date=datetime.now(),
+                           chat=Chat(id=method.chat_id or 0, type="private"), text=method.text)
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+async def post_all(server, updates, headers=None):
+    url = str(server.make_url("/webhook"))
+    async with ClientSession() as session:
+        async def post(update):
+            async with session.post(url, json=update, headers=headers) as resp:
+                return resp.status
+        return await asyncio.gather(*(post(u) for u in updates))
+
+
+def test_recorded_updates_reach_handlers(schedule_db):
+    from bot.main import build_dispatcher
+    from bot.webhook import WebhookServer
+
+    updates = json.loads(UPDATES_PATH.read_text(encoding="utf-8"))
+    session = RecordingSession()
+    bot = Bot(token="42:TEST", session=session)
+    webhook = WebhookServer(build_dispatcher(), bot, path="/webhook", secret="s3cret")
+
+    async def scenario():
+        server = TestServer(webhook.make_app())
+        await server.start_server()
+        try:
+            rejected = await post_all(server, updates[:1])
+            statuses = await post_all(server, updates, headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+        finally:
+            await server.close()
+        return rejected, statuses
+
+    rejected, statuses = asyncio.run(scenario())
+    assert rejected == [401]
+    assert statuses == [200] * len(updates)
+    assert webhook.metrics["handled"] == len(updates)
+    assert webhook.in_flight == 0
+
+    texts = [call.text for call in session.calls if isinstance(call, (SendMessage, EditMessageText))]
+    assert any(text.startswith("Привет! Я бот расписания") for text in texts)
+    assert texts.count("Выберите дату:") == 2
+    assert any("Математика" in text for text in texts)
+
+
+def test_concurrency_is_bounded_and_shutdown_drains():
+    from bot.webhook import WebhookServer
+
+    state = {"active": 0, "peak": 0, "done": 0}
+    dp = Dispatcher()
+
+    @dp.message()
+    async def slow(message):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.05)
+        state["active"] -= 1
+        state["done"] += 1
+
+    template = json.loads(UPDATES_PATH.read_text(encoding="utf-8"))[1]
+    updates = [dict(template, update_id=200000 + i) for i in range(30)]
+    webhook = WebhookServer(dp, Bot(token="42:TEST", session=RecordingSession()), path="/webhook",
+                            secret="", concurrency=4)
+
+    async def scenario():
+        server = TestServer(webhook.make_app())
+        await server.start_server()
+        statuses = await post_all(server, updates)
+        # Остановка сразу после ответов: начатые обработчики должны доработать
+        await server.close()
+        return statuses
+
+    statuses = asyncio.run(scenario())
+    assert statuses == [200] * 30
+    assert state["peak"] == 4
+    assert state["done"] == 30
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
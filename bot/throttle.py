@@ -0,0 +1,90 @@
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+from aiogram.types import CallbackQuery
+
+from .admin_auth import is_admin
+from .config import load_int_setting
+from .metrics import REGISTRY
+
+# Запросов в минуту на пользователя в среднем и сколько можно сделать подряд; 0 — без ограничения
+THROTTLE_PER_MINUTE = load_int_setting("THROTTLE_PER_MINUTE", 60)
+THROTTLE_BURST = load_int_setting("THROTTLE_BURST", 10)
+
+# Сколько корзин держать в памяти до чистки простаивающих
+MAX_BUCKETS = 10_000
+
+THROTTLED_TEXT = "⏳ Слишком часто, подождите пару секунд"
+
+THROTTLED = REGISTRY.counter(
+    "bot_throttled_total", "Обновления, отброшенные ограничением частоты", ["event"])
+
+
+class TokenBuckets:
+    """Корзины токенов по ключу (пользователю).
+
+    Корзина пополняется со скоростью rate токенов в секунду до burst;
+    каждый запрос забирает токен, без токена запрос отклоняется.
+    """
+
+    def __init__(self, rate: float, burst: int, max_buckets: int = MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        # ключ → (токены, время последнего пополнения)
+        self._buckets: Dict[Hashable, Tuple[float, float]] = {}
+
+    def allow(self, key: Hashable, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_buckets:
+            self._prune(now)
+        return allowed
+
+    def _prune(self, now: float) -> None:
+        # Корзина, которая успела наполниться, ничем не отличается от новой
+        refill = self.burst / self.rate
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+            if now - updated < refill
+        }
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class ThrottlingMiddleware:
+    """Внешний middleware aiogram: ограничение частоты обновлений от одного пользователя.
+
+    Лишние сообщения молча отбрасываются, на лишние нажатия кнопок приходит
+    короткое уведомление (иначе кнопка «крутится»). Администраторов не ограничивает.
+    """
+
+    def __init__(self, per_minute: int = THROTTLE_PER_MINUTE, burst: int = THROTTLE_BURST):
+        self.buckets = TokenBuckets(per_minute / 60, max(1, burst))
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None or is_admin(user.id) or self.buckets.allow(user.id):
+            return await handler(event, data)
+        if isinstance(event, CallbackQuery):
+            THROTTLED.inc(1, "callback")
+            await event.answer(THROTTLED_TEXT)
+        else:
+            THROTTLED.inc(1, "message")
+        return None
+
+
+def install_middleware(dp, per_minute: int = THROTTLE_PER_MINUTE,
+                       burst: int = THROTTLE_BURST) -> Optional[ThrottlingMiddleware]:
+    if per_minute <= 0:
+        return None
+    middleware = ThrottlingMiddleware(per_minute, burst)
+    dp.message.outer_middleware(middleware)
+    dp.callback_query.outer_middleware(middleware)
+    return middleware
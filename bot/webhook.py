@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import secrets
+import signal
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from .config import load_setting, load_int_setting
+
+# Публичный адрес бота (https://example.org); пустой — работаем через polling
+WEBHOOK_URL = load_setting("WEBHOOK_URL", "")
+WEBHOOK_PATH = load_setting("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = load_setting("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = load_int_setting("WEBHOOK_PORT", 8080)
+WEBHOOK_SECRET = load_setting("WEBHOOK_SECRET", "")
+
+# Сколько обновлений обрабатывается одновременно
+WEBHOOK_CONCURRENCY = load_int_setting("WEBHOOK_CONCURRENCY", 64)
+
+# Сколько секунд ждать незавершённые обработчики при остановке
+WEBHOOK_SHUTDOWN_TIMEOUT = load_int_setting("WEBHOOK_SHUTDOWN_TIMEOUT", 30)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Приём обновлений Telegram по webhook с ограничением параллельной обработки.
+
+    Обновление подтверждается сразу, а обрабатывается в фоне. Когда заняты
+    все слоты, запрос ждёт свободного слота — Telegram притормаживает
+    отправку, вместо того чтобы бот копил необработанные задачи.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                 concurrency: int = WEBHOOK_CONCURRENCY, shutdown_timeout: float = WEBHOOK_SHUTDOWN_TIMEOUT):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.concurrency = max(1, concurrency)
+        self.shutdown_timeout = shutdown_timeout
+        self.metrics: Dict[str, int] = defaultdict(int)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            self.metrics["rejected"] += 1
+            return web.Response(status=401)
+        if self._closing:
+            # Telegram повторит доставку после перезапуска
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            self.metrics["invalid"] += 1
+            logging.warning(f"Webhook: некорректное обновление: {e}")
+            return web.Response(status=400)
+
+        await self._slots.acquire()
+        self.metrics["received"] += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.metrics["handled"] += 1
+        except Exception as e:
+            self.metrics["failed"] += 1
+            logging.error(f"Webhook: ошибка обработки обновления {update.update_id}: {e}")
+        finally:
+            self._slots.release()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self) -> None:
+        """Дождаться обработчиков, запущенных до остановки"""
+        self._closing = True
+        if not self._tasks:
+            return
+        logging.info(f"Webhook: ожидаем завершения обработчиков: {len(self._tasks)}")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=self.shutdown_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.warning(f"Webhook: прервано обработчиков по таймауту: {len(pending)}")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        await self.drain()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, base_url: str = WEBHOOK_URL,
+                      host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                      stop_event: Optional[asyncio.Event] = None) -> None:
+    """Зарегистрировать webhook и обслуживать его до остановки"""
+    server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Webhook слушает {host}:{port}{server.path}")
+
+    try:
+        await bot.set_webhook(
+            url=base_url.rstrip("/") + server.path,
+            secret_token=server.secret or None,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(100, server.concurrency),
+        )
+        await dp.emit_startup(bot=bot)
+        if stop_event is None:
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop_event.set)
+                except (NotImplementedError, RuntimeError):
+                    pass
+        await stop_event.wait()
+        logging.info("Webhook: остановка...")
+    finally:
+        # cleanup вызывает on_shutdown: новые обновления отклоняются, текущие дорабатывают
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)